@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import BuildShare
 
-# Register your models here.
+
+class BuildShareAdmin(admin.ModelAdmin):
+    list_display = ['user', 'weight', 'max_concurrent_builds']
+
+    class Meta:
+        None
+
+
+admin.site.register(BuildShare, BuildShareAdmin)
@@ -0,0 +1,59 @@
+import time
+from threading import Thread
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from lib.Benchmark import BENCHMARK_USER, RunInTestDatabase
+from lib.Logger import Logger
+from lib.LogSink import LogSink
+from lib.Fixtures import CreateUser, CreateBuilds
+from builder.models import Build, Log
+
+
+class Command(BaseCommand):
+    help = 'Measure writing the log lines of concurrent builds. A separate test database is used.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--builds', type=int, default=30, help='number of concurrent builds')
+        parser.add_argument('--lines', type=int, default=2000, help='number of log lines of each build')
+
+    def handle(self, *args, **options):
+        # the concurrent threads need committed data
+        RunInTestDatabase(self.benchmark_log, options)
+
+    def benchmark_log(self, options):
+        # concurrent builds with chatty output, each in its own thread like the builds of a scheduler
+        user = CreateUser(BENCHMARK_USER)
+        CreateBuilds(user, options['builds'])
+        builds = list(Build.objects.filter(user=user))
+        quiet = settings.MAX_DEBUG_LEVEL + 1
+
+        def rowbyrow(build):
+            try:
+                for i in range(options['lines']):
+                    Log(build=build, line=f"line {i}\n", created=timezone.now()).save()
+            finally:
+                connection.close()
+
+        def batched(build):
+            logger = Logger(build)
+            for i in range(options['lines']):
+                logger.print(f"line {i}", quiet)
+
+        for (name, target) in [('one insert per line', rowbyrow), ('batched by the log sink', batched)]:
+            Log.objects.all().delete()
+            threads = [Thread(target=target, args=(build,)) for build in builds]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            produced = time.time() - start
+            LogSink.Get().Flush()
+            stored = time.time() - start
+            print(f"{name}: {options['builds']} builds wrote {options['lines']} lines each, " +
+                f"the builds took {produced:.3f} seconds, all lines stored after {stored:.3f} seconds, " +
+                f"{Log.objects.count()} lines in the database")
@@ -0,0 +1,146 @@
+import heapq
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib.Benchmark import BENCHMARK_USER, Rollback, BenchmarkLightBuildServer, RunRolledBack
+from lib.DependancyGraph import DependancyGraph
+from lib.SchedulingPolicy import GetSchedulingPolicy
+from lib.Simulation import Simulation
+from lib.Fixtures import CreateUser, CreateMachines, CreateBuilds, CreateProject, CreateCriticalPathWorkload
+from builder.models import Build
+from machines.models import Machine
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Measure the performance of the scheduler. All changes to the database are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=['dispatch', 'policy', 'enqueue', 'simulate'])
+        parser.add_argument('--builds', type=int, default=30, help='number of waiting builds')
+        parser.add_argument('--machines', type=int, default=10, help='number of free machines')
+        parser.add_argument('--slots', type=int, default=1, help='number of slots per machine')
+        parser.add_argument('--packages', type=int, default=100, help='number of packages of the project')
+        parser.add_argument('--targets', type=int, default=5, help='number of build targets of each package')
+        parser.add_argument('--branches', type=int, default=2, help='number of branches of each package')
+        parser.add_argument('--recorded', action='store_true', help='use the builds and machines of the database instead of a generated project')
+
+    def handle(self, *args, **options):
+        RunRolledBack(getattr(self, 'benchmark_' + options['benchmark']), options)
+
+    def benchmark_dispatch(self, options):
+        Machine.objects.all().update(enabled=False)
+        CreateMachines(options['machines'], options['slots'])
+        CreateBuilds(CreateUser(BENCHMARK_USER), options['builds'])
+
+        LBS = BenchmarkLightBuildServer()
+        start = time.time()
+        LBS.ProcessBuildQueue()
+        duration = time.time() - start
+
+        dispatched = Build.objects.filter(status='BUILDING').filter(user__username=BENCHMARK_USER).count()
+        print(f"dispatched {dispatched} of {options['builds']} waiting builds to {options['machines']} free machines " +
+            f"with {options['slots']} slots in {duration:.3f} seconds")
+
+
+    def simulate(self, order, durations, machines):
+        # list scheduling: whenever a machine is free, start the first build in the order
+        # whose required packages are not building at the moment, like CanFindDependanciesBuilding
+        defaultDuration = sum(durations.values()) / len(durations) if durations else 1
+        graphs = {}
+        for build in order:
+            if (build.user_id, build.project) not in graphs:
+                project = Project.objects.filter(user_id=build.user_id).filter(name=build.project).first()
+                graphs[(build.user_id, build.project)] = DependancyGraph.Get(project) if project else None
+        now = 0
+        running = []
+        waiting = list(order)
+        while waiting or running:
+            buildingpackages = set((b.user_id, b.project, b.package) for (end, id, b) in running)
+            for build in list(waiting):
+                if len(running) >= machines:
+                    break
+                graph = graphs[(build.user_id, build.project)]
+                required = graph.GetRequiredPackages(build.package) if graph else set()
+                if any((build.user_id, build.project, p) in buildingpackages for p in required):
+                    continue
+                waiting.remove(build)
+                duration = durations.get((build.user_id, build.project, build.package), defaultDuration)
+                heapq.heappush(running, (now + duration, build.id, build))
+                buildingpackages.add((build.user_id, build.project, build.package))
+            now, id, build = heapq.heappop(running)
+        return now
+
+
+    def benchmark_policy(self, options):
+        if not options['recorded']:
+            Build.objects.filter(status='WAITING').update(status='CANCELLED')
+            CreateCriticalPathWorkload(CreateUser(BENCHMARK_USER), options['builds'])
+
+        LBS = BenchmarkLightBuildServer()
+        builds = list(Build.objects.filter(status='WAITING'))
+        durations = LBS.GetAverageBuildDurations(builds)
+        for name in ['fifo', 'criticalpath']:
+            start = time.time()
+            order = GetSchedulingPolicy(name, LBS).Sort(builds)
+            duration = time.time() - start
+            makespan = self.simulate(order, durations, options['machines'])
+            print(f"{name}: sorted {len(builds)} waiting builds in {duration:.3f} seconds, " +
+                f"all builds done after {makespan/60:.1f} minutes on {options['machines']} machines")
+
+
+    def benchmark_enqueue(self, options):
+        project = CreateProject(CreateUser(BENCHMARK_USER), 'benchmark',
+            packagenames=[f"package{i}" for i in range(options['packages'])],
+            buildtargets=[f"fedora/{30+i}/x86_64" for i in range(options['targets'])],
+            branches=[f"branch{i}" for i in range(options['branches'])])
+
+        LBS = BenchmarkLightBuildServer()
+        start = time.time()
+        builds = LBS.EnqueueBuildMatrix(project)
+        duration = time.time() - start
+        print(f"added {len(builds)} builds for {options['packages']} packages x {options['branches']} branches x " +
+            f"{options['targets']} build targets in {duration:.3f} seconds")
+
+        start = time.time()
+        builds = LBS.EnqueueBuildMatrix(project)
+        duration = time.time() - start
+        print(f"added {len(builds)} builds again, all were already in the queue, in {duration:.3f} seconds")
+
+
+    def benchmark_simulate(self, options):
+        Simulation.PrepareDatabase()
+        if options['recorded']:
+            # replay the last finished builds on the configured machines
+            workload = Simulation.RecordedWorkload(options['builds'])
+        else:
+            Machine.objects.all().update(enabled=False)
+            CreateMachines(options['machines'], options['slots'])
+            CreateCriticalPathWorkload(CreateUser(BENCHMARK_USER), options['builds'])
+            builds = list(Build.objects.filter(status='WAITING'))
+            durations = BenchmarkLightBuildServer().GetAverageBuildDurations(builds)
+            Build.objects.filter(status='WAITING').delete()
+            workload = []
+            for build in builds:
+                build.pk = None
+                workload.append((0, build, durations[(build.user_id, build.project, build.package)]))
+
+        for name in ['fifo', 'criticalpath']:
+            try:
+                with transaction.atomic():
+                    start = time.time()
+                    stats = Simulation(name).Run(workload)
+                    duration = time.time() - start
+                    raise Rollback()
+            except Rollback:
+                pass
+            print(f"{name}: simulated {stats['builds']} builds in {duration:.3f} seconds, " +
+                f"all builds done after {stats['makespan']/60:.1f} minutes, " +
+                f"waiting time p50 {stats['wait_p50']/60:.1f} p90 {stats['wait_p90']/60:.1f} p99 {stats['wait_p99']/60:.1f} minutes, " +
+                f"utilization {stats['utilization']*100:.0f}%")
+            if stats['unstarted']:
+                print(f"{name}: {stats['unstarted']} builds could not be started on any machine")
+            for host, utilization in sorted(stats['machines'].items()):
+                print(f"    {host}: {utilization*100:.0f}%")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from lib.LightBuildServer import LightBuildServer
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Add the builds of a project for several branches and build targets to the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user')
+        parser.add_argument('project')
+        parser.add_argument('--package', action='append', help='only this package, can be repeated')
+        parser.add_argument('--branch', action='append', help='only this branch, can be repeated')
+        parser.add_argument('--target', action='append', help='only this build target, eg. fedora/40/x86_64, can be repeated')
+        parser.add_argument('--dirty', action='store_true', help='only packages that need to be rebuilt')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(user__username=options['user']).filter(name=options['project']).first()
+        if project is None:
+            raise CommandError(f"cannot find project {options['user']}::{options['project']}")
+
+        LBS = LightBuildServer()
+        builds = LBS.EnqueueBuildMatrix(project, options['package'], options['branch'], options['target'], options['dirty'])
+        for build in builds:
+            print(f"added {build.package} {build.branchname} {build.distro}/{build.release}/{build.arch}")
+        print(f"added {len(builds)} builds to the queue")
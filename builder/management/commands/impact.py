@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from lib.LightBuildServer import LightBuildServer
+from projects.models import Project, Package
+
+
+class Command(BaseCommand):
+    help = 'Show the packages depending on a package, and the builds that a change of the package would need'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user')
+        parser.add_argument('project')
+        parser.add_argument('package')
+        parser.add_argument('--branch', action='append', help='only this branch, can be repeated')
+        parser.add_argument('--target', action='append', help='only this build target, eg. fedora/40/x86_64, can be repeated')
+        parser.add_argument('--builds', action='store_true', help='list each build')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(user__username=options['user']).filter(name=options['project']).first()
+        if project is None:
+            raise CommandError(f"cannot find project {options['user']}::{options['project']}")
+        if not Package.objects.filter(project=project, name=options['package']).exists():
+            raise CommandError(f"cannot find package {options['package']}")
+
+        LBS = LightBuildServer()
+        impact = LBS.GetImpact(project, options['package'], options['branch'], options['target'])
+        print(f"{len(impact['dependants'])} packages depend on {options['package']}: {', '.join(impact['dependants'])}")
+        if options['builds']:
+            for build in impact['builds']:
+                print(f"{build['package']} {build['branch']} {build['distro']}/{build['release']}/{build['arch']}" +
+                    (" (up to date now)" if build['clean'] else ""))
+        print(f"{len(impact['builds'])} builds, estimated build time {impact['estimated_seconds'] / 3600:.1f} hours")
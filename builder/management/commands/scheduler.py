@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from lib.Scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the builds, waiting for new builds and released machines'
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(settings.SCHEDULER_POLL_INTERVAL)
+        scheduler.Run()
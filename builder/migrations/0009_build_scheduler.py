@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0008_alter_log_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='scheduler',
+            field=models.CharField(default=None, max_length=250, null=True),
+        ),
+    ]
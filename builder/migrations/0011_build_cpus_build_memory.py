@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0010_build_created_buildshare'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='cpus',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='build',
+            name='memory',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:17
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_heartbeat(apps, schema_editor):
+    # running builds start with the time they were started
+    Build = apps.get_model('builder', 'Build')
+    Build.objects.filter(status='BUILDING').update(heartbeat=F('started'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0011_build_cpus_build_memory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='heartbeat',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['status', 'hanging', 'heartbeat'], name='lbs_build_heartbeat_idx'),
+        ),
+        migrations.RunPython(set_heartbeat, migrations.RunPython.noop),
+    ]
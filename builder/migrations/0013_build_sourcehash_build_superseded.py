@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0012_build_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='sourcehash',
+            field=models.CharField(default=None, max_length=250, null=True),
+        ),
+        migrations.AddField(
+            model_name='build',
+            name='superseded',
+            field=models.BooleanField(default=False),
+        ),
+    ]
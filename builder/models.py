@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 class Build(models.Model):
     number = models.IntegerField(default=-1)
@@ -22,14 +24,43 @@ class Build(models.Model):
     designated_build_machine = models.CharField(max_length=250, default=None, null=True)
     avoidlxc = models.BooleanField(default = False)
     avoiddocker = models.BooleanField(default = False)
+    # the resources that are reserved on the build machine
+    cpus = models.PositiveIntegerField(default = 0)
+    memory = models.PositiveIntegerField(default = 0)
     dependsOnOtherProjects = models.TextField(default=None, null=True)
+    # when the build has been added to the queue
+    created = models.DateTimeField(default=timezone.now)
     started = models.DateTimeField(default=None, null=True)
     finished = models.DateTimeField(default=None, null=True)
     hanging = models.BooleanField(default=False)
+    # updated by the build job whenever it writes output, to detect hanging builds
+    heartbeat = models.DateTimeField(default=None, null=True)
     buildsuccess = models.CharField(max_length=20,default=None, null=True)
+    # the hash of the package sources that are being built
+    sourcehash = models.CharField(max_length=250, default=None, null=True)
+    # the build has been cancelled because newer sources of the package have arrived
+    superseded = models.BooleanField(default=False)
+    # the scheduler process (hostname:pid) that is running the build thread
+    scheduler = models.CharField(max_length=250, default=None, null=True)
 
     class Meta:
         db_table = "lbs_build"
+        indexes = [
+            models.Index(fields=["status", "hanging", "heartbeat"], name="lbs_build_heartbeat_idx"),
+        ]
+
+class BuildShare(models.Model):
+    # the share of the build machines for a user, compared to the other users with waiting builds
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField(default = 1, validators=[MinValueValidator(1)])
+    # 0 means no limit
+    max_concurrent_builds = models.PositiveIntegerField(default = 0)
+
+    def __str__(self):
+        return self.user.username
+
+    class Meta:
+        db_table = "lbs_build_share"
 
 class Log(models.Model):
     build = models.ForeignKey(Build, on_delete=models.CASCADE)
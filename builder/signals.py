@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from builder.models import Build
+from machines.models import Slot
+from lib.Scheduler import NotifyScheduler
+
+
+@receiver(post_save, sender=Build)
+def build_saved(sender, instance, created, **kwargs):
+    # a new build has been added to the queue, or a build has finished
+    if created or instance.status in ('FINISHED', 'CANCELLED'):
+        NotifyScheduler()
+
+
+@receiver(post_save, sender=Slot)
+def slot_saved(sender, instance, created, **kwargs):
+    # a slot has been released, or a machine has been added
+    if instance.status == 'AVAILABLE':
+        NotifyScheduler()
@@ -1,3 +1,423 @@
-from django.test import TestCase
+import hmac
+import json
+import hashlib
+import tempfile
+from threading import Thread, Event
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from lib.LightBuildServer import LightBuildServer
+from lib.SchedulingPolicy import CriticalPathPolicy
+from lib.Fixtures import CreateUser, CreateMachines, CreateBuilds, CreateProject
+from builder import views
+from lib.FairShare import GetFairnessStatistics
+from lib.LogSink import LogSink
+from builder.models import Build, BuildShare, Log
+from machines.models import Slot
+from projects.models import Project, Package, PackageSrcHash, PackageBuildStatus
+
+
+class ClaimingLightBuildServer(LightBuildServer):
+    # do not connect to the machines, just claim them
+    def StartBuild(self, build):
+        pass
+
+
+class FailingLightBuildServer(ClaimingLightBuildServer):
+    # fails in the middle of the claim, after the slot has been taken
+    def GetSchedulerName(self):
+        raise Exception("cannot claim the build")
+
+
+class ClaimTest(TestCase):
+
+    def setUp(self):
+        self.user = CreateUser('test')
+        CreateMachines(1, prefix='test')
+        CreateBuilds(self.user, 1)
+        self.build = Build.objects.get()
+
+    def test_claim(self):
+        self.assertTrue(ClaimingLightBuildServer().attemptToFindBuildMachine(self.build))
+        slot = Slot.objects.get()
+        self.assertEqual(slot.status, 'BUILDING')
+        self.assertEqual(slot.build_id, self.build.id)
+        self.assertEqual(Build.objects.get().status, 'BUILDING')
+
+    def test_build_claimed_by_another_scheduler(self):
+        Build.objects.update(status='BUILDING')
+        self.assertFalse(ClaimingLightBuildServer().attemptToFindBuildMachine(self.build))
+        self.assertEqual(Slot.objects.get().status, 'AVAILABLE')
+
+    def test_failing_claim_gives_back_the_slot(self):
+        with self.assertRaises(Exception):
+            FailingLightBuildServer().attemptToFindBuildMachine(self.build)
+        self.assertEqual(Slot.objects.get().status, 'AVAILABLE')
+        self.assertEqual(Build.objects.get().status, 'WAITING')
+
+
+class FairShareTest(TestCase):
+
+    def setUp(self):
+        self.alice = CreateUser('alice')
+        self.bob = CreateUser('bob')
+        CreateBuilds(self.alice, 6)
+        CreateBuilds(self.bob, 6)
+
+    def test_weights(self):
+        # one machine, that is always busy, is shared by the weights of the users
+        BuildShare.objects.create(user=self.alice, weight=2)
+        CreateMachines(1, prefix='test')
+        started = []
+        for i in range(6):
+            ClaimingLightBuildServer().ProcessBuildQueue()
+            build = Build.objects.get(status='BUILDING')
+            started.append(build.user.username)
+            Build.objects.filter(id=build.id).update(status='FINISHED')
+            Slot.objects.update(status='AVAILABLE')
+        self.assertEqual(started[:3].count('alice'), 2)
+        self.assertEqual(started[3:].count('alice'), 2)
+
+    def test_max_concurrent_builds(self):
+        BuildShare.objects.create(user=self.alice, weight=10, max_concurrent_builds=1)
+        CreateMachines(3, prefix='test')
+        ClaimingLightBuildServer().ProcessBuildQueue()
+        self.assertEqual(Build.objects.filter(status='BUILDING').filter(user=self.alice).count(), 1)
+        self.assertEqual(Build.objects.filter(status='BUILDING').filter(user=self.bob).count(), 2)
+
+    def test_fairness_index(self):
+        CreateMachines(2, prefix='test')
+        ClaimingLightBuildServer().ProcessBuildQueue()
+        (result, fairness) = GetFairnessStatistics()
+        self.assertEqual(fairness, 1.0)
+        self.assertEqual(sorted(row['share'] for row in result if row['running']), [50, 50])
+
+
+@override_settings(SUPERSEDE_RUNNING_BUILDS=True)
+class BuildProjectWithBranchTest(TestCase):
+
+    def setUp(self):
+        user = CreateUser('test')
+        self.project = CreateProject(user, 'project0', ['package0'])
+        self.target = (self.project, 'package0', 'main', 'fedora', '40', 'x86_64')
+
+    def test_running_build(self):
+        CreateBuilds(self.project.user, 1)
+        Build.objects.update(status='BUILDING')
+        LBS = LightBuildServer()
+        # the sources are not fetched in the web request
+        with mock.patch.object(LightBuildServer, 'getPackagingInstructions', side_effect=AssertionError("fetched the sources")):
+            self.assertTrue(LBS.BuildProjectWithBranch(*self.target))
+            self.assertFalse(LBS.BuildProjectWithBranch(*self.target))
+        self.assertEqual(Build.objects.filter(status='WAITING').count(), 1)
+        self.assertEqual(Build.objects.filter(status='BUILDING').count(), 1)
+
+    def test_waiting_build_does_not_start_next_to_the_running_build(self):
+        CreateMachines(2, prefix='test')
+        CreateBuilds(self.project.user, 1)
+        LBS = ClaimingLightBuildServer()
+        LBS.ProcessBuildQueue()
+        self.assertTrue(LBS.BuildProjectWithBranch(*self.target))
+
+        # the second slot is free, but the sources have not changed
+        LBS.ProcessBuildQueue()
+        self.assertEqual(Build.objects.filter(status='WAITING').count(), 1)
+        self.assertEqual(Slot.objects.filter(status='AVAILABLE').count(), 1)
+
+        # the waiting build starts when the running build has finished
+        Build.objects.filter(status='BUILDING').update(status='FINISHED')
+        Slot.objects.update(status='AVAILABLE')
+        LBS.ProcessBuildQueue()
+        self.assertEqual(Build.objects.filter(status='BUILDING').count(), 1)
+        self.assertFalse(Build.objects.filter(status='WAITING').exists())
+
+
+class SupersedeTest(TransactionTestCase):
+    # the containers are stopped in a thread of the scheduler, with its own database connection
+
+    def setUp(self):
+        self.user = CreateUser('test')
+        project = CreateProject(self.user, 'project0', ['package0'])
+        self.package = Package.objects.get(project=project)
+        CreateMachines(1, prefix='test')
+        CreateBuilds(self.user, 1)
+        self.LBS = ClaimingLightBuildServer()
+        self.LBS.GetContainer = mock.Mock()
+        self.assertTrue(self.LBS.attemptToFindBuildMachine(Build.objects.get()))
+        Build.objects.update(sourcehash='old')
+
+    def test_supersede(self):
+        # eg. in the thread of the webhook: only the database is changed
+        self.LBS.SupersedeBuilds(self.package, 'main', 'old')
+        self.LBS.GetContainer.assert_not_called()
+        self.assertEqual(Slot.objects.get().status, 'BUILDING')
+        self.assertEqual(Build.objects.get(superseded=True).status, 'CANCELLED')
+        self.assertEqual(Build.objects.filter(status='WAITING').count(), 1)
+
+        # the scheduler stops the container, and starts the new build
+        self.LBS.ProcessBuildQueue()
+        self.LBS.WaitForRunningBuilds()
+        self.LBS.GetContainer.return_value.stop.assert_called_once()
+        self.LBS.ProcessBuildQueue()
+        slot = Slot.objects.get()
+        self.assertEqual(slot.status, 'BUILDING')
+        self.assertEqual(slot.build, Build.objects.get(status='BUILDING', superseded=False))
+
+
+class EnqueueBuildMatrixTest(TestCase):
+
+    def enqueue(self, count):
+        user = CreateUser(f"test{count}")
+        project = CreateProject(user, 'project0', [f"package{i}" for i in range(count)], ['fedora/40/x86_64'])
+        # the project is loaded again, like in the views
+        project = Project.objects.get(id=project.id)
+        with CaptureQueriesContext(connection) as queries:
+            builds = LightBuildServer().EnqueueBuildMatrix(project)
+        self.assertEqual(len(builds), count)
+        return len(queries)
+
+    def test_queries(self):
+        # the number of queries does not grow with the number of packages
+        self.assertEqual(self.enqueue(1), self.enqueue(10))
+
+
+def create_graph(requires):
+    requiredby = {}
+    for package, needed in requires.items():
+        for required in needed:
+            requiredby.setdefault(required, set()).add(package)
+    return SimpleNamespace(requires=requires, requiredby=requiredby)
+
+
+class CriticalPathTest(SimpleTestCase):
+
+    def test_paths(self):
+        graph = create_graph({'lib': {'base'}, 'app': {'lib'}, 'docs': {'base'}})
+        durations = {(1, 'project0', 'base'): 10, (1, 'project0', 'lib'): 20, (1, 'project0', 'app'): 30}
+        paths = CriticalPathPolicy(None).GetCriticalPaths(graph, 1, 'project0', durations, 5)
+        self.assertEqual(paths, {'base': 60, 'lib': 50, 'app': 30, 'docs': 5})
+
+    def test_long_chain(self):
+        # deeper than the recursion limit
+        graph = create_graph({f"p{i}": {f"p{i-1}"} for i in range(1, 5000)})
+        paths = CriticalPathPolicy(None).GetCriticalPaths(graph, 1, 'project0', {}, 1)
+        self.assertEqual(paths['p0'], 5000)
+        self.assertEqual(paths['p4999'], 1)
+
+    def test_cycle(self):
+        graph = create_graph({'a': {'b'}, 'b': {'a'}, 'c': {'a'}, 'd': set(), 'e': {'d'}})
+        paths = CriticalPathPolicy(None).GetCriticalPaths(graph, 1, 'project0', {}, 1)
+        self.assertEqual(paths['d'], 2)
+        # the cycle takes as long as both its packages, and c is waiting for it
+        self.assertEqual(paths['a'], 3)
+        self.assertEqual(paths['b'], 3)
+        self.assertEqual(paths['c'], 1)
+        self.assertEqual(set(paths), {'a', 'b', 'c', 'd', 'e'})
+
+    def test_self_loop(self):
+        graph = create_graph({'compiler': {'compiler'}, 'app': {'compiler'}})
+        paths = CriticalPathPolicy(None).GetCriticalPaths(graph, 1, 'project0', {}, 1)
+        self.assertEqual(paths, {'compiler': 2, 'app': 1})
+
+
+class ConcurrentClaimTest(TransactionTestCase):
+    # the schedulers run in their own threads, with their own database connections and committed data
+
+    def test_concurrent_schedulers(self):
+        user = CreateUser('test')
+        CreateMachines(5, slots=2, prefix='test')
+        CreateBuilds(user, 30)
+
+        errors = []
+        def claimer():
+            try:
+                ClaimingLightBuildServer().ProcessBuildQueue()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=claimer) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each building slot must run a different build, and each started build must have exactly one slot
+        claimedbuilds = list(Slot.objects.filter(status='BUILDING').values_list('build_id', flat=True))
+        startedbuilds = list(Build.objects.filter(status='BUILDING').values_list('id', flat=True))
+        self.assertEqual(len(claimedbuilds), len(set(claimedbuilds)))
+        self.assertEqual(sorted(claimedbuilds), sorted(startedbuilds))
+        self.assertEqual(errors, [])
+
+        # the slots that have been given back after a lost claim are found by the next pass
+        ClaimingLightBuildServer().ProcessBuildQueue()
+        self.assertEqual(Slot.objects.filter(status='BUILDING').count(), 10)
+        self.assertEqual(Build.objects.filter(status='BUILDING').count(), 10)
+
+
+class WebhookTest(TestCase):
+
+    def setUp(self):
+        user = CreateUser('test')
+        self.project = CreateProject(user, 'project0', ['package0', 'package1'], ['fedora/40/x86_64'])
+        self.project.webhook_secret = 'secret'
+        self.project.save()
+        self.payload = {'ref': 'refs/heads/main', 'after': '1' * 40,
+            'repository': {'html_url': 'https://example.org/test/project0'}}
+
+    def push(self, forge, payload=None, secret='secret', event=None):
+        body = json.dumps(payload or self.payload).encode('utf-8')
+        signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        headers = {
+            'gitea': {'X-Gitea-Event': event or 'push', 'X-Gitea-Signature': signature},
+            'github': {'X-GitHub-Event': event or 'push', 'X-Hub-Signature-256': 'sha256=' + signature},
+            'gitlab': {'X-Gitlab-Event': event or 'Push Hook', 'X-Gitlab-Token': secret},
+        }[forge]
+        with mock.patch.object(views, 'queue_push') as queue_push:
+            response = self.client.post('/webhook/' + forge, body, content_type='application/json',
+                headers=headers)
+        return (response, queue_push)
+
+    def test_signatures(self):
+        for forge in ('gitea', 'github', 'gitlab'):
+            Project.objects.filter(id=self.project.id).update(git_type=forge)
+            (response, queue_push) = self.push(forge)
+            self.assertEqual(response.status_code, 202)
+            queue_push.assert_called_once_with([self.project], 'main')
+
+    def test_wrong_signature(self):
+        for forge in ('gitea', 'github', 'gitlab'):
+            Project.objects.filter(id=self.project.id).update(git_type=forge)
+            (response, queue_push) = self.push(forge, secret='wrong')
+            self.assertEqual(response.status_code, 403)
+            queue_push.assert_not_called()
+
+    def test_project_without_secret(self):
+        # an empty secret would be easy to guess
+        Project.objects.filter(id=self.project.id).update(git_type='github', webhook_secret='')
+        (response, queue_push) = self.push('github', secret='')
+        self.assertEqual(response.status_code, 403)
+        Project.objects.filter(id=self.project.id).update(webhook_secret=None)
+        (response, queue_push) = self.push('github', secret='')
+        self.assertEqual(response.status_code, 403)
+        queue_push.assert_not_called()
+
+    def test_ignored_events(self):
+        Project.objects.filter(id=self.project.id).update(git_type='github')
+        # the ping when the webhook has been added
+        (response, queue_push) = self.push('github', event='ping')
+        self.assertEqual(response.status_code, 200)
+        queue_push.assert_not_called()
+        (response, queue_push) = self.push('github', dict(self.payload, ref='refs/tags/v1.0'))
+        self.assertEqual(response.status_code, 200)
+        queue_push.assert_not_called()
+        (response, queue_push) = self.push('github', dict(self.payload, after='0' * 40))
+        self.assertEqual(response.status_code, 200)
+        queue_push.assert_not_called()
+
+    def test_pushes_are_collapsed(self):
+        # the forge sends a push for each commit: only one thread, and one fetch for the branch
+        with mock.patch.object(views, 'Thread') as thread:
+            views.queue_push([self.project], 'main')
+            views.queue_push([self.project], 'main')
+        thread.assert_called_once()
+        self.assertEqual(len(views.pending_pushes), 1)
+        with mock.patch.object(LightBuildServer, 'ProcessPush') as processpush, mock.patch.object(views, 'connection'):
+            views.process_pushes()
+        processpush.assert_called_once_with(self.project, 'main')
+        self.assertEqual(views.pending_pushes, {})
+        self.assertIsNone(views.push_thread)
+
+    def test_build_on_push(self):
+        # only the packages with changed sources are built
+        Project.objects.filter(id=self.project.id).update(build_on_push=True)
+        project = Project.objects.get(id=self.project.id)
+        for package in Package.objects.filter(project=project):
+            PackageSrcHash.objects.create(package=package, branchname='main', sourcehash='old')
+            PackageBuildStatus.objects.create(package=package, branchname='main', distro='fedora', release='40', arch='x86_64')
+        LBS = LightBuildServer()
+        def fetch(sourcecache, project, build, branchname, *args):
+            LBS.UpdatePackageHashes(project, branchname, {'package0': 'new', 'package1': 'old'})
+            return ('/nonexisting/', None)
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(GIT_SRC_PATH=tmpdir), \
+                mock.patch.object(LBS, 'getPackagingInstructionsInternal', side_effect=fetch):
+            LBS.ProcessPush(project, 'main')
+        self.assertEqual(list(Build.objects.values_list('package', 'status')), [('package0', 'WAITING')])
+
+
+class LogSinkTest(TransactionTestCase):
+    # the lines are written by the thread of the sink, with its own database connection
+
+    def test_flush(self):
+        user = CreateUser('test')
+        CreateBuilds(user, 1)
+        build = Build.objects.get()
+        sink = LogSink(flushLines=3, flushInterval=60, maxLines=100, maxWait=1)
+        for i in range(5):
+            self.assertTrue(sink.Put(build.id, f"line {i}\n"))
+        # the last batch is not full, and waits for the flush interval, unless it is flushed
+        self.assertTrue(sink.Flush(10))
+        self.assertEqual(list(Log.objects.order_by('id').values_list('line', flat=True)), [f"line {i}\n" for i in range(5)])
+        self.assertIsNotNone(Build.objects.get().heartbeat)
+
+
+class BlockingLogSink(LogSink):
+    # the database does not answer until it is released
+    def __init__(self, *args):
+        self.storing = Event()
+        self.release = Event()
+        self.stored = []
+        LogSink.__init__(self, *args)
+
+    def Store(self, batch):
+        self.storing.set()
+        self.release.wait()
+        self.stored += [log.line for log in batch]
+
+
+class LogSinkFailureTest(SimpleTestCase):
+
+    def test_backpressure(self):
+        sink = BlockingLogSink(1, 60, 2, 60)
+        sink.Put(1, "line 0")
+        self.assertTrue(sink.storing.wait(10))
+        sink.Put(1, "line 1")
+        sink.Put(1, "line 2")
+        # the buffer is full: the build thread waits for the database
+        thread = Thread(target=sink.Put, args=(1, "line 3"))
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        sink.release.set()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(sink.Flush(10))
+        self.assertEqual(sink.stored, ["line 0", "line 1", "line 2", "line 3"])
+
+    def test_dead_database(self):
+        # the build threads do not wait forever, the line is dropped
+        sink = BlockingLogSink(1, 60, 1, 0.1)
+        sink.Put(1, "line 0")
+        self.assertTrue(sink.storing.wait(10))
+        self.assertTrue(sink.Put(1, "line 1"))
+        self.assertFalse(sink.Put(1, "line 2"))
+        self.assertEqual(sink.dropped, 1)
+        sink.release.set()
+        self.assertTrue(sink.Flush(10))
+        self.assertEqual(sink.stored, ["line 0", "line 1"])
+
+    def test_failing_database(self):
+        # the lines are dropped after some attempts, and the lost lines are reported
+        sink = LogSink(1, 0, 10, 1)
+        batch = [Log(build_id=1, line="line 0"), Log(build_id=2, line="line 1")]
+        with mock.patch.object(Log.objects, 'bulk_create', side_effect=Exception("database is gone")) as bulk_create, \
+                self.assertLogs('lib.LogSink', level='ERROR') as logs:
+            sink.Store(batch)
+        self.assertEqual(bulk_create.call_count, LogSink.attempts)
+        self.assertEqual(sink.dropped, 2)
+        self.assertIn("dropped 2 log lines of the builds 1, 2", logs.output[-1])
@@ -1,7 +1,16 @@
 import sys
+import hmac
+import json
+import hashlib
+import traceback
+from threading import Thread, Lock, current_thread
 
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
+from django.http import JsonResponse
+from django.db import connection
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.contrib.auth import authenticate
 
 from lib.Logger import Logger
@@ -13,9 +22,7 @@ from builder.models import Build
 
 from machines import views as machine_view
 
-def buildtarget(request, user, project, package, branchname, distro, release, arch, authuser=None, authpwd =None):
-    project = Project.objects.get(user=User.objects.get(username__exact=user), name=project)
-
+def get_build_user(request, project, authuser, authpwd):
     if authuser and authpwd:
         currentuser = authenticate(username=authuser, password=authpwd)
     else:
@@ -27,6 +34,13 @@ def buildtarget(request, user, project, package, branchname, distro, release, ar
             currentuser = None
 
     if not currentuser or currentuser.is_anonymous:
+        return None
+    return currentuser
+
+def buildtarget(request, user, project, package, branchname, distro, release, arch, authuser=None, authpwd =None):
+    project = Project.objects.get(user=User.objects.get(username__exact=user), name=project)
+
+    if not get_build_user(request, project, authuser, authpwd):
         return machine_view.monitor(request, errormessage="You do not have permission for this project")
 
     # start building
@@ -36,6 +50,128 @@ def buildtarget(request, user, project, package, branchname, distro, release, ar
     else:
         return machine_view.monitor(request, errormessage="This build job is already in the queue")
 
+def buildmatrix(request, user, project, authuser=None, authpwd=None):
+    # eg. ?branch=main&target=fedora/40/x86_64&target=debian/bookworm/amd64&package=foo&dirty=1
+    project = Project.objects.get(user=User.objects.get(username__exact=user), name=project)
+
+    if not get_build_user(request, project, authuser, authpwd):
+        return JsonResponse({'error': "You do not have permission for this project"}, status=403)
+
+    LBS = LightBuildServer()
+    builds = LBS.EnqueueBuildMatrix(project,
+        packagenames=request.GET.getlist('package') or None,
+        branches=request.GET.getlist('branch') or None,
+        buildtargets=request.GET.getlist('target') or None,
+        onlyDirty=request.GET.get('dirty') == '1')
+    return JsonResponse({'queued': [f"{b.package}/{b.branchname}/{b.distro}/{b.release}/{b.arch}" for b in builds]})
+
+def impact(request, user, project, package):
+    # eg. ?branch=main&target=fedora/40/x86_64
+    project = Project.objects.get(user=User.objects.get(username__exact=user), name=project)
+
+    if not project.visible and not request.user.is_staff:
+        if request.user != project.user:
+            return JsonResponse({'error': "You do not have permission for this project"}, status=403)
+    if not Package.objects.filter(project=project, name=package).exists():
+        return JsonResponse({'error': "There is no package " + package}, status=404)
+
+    LBS = LightBuildServer()
+    return JsonResponse(LBS.GetImpact(project, package,
+        branches=request.GET.getlist('branch') or None,
+        buildtargets=request.GET.getlist('target') or None))
+
+def normalize_git_url(url):
+    url = url.strip().lower().rstrip('/')
+    if url.endswith('.git'):
+        url = url[:-4]
+    return url
+
+def verify_webhook(request, forge, secret):
+    if forge == 'gitlab':
+        return hmac.compare_digest(request.headers.get('X-Gitlab-Token', ''), secret)
+    signature = hmac.new(secret.encode('utf-8'), request.body, hashlib.sha256).hexdigest()
+    if forge == 'github':
+        return hmac.compare_digest(request.headers.get('X-Hub-Signature-256', ''), 'sha256=' + signature)
+    if forge == 'gitea':
+        return hmac.compare_digest(request.headers.get('X-Gitea-Signature', ''), signature)
+    return False
+
+# the pushes that have not been processed yet: (project id, branch) => project.
+# the forges send a push for each commit, pushes to the same branch are processed once
+pending_pushes = {}
+pending_pushes_lock = Lock()
+push_thread = None
+
+def queue_push(projects, branchname):
+    global push_thread
+    with pending_pushes_lock:
+        for project in projects:
+            pending_pushes[(project.id, branchname)] = project
+        # one thread processes the pushes of this process, one after the other
+        if push_thread is None:
+            push_thread = Thread(target=process_pushes, daemon=True)
+            push_thread.start()
+
+def process_pushes():
+    # this runs in the background, after the forge got its response.
+    # it only fetches the sources and updates the database, the scheduler stops the superseded builds
+    global push_thread
+    try:
+        LBS = LightBuildServer()
+        while True:
+            with pending_pushes_lock:
+                if not pending_pushes:
+                    push_thread = None
+                    return
+                ((projectid, branchname), project) = pending_pushes.popitem()
+            # a push that arrives now is processed again, it might have new commits
+            try:
+                LBS.ProcessPush(project, branchname)
+            except Exception:
+                traceback.print_exc()
+    finally:
+        with pending_pushes_lock:
+            # after an unexpected error, the next push starts a new thread
+            if push_thread is current_thread():
+                push_thread = None
+        connection.close()
+
+@csrf_exempt
+@require_POST
+def webhook(request, forge):
+    events = {'gitea': ('X-Gitea-Event', 'push'), 'github': ('X-GitHub-Event', 'push'), 'gitlab': ('X-Gitlab-Event', 'Push Hook')}
+    if forge not in events:
+        return JsonResponse({'error': "unknown forge " + forge}, status=404)
+    (header, pushevent) = events[forge]
+    if request.headers.get(header) != pushevent:
+        # eg. the ping when the webhook has been added
+        return JsonResponse({'ignored': "not a push event"})
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': "invalid payload"}, status=400)
+    ref = payload.get('ref') or ''
+    if not ref.startswith('refs/heads/'):
+        return JsonResponse({'ignored': "not a branch"})
+    if payload.get('after') == '0' * 40:
+        return JsonResponse({'ignored': "the branch has been deleted"})
+    branchname = ref[len('refs/heads/'):]
+
+    urls = set()
+    for repo in (payload.get('repository') or {}, payload.get('project') or {}):
+        for field in ('html_url', 'clone_url', 'web_url', 'git_http_url', 'homepage'):
+            if repo.get(field):
+                urls.add(normalize_git_url(repo[field]))
+
+    projects = [project for project in Project.objects.filter(git_type__in=(forge, 'git')).exclude(webhook_secret__isnull=True).exclude(webhook_secret='')
+        if normalize_git_url(project.git_url) in urls and verify_webhook(request, forge, project.webhook_secret)]
+    if not projects:
+        return JsonResponse({'error': "no project with this repository and secret"}, status=403)
+
+    queue_push(projects, branchname)
+    return JsonResponse({'projects': [str(project) for project in projects], 'branch': branchname}, status=202)
+
 @login_required
 def cancelbuild(request, user, project, package, branchname, distro, release, arch):
     project = Project.objects.get(user=User.objects.get(username__exact=user), name=project)
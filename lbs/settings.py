@@ -82,6 +82,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # the tests of the concurrent schedulers need a database file, an in-memory database does not allow concurrent writers
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
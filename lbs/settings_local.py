@@ -0,0 +1,63 @@
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = True
+
+# BuildingTimeout in seconds, will stop the build if no output from build script arrives within that time
+BUILDING_TIMEOUT = 600
+
+# the scheduler looks at the build queue after this many seconds, even without notification
+SCHEDULER_POLL_INTERVAL = 5
+
+# the order of the waiting builds: fifo (oldest first), or criticalpath (longest chain of dependant builds first)
+SCHEDULING_POLICY = "criticalpath"
+
+# stop a running build when the sources of its package have changed, and build the new sources instead
+SUPERSEDE_RUNNING_BUILDS = True
+
+# the machines are shared between the users by the weights, counting the builds that are running
+# or have started within this many seconds
+FAIR_SHARE_WINDOW = 3600
+
+SHOW_NUMBER_OF_FINISHED_JOBS = 30
+
+EMAIL_FROM_ADDRESS = "lbs@example.org"
+EMAIL_SERVER = "smtp.gmail.com"
+EMAIL_PORT = 465
+EMAIL_USER = "myuser@gmail.com"
+EMAIL_PASSWORD = "secret"
+
+SEND_EMAIL_ON_SUCCESS = False
+DELETE_LOG_AFTER_DAYS = 20
+KEEP_MINIMUM_LOGS = 5
+DISPLAY_MAX_BUILDS_PER_PACKAGE = 15
+MAX_DEBUG_LEVEL = 1
+# the log lines of the builds are written to the database in batches of this many lines,
+# or when the oldest line has waited this many seconds
+LOG_FLUSH_LINES = 500
+LOG_FLUSH_INTERVAL = 1
+# the builds wait with their output when this many lines could not be written yet,
+# and drop the line when the database has not caught up after this many seconds
+LOG_BUFFER_MAX_LINES = 20000
+LOG_BUFFER_MAX_WAIT = 60
+
+DELETE_PACKAGES_AFTER_DAYS = 4
+KEEP_MINIMUM_PACKAGES = 4
+
+GIT_SRC_PATH = "var/src"
+# disk space in MB for older snapshots of the sources, that are not used by a build anymore
+SOURCE_CACHE_SIZE = 2000
+# within this time in seconds, the sources are not downloaded again
+SOURCE_CACHE_MAX_AGE = 180
+LOGS_PATH = "var/logs"
+REPOS_PATH = "var/repos"
+TARBALLS_PATH = "var/tarballs"
+SSH_TMP_PATH = "var/ssh"
+
+PUBLIC_KEY_SERVER = "keyserver.ubuntu.com"
+
+LBS_URL = "http://localhost:8000"
+DOWNLOAD_URL = "http://lbs.example.org"
+
+TIME_ZONE = 'Europe/Amsterdam'
\ No newline at end of file
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Benchmark: run the benchmark commands on generated data, without changing the database"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import os
+import tempfile
+
+from django.db import connection, transaction
+
+from lib.LightBuildServer import LightBuildServer
+
+# the user of the generated projects and builds
+BENCHMARK_USER = 'lbs-benchmark'
+
+class Rollback(Exception):
+  pass
+
+class BenchmarkLightBuildServer(LightBuildServer):
+  'does not connect to the machines, just claims them'
+
+  def StartBuild(self, build):
+    pass
+
+def RunRolledBack(benchmark, *args):
+  # all changes to the database are rolled back
+  try:
+    with transaction.atomic():
+      result = benchmark(*args)
+      raise Rollback()
+  except Rollback:
+    pass
+  return result
+
+def RunInTestDatabase(benchmark, *args):
+  # for benchmarks with concurrent threads, that need committed data
+  if connection.vendor == 'sqlite':
+    # an in-memory database does not allow concurrent writers
+    testdb = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+    connection.settings_dict['TEST']['NAME'] = testdb
+  oldname = connection.settings_dict['NAME']
+  connection.creation.create_test_db(verbosity=0, autoclobber=True)
+  try:
+    return benchmark(*args)
+  finally:
+    connection.creation.destroy_test_db(oldname, verbosity=0)
+    if connection.vendor == 'sqlite' and os.path.exists(testdb):
+      os.remove(testdb)
@@ -20,11 +20,13 @@
 #
 import yaml
 import os.path
-from collections import deque
 
 from django.conf import settings
+from django.db import transaction
 
-from projects.models import Project
+from lib.DependancyGraph import DependancyGraph, SortInWaves, FindCycles
+from lib.DependancyCache import DependancyCache
+from projects.models import Project, Package, PackageDependancy
 
 class BuildHelper:
   'abstract base class for BuildHelper implementations for the various Linux Distributions'
@@ -43,7 +45,8 @@ class BuildHelper:
     self.projectname = build.project
     self.packagename = build.package
     self.branchname = build.branchname
-    self.pathSrc = settings.GIT_SRC_PATH+"/"+self.username
+    # the snapshot of the sources for this build, or the newest sources of the project
+    self.pathSrc = getattr(build, 'pathSrc', None) or settings.GIT_SRC_PATH+"/"+self.username
     self.project = Project.objects.filter(user__username=self.username).filter(name=self.projectname).first()
     self.git_project_name = self.project.git_url.strip('/').split('/')[-1]
 
@@ -127,130 +130,94 @@ class BuildHelper:
     print("not implemented")
     return False
 
-  def StorePackageDependancies(self, packages, builddepends):
-    con = Database(self.config)
+  def GetDependancyFiles(self):
+    # the files of the package that are parsed by GetDependanciesAndProvides
+    return []
+
+  def GetDependancyContext(self):
+    # everything besides the files that changes the result of GetDependanciesAndProvides
+    return [type(self).__name__, self.dist, str(self.release), self.arch]
+
+  def GetCachedDependanciesAndProvides(self, cache):
+    return cache.Get(self.GetDependancyFiles(), self.GetDependancyContext(), self.GetDependanciesAndProvides)
+
+  def StorePackageDependancies(self, packages, requires):
+    # requires: package name => the names of the packages it needs
+    packageids = dict(Package.objects.filter(project=self.project).values_list('name', 'id'))
+    dependantids = [packageids[package] for package in packages if package in packageids]
     for package in packages:
-      # find the package id
-      cursor = con.execute("SELECT id FROM package WHERE username = ? AND projectname = ? AND packagename = ? AND branchname = ?", (self.username, self.projectname, package, self.branchname))
-      row = cursor.fetchone()
-      if row is None:
+      if package not in packageids:
         print("There is no package " + package)
-        continue
-      packageid = row['id']
-      # delete all dependancies
-      stmt = "DELETE FROM packagedependancy WHERE dependantpackage = ?"
-      cursor = con.execute(stmt, (packageid,))
-      con.commit()
-      for requiredpackage in builddepends[package]:
-        # find required package id
-        cursor = con.execute("SELECT id FROM package WHERE username = ? AND projectname = ? AND packagename = ? AND branchname = ?", (self.username, self.projectname, requiredpackage, self.branchname))
-        row = cursor.fetchone()
-        if row is not None:
-          requiredpackageid = row['id']
-          stmt = "INSERT INTO packagedependancy (dependantpackage, requiredpackage) VALUES (?, ?)"
-          cursor = con.execute(stmt, (packageid, requiredpackageid))
-          con.commit()
-    con.close()
-    return
+    wanted = set((packageids[package], packageids[required]) for package in packages if package in packageids
+      for required in requires[package] if required in packageids)
+
+    existing = {}
+    for (id, dependantid, requiredid) in PackageDependancy.objects.filter(dependantpackage_id__in=dependantids). \
+        values_list('id', 'dependantpackage_id', 'requiredpackage_id'):
+      existing[(dependantid, requiredid)] = id
+    obsolete = [id for (edge, id) in existing.items() if edge not in wanted]
+    new = [PackageDependancy(dependantpackage_id=dependantid, requiredpackage_id=requiredid)
+      for (dependantid, requiredid) in wanted if (dependantid, requiredid) not in existing]
+    if not obsolete and not new:
+      return
+    with transaction.atomic():
+      PackageDependancy.objects.filter(id__in=obsolete).delete()
+      PackageDependancy.objects.bulk_create(new)
+    # the scheduler must see the new dependancies
+    DependancyGraph.Invalidate(self.project)
 
   def CalculatePackageOrder(self, distro, release, arch):
-    result = deque()
+    # returns the waves of packages that can be built at the same time, or None for a circular dependancy
     self.release = release
     self.arch = arch
-    userconfig=self.config['lbs']['Users'][self.username]
-    projectconfig=userconfig['Projects'][self.projectname]
-    if 'Packages' in projectconfig:
-      packages = userconfig['Projects'][self.projectname]['Packages']
-    else:
-      packages = userconfig['Projects'][self.projectname]
-    unsorted={}
+    buildtarget = distro + "/" + release + "/" + arch
+    packages = set(package.name for package in Package.objects.filter(project=self.project).filter(distro__name=buildtarget))
+    cache = DependancyCache()
     builddepends={}
     depends={}
     providedby={}
     deliverables={}
+    for package in sorted(packages):
+      self.packagename=package
+      # unchanged packages are not parsed again
+      (builddepends[package],deliverables[package]) = self.GetCachedDependanciesAndProvides(cache)
+      for p in deliverables[package]:
+        depends[p] = deliverables[package][p]['requires']
+        for pv in deliverables[package][p]['provides']:
+          providedby[pv] = package
+      # useful for debugging:
+      if False:
+        print( package + " builddepends on: ")
+        for p in builddepends[package]:
+          print("   " + p)
+        print( package + " produces these packages: ")
+        for p1 in deliverables[package]:
+          for p in deliverables[package][p1]['provides']:
+            print("   " + p + " which requires during installation:")
+            for d in depends[p1]:
+              print("      " + d)
+    print("CalculatePackageOrder: parsed %d of %d packages for %s, cache hit rate %d%%" %
+      (cache.misses, len(packages), buildtarget, round(cache.GetHitRate() * 100)))
+
+    # the source packages that each package needs, for building and for installing the package
+    requires={}
     for package in packages:
-      excludeDistro=False
-      if packages[package] is not None and "ExcludeDistros" in packages[package]:
-        for exclude in packages[package]['ExcludeDistros']:
-          if (distro + "/" + release + "/" + arch).startswith(exclude):
-            excludeDistro = True
-      includeDistro=True
-      if packages[package] is not None and "Distros" in packages[package]:
-        includeDistro=False
-        for incl in packages[package]['Distros']:
-          if (distro + "/" + release + "/" + arch) == incl:
-            includeDistro=True
-      if includeDistro and not excludeDistro:
-        self.packagename=package
-        (builddepends[package],deliverables[package]) = self.GetDependanciesAndProvides()
-        for p in deliverables[package]:
-          unsorted[p] = 1
-          depends[p] = deliverables[package][p]['requires']
-          for pv in deliverables[package][p]['provides']:
-            providedby[pv] = package
-        if not package in unsorted:
-          unsorted[package] = 1
-        # useful for debugging:
-        if False:
-          print( package + " builddepends on: ")
-          for p in builddepends[package]:
-            print("   " + p)
-          print( package + " produces these packages: ")
-          for p1 in deliverables[package]:
-            for p in deliverables[package][p1]['provides']:
-              print("   " + p + " which requires during installation:")
-              for d in depends[p1]:
-                print("      " + d)
-
-    while len(unsorted) > 0:
-      nextPackage = None
-      for package in sorted(unsorted):
-        if package in packages and nextPackage is None:
-          missingRequirement=False
-          # check that this package does not require a package that is in unsorted
-          if package in depends:
-            for dep in depends[package]:
-              if dep in providedby:
-                pv = providedby[dep]
-                if pv != package and pv in unsorted and pv in packages:
-                  missingRequirement=True
-          if package in builddepends:
-            for dep in builddepends[package]:
-              if dep in providedby:
-                pv = providedby[dep]
-                if pv != package and pv in unsorted and pv in packages:
-                  missingRequirement=True
-          if not missingRequirement:
-            nextPackage=package
-      if nextPackage == None:
-        # problem: circular dependancy
-        print ("circular dependancy, remaining packages: ")
-        for package in unsorted:
-          if not package in packages:
-            continue
-          print(package)
-          print(" build requires: ")
-          if package in builddepends:
-            for dep in builddepends[package]:
-              if dep in providedby:
-                pv = providedby[dep]
-                if pv != package and pv in unsorted:
-                  print("   " + pv)
-          print(" install requires: ")
-          if package in depends:
-            for dep in depends[package]:
-              if dep in providedby:
-                pv = providedby[dep]
-                if pv != package and pv in unsorted:
-                  print("   " + pv)
-        return None
-      result.append(nextPackage)
-      for p in deliverables[nextPackage]:
-        if p in unsorted:
-          del unsorted[p]
-      if nextPackage in unsorted:
-        del unsorted[nextPackage]
-
-    self.StorePackageDependancies(packages, builddepends)
+      requires[package] = set()
+      for dep in builddepends[package] + depends.get(package, []):
+        # a package that needs itself is built with the previous version of itself
+        if dep in providedby and providedby[dep] in packages and providedby[dep] != package:
+          requires[package].add(providedby[dep])
+
+    result = SortInWaves(requires)
+    self.cycles = []
+    if sum(len(wave) for wave in result) < len(packages):
+      # problem: circular dependancy
+      self.cycles = FindCycles(requires)
+      print("circular dependancy between these packages:")
+      for cycle in self.cycles:
+        print("   " + ", ".join(cycle))
+      return None
+
+    self.StorePackageDependancies(packages, requires)
 
     return result
@@ -25,12 +25,12 @@ import glob
 import yaml
 import tempfile
 import shutil
-import re
 import logging
 
 from django.conf import settings
 
 from lib.BuildHelper import BuildHelper
+from lib.RpmSpec import RpmSpec
 from projects.models import Project
 
 class BuildHelperCentos(BuildHelper):
@@ -338,121 +338,21 @@ class BuildHelperCentos(BuildHelper):
  
     return None
 
-  def ReplaceGlobals(self, globals, condition):
-    for globitem in globals:
-      condition = condition.replace("0%{?"+globitem+":0}", "0")
-      condition = condition.replace("0%{?"+globitem+"}", globals[globitem])
-      if globitem.startswith("with_"):
-        condition = re.sub("%\{with "+globitem[5:] + "\}", "1", condition)
-    condition = re.sub("%\{!\?.*\:1}", "1", condition)
-    condition = re.sub("%\{\?.*\}", "", condition)
-    condition = re.sub("%\{with .*\}", "0", condition)
-    for globitem in globals:
-      condition = condition.replace("%{"+globitem+"}", globals[globitem])
-    condition = re.sub("%\{.*\}", "0", condition)
-    condition = condition.replace("! ", "not ")
-    condition = condition.replace("||", " or ").replace("&&", " and ")
-    return condition
+  def GetDependancyFiles(self):
+    return [self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetSpecFilename()]
+
+  def GetDependancyContext(self):
+    return BuildHelper.GetDependancyContext(self) + [RpmSpec.version]
 
   def GetDependanciesAndProvides(self):
     specfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetSpecFilename()
-    builddepends=[]
-    deliverables={}
-    if os.path.isfile(specfile):
-
-      globals={}
-      globals[self.dist] = self.release
-      if self.dist == "centos":
-        globals["rhel"] = self.release
-      globals["_isa"] = ""
-      name = recentpackagename = None
-      version = None
-      release = None
-      if_blocks={}
-      current_if_block_depth = -1
-
-      # print(specfile)
-      for line_loop in open(specfile, encoding="utf-8"):
-        line = line_loop
-        if line.lower().startswith("%changelog"):
-          break
-
-        if line.lower().startswith("%if"):
-          current_if_block_depth+=1
-          condition="False"
-          if line.lower().startswith("%ifnarch"):
-            condition = line[len("%ifnarch"):].strip()
-            condition = str(condition != self.arch)
-          elif line.lower().startswith("%ifarch"):
-            condition = line[len("%ifarch"):].strip()
-            condition = str(condition == self.arch)
-          elif line.lower().startswith("%if "):
-            condition = line[len("%if"):].strip()
-            condition = self.ReplaceGlobals(globals, condition)
-          else:
-            raise Exception("unknown %if: " + line)
-          if_blocks[current_if_block_depth] = eval(condition)
-
-        elif line.lower().startswith("%else"):
-          if_blocks[current_if_block_depth] = not if_blocks[current_if_block_depth]
-        elif line.lower().startswith("%endif"):
-          current_if_block_depth-=1
-
-        if current_if_block_depth >= 0 and not if_blocks[current_if_block_depth]:
-          continue
-        if line.lower().startswith("%global"):
-          globalline=line.split()
-          condition=globalline[2]
-          if "%{" in condition:
-            condition = self.ReplaceGlobals(globals, condition)
-          globals[globalline[1]] = condition
-        for globitem in globals:
-          line = line.replace("%{"+globitem+"}", globals[globitem])
-        if name:
-          line = line.replace("%{name}", name)
-        if version:
-          line = line.replace("%{version}", version)
-        if release:
-          line = line.replace("%{release}", release)
-
-        if line.lower().startswith("version:"):
-          version = line[len("version:"):].strip()
-        elif line.lower().startswith("release:"):
-          release = line[len("release:"):].strip()
-        elif line.lower().startswith("name:"):
-          name = line[len("name:"):].strip()
-          recentpackagename=name
-        elif line.lower().startswith("%package -n"):
-          recentpackagename=line[len("%package -n"):].strip()
-        elif line.lower().startswith("%package"):
-          recentpackagename=self.packagename + "-" + line[len("%package"):].strip()
-
-        if recentpackagename is not None and recentpackagename not in deliverables:
-          deliverables[recentpackagename] = {}
-          deliverables[recentpackagename]['provides'] = []
-          deliverables[recentpackagename]['requires'] = []
-          deliverables[recentpackagename]['provides'].append(recentpackagename)
-
-        elif line.lower().startswith("buildrequires:"):
-          if line.count(",") > 0:
-            packagesWithVersions=line[len("BuildRequires:"):].split(",")
-          else:
-            packagesWithVersions=line[len("BuildRequires:"):].split()
-          ignoreNext=False
-          for word in packagesWithVersions:
-            if not ignoreNext:
-              # filter >= 3.0, only use package names
-              if word[0] == '>' or word[0] == '<' or word[0] == '=':
-                ignoreNext=True
-              else:
-                builddepends.append(word.strip())
-            else:
-              ignoreNext=False
-        elif line.lower().startswith("requires:"):
-          r = line[len("requires:"):].strip()
-          deliverables[recentpackagename]['requires'].append(r.split()[0])
-        elif line.lower().startswith("provides:"):
-          p = line[len("provides:"):].strip().split()
-          deliverables[recentpackagename]['provides'].append(p[0])
-
-    return (builddepends, deliverables)
+    if not os.path.isfile(specfile):
+      return ([], {})
+
+    globals={}
+    globals[self.dist] = self.release
+    if self.dist == "centos":
+      globals["rhel"] = self.release
+    globals["_isa"] = ""
+    with open(specfile, encoding="utf-8") as f:
+      return RpmSpec(globals, self.arch).Parse(f, self.packagename)
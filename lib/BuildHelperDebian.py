@@ -55,7 +55,8 @@ class BuildHelperDebian(BuildHelper):
     self.run("echo '127.0.0.1     " + self.container.containername + "' > tmp; cat /etc/hosts >> tmp; mv tmp /etc/hosts")
     return True
 
-  def GetDscFilename(self):
+  def GetDscSourceFilename(self):
+    # the name of the dsc file in the snapshot of the sources
     filename = self.packagename + ".dsc"
     path = self.pathSrc + "/" + self.git_project_name + "/" + self.packagename
     if os.path.isdir(path):
@@ -67,17 +68,23 @@ class BuildHelperDebian(BuildHelper):
         for file in os.listdir(path):
           if file.endswith(".dsc"):
             filename = file
-    if filename != filename.lower():
-      if os.path.isfile(path + "/" + filename):
-        os.rename(path + "/" + filename, path + "/" + filename.lower())
-      filename = filename.lower()
     return filename
 
+  def GetDscFilename(self):
+    # the dsc file must have a lowercase name in the container, see RenameDscFile
+    return self.GetDscSourceFilename().lower()
+
+  def RenameDscFile(self, path):
+    # the snapshot of the sources is shared by the builds, the dsc file is renamed in the copy in the container
+    filename = self.GetDscSourceFilename()
+    if filename != filename.lower():
+      self.run("cd " + path + " && mv " + filename + " " + filename.lower())
+
   def GetBinaryPackagename(self):
     packagename = self.GetDscFilename()[:-4]
     path = self.pathSrc + "/" + self.git_project_name + "/" + self.packagename
-    if os.path.isfile(path + "/" + self.GetDscFilename()):
-      for line in open(path + "/" + self.GetDscFilename()):
+    if os.path.isfile(path + "/" + self.GetDscSourceFilename()):
+      for line in open(path + "/" + self.GetDscSourceFilename()):
         if line.startswith("Binary: "):
           packagename=line[len("Binary: "):].strip()
           if packagename.find(",") > 0:
@@ -124,13 +131,14 @@ class BuildHelperDebian(BuildHelper):
 
   def InstallRequiredPackages(self):
     # now install required packages
-    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscFilename()
+    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscSourceFilename()
     packages=None
     # force-yes for packages from our own repository, they are not signed at the moment
     aptInstallFlags="--force-yes "
     nextLineBuildDepends=False
     if os.path.isfile(dscfile):
       self.run("cp -R " + self.git_project_name + "/" + self.packagename + "/* /tmp");
+      self.RenameDscFile("/tmp")
       self.run("sed -i 's/%{release}/0/g' " + "/tmp/" + self.GetDscFilename())
       self.run("sed -i 's/%{release}/0/g' " + "/tmp/debian/control")
       self.run("sed -i 's/%{release}/0/g' " + "/tmp/debian/changelog")
@@ -141,9 +149,10 @@ class BuildHelperDebian(BuildHelper):
 
   def BuildPackage(self):
     DownloadUrl = settings.DOWNLOAD_URL
-    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscFilename()
+    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscSourceFilename()
     if os.path.isfile(dscfile):
       pathPackageSrc="/root/" + self.git_project_name + "/" + self.packagename
+      self.RenameDscFile(pathPackageSrc)
 
       # if debian.tar.gz exists, assume the sources come from OBS
       if os.path.isfile(self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/debian.tar.gz"):
@@ -273,8 +282,16 @@ class BuildHelperDebian(BuildHelper):
 
     return result
 
+  def GetDependancyFiles(self):
+    path = self.pathSrc + "/" + self.git_project_name + "/" + self.packagename
+    return [path + "/" + self.GetDscSourceFilename(), path + "/debian/control"]
+
+  def GetDependancyContext(self):
+    # the dsc and control files are the same for all releases and architectures
+    return [type(self).__name__]
+
   def GetDependanciesAndProvides(self):
-    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscFilename()
+    dscfile=self.pathSrc + "/" + self.git_project_name + "/" + self.packagename + "/" + self.GetDscSourceFilename()
     builddepends=[]
     deliverables={}
     if os.path.isfile(dscfile):
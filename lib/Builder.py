@@ -30,17 +30,14 @@ from pathlib import Path
 from django.conf import settings
 from django.utils import timezone
 
-from lib.RemoteContainer import RemoteContainer
-from lib.DockerContainer import DockerContainer
 from lib.CoprContainer import CoprContainer
-from lib.IncusContainer import IncusContainer
 from lib.BuildHelper import BuildHelper
 from lib.BuildHelperFactory import BuildHelperFactory
 from lib.Shell import Shell
 from lib.Logger import Logger
 
-from machines.models import Machine
 from projects.models import Project, ProjectFile
+from builder.models import Build
 
 class Builder:
   'run one specific build of one package'
@@ -52,16 +49,11 @@ class Builder:
     self.finished = False
     self.buildmachine = None
 
-  def createbuildmachine(self, distro, release, arch, buildmachine, packageSrcPath):
+  def createbuildmachine(self, distro, release, arch, slot, packageSrcPath):
+    buildmachine = slot.host
     self.buildmachine = buildmachine
     # create a container on a remote machine
-    machine = Machine.objects.filter(host=buildmachine).first()
-    if machine.type == 'incus':
-      self.container = IncusContainer(buildmachine, machine, self.logger, packageSrcPath)
-    elif machine.type == 'docker':
-      self.container = DockerContainer(buildmachine, machine, self.logger, packageSrcPath)
-    elif machine.type == 'copr':
-      self.container = CoprContainer(buildmachine, machine, self.logger, packageSrcPath)
+    self.container = self.LBS.GetContainer(slot, self.logger, packageSrcPath)
     return self.container.createmachine(distro, release, arch, buildmachine)
 
   def buildpackageOnCopr(self, build, packageSrcPath):
@@ -208,36 +200,47 @@ class Builder:
     gotPackagingInstructions = False
     try:
       pathSrc=self.LBS.getPackagingInstructions(build)
+      # the build helpers read the packaging instructions from this snapshot
+      build.pathSrc=pathSrc
       packageSrcPath=pathSrc + '/' + git_project_name + '/' + build.package
+      self.LBS.SetBuildSourceHash(build)
       gotPackagingInstructions = True
     except Exception as e:
       self.logger.print("LBSERROR: "+str(e)+ "; for more details see the server log")
       traceback.print_exc()
 
     jobFailed = True
-    if not gotPackagingInstructions:
-      self.LBS.ReleaseMachine(build.buildmachine, jobFailed)
-    elif self.createbuildmachine(build.distro, build.release, build.arch, build.buildmachine, packageSrcPath):
-      try:
-        if type(self.container) is CoprContainer:
-          self.buildpackageOnCopr(build, packageSrcPath)
-        else:
-          self.buildpackageOnContainer(build, pathSrc)
-        self.logger.print("Success!")
-        self.LBS.MarkPackageAsBuilt(build)
-        jobFailed = False
-      except Exception as e:
-        self.logger.print("LBSERROR: "+str(e), 0)
-        traceback.print_exc()
-      finally:
-        self.LBS.ReleaseMachine(build.buildmachine, jobFailed)
-    else:
-      self.logger.print("LBSERROR: There is a problem with creating the container!")
-      self.LBS.ReleaseMachine(build.buildmachine, jobFailed)
-    self.finished = True
+    try:
+      if not gotPackagingInstructions:
+        self.LBS.ReleaseMachine(build.buildmachine, jobFailed, build.buildslot.cid, build)
+      elif self.createbuildmachine(build.distro, build.release, build.arch, build.buildslot, packageSrcPath):
+        try:
+          if type(self.container) is CoprContainer:
+            self.buildpackageOnCopr(build, packageSrcPath)
+          else:
+            self.buildpackageOnContainer(build, pathSrc)
+          self.logger.print("Success!")
+          self.LBS.MarkPackageAsBuilt(build)
+          jobFailed = False
+        except Exception as e:
+          self.logger.print("LBSERROR: "+str(e), 0)
+          traceback.print_exc()
+        finally:
+          self.LBS.ReleaseMachine(build.buildmachine, jobFailed, build.buildslot.cid, build)
+      else:
+        self.logger.print("LBSERROR: There is a problem with creating the container!")
+        self.LBS.ReleaseMachine(build.buildmachine, jobFailed, build.buildslot.cid, build)
+      self.finished = True
+    finally:
+      # the snapshot is released in any case, eg. when creating the container raises an exception
+      self.LBS.releasePackagingInstructions(build)
+    # newer sources have arrived while building, there is already another build in the queue
+    build.superseded = Build.objects.filter(id=build.id).filter(superseded=True).exists()
+    if build.superseded:
+      self.logger.print("This build has been superseded by a build of newer sources")
     logpath=self.logger.getLogPath(build)
     build.number=self.logger.store(settings.DELETE_LOG_AFTER_DAYS, settings.KEEP_MINIMUM_LOGS, logpath)
-    if self.logger.hasLBSERROR() or settings.SEND_EMAIL_ON_SUCCESS:
+    if not build.superseded and (self.logger.hasLBSERROR() or settings.SEND_EMAIL_ON_SUCCESS):
       if settings.EMAIL_FROM_ADDRESS == 'lbs@example.org':
         self.logger.print("Please configure the email settings for sending notification emails")
       else:
@@ -250,7 +253,7 @@ class Builder:
           traceback.print_exc()
 
     # now mark the build finished
-    build.status = 'FINISHED'
+    build.status = 'CANCELLED' if build.superseded else 'FINISHED'
     build.finished = timezone.now()
     build.buildsuccess = Logger(build).getBuildResult()
     build.save()
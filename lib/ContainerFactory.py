@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""ContainerFactory: gets the correct container for the type of the build machine"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+from lib.DockerContainer import DockerContainer
+from lib.IncusContainer import IncusContainer
+from lib.CoprContainer import CoprContainer
+
+class ContainerFactory:
+  'factory class for the containers on the various types of build machines'
+
+  def GetContainer(slot, logger, packageSrcPath):
+    if slot.type == 'incus':
+      return IncusContainer(slot.host, slot, logger, packageSrcPath)
+    if slot.type == 'docker':
+      return DockerContainer(slot.host, slot, logger, packageSrcPath)
+    if slot.type == 'copr':
+      return CoprContainer(slot.host, slot, logger, packageSrcPath)
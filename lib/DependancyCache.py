@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""DependancyCache: parsed build dependancies of the packages, by the content of the parsed files"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+
+import os
+import json
+import hashlib
+from threading import get_ident
+
+from django.conf import settings
+
+class DependancyCache:
+  'the builddepends and deliverables of a package, by the hash of the parsed files and the build target'
+
+  def __init__(self):
+    self.path = settings.GIT_SRC_PATH + "/cache/dependancies"
+    os.makedirs(self.path, exist_ok=True)
+    self.hits = 0
+    self.misses = 0
+
+  def GetKey(self, files, context):
+    # the content of the files and the context of the evaluation, eg. the macros for the distro and arch
+    sha1 = hashlib.sha1(json.dumps(context).encode('utf-8'))
+    for filename in files:
+      sha1.update(b"\0" + os.path.basename(filename).encode('utf-8') + b"\0")
+      if os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+          sha1.update(f.read())
+      else:
+        sha1.update(b"missing")
+    return sha1.hexdigest()
+
+  def Get(self, files, context, parse):
+    # returns (builddepends, deliverables). parse is only called if the files have not been parsed before
+    cachefile = self.path + "/" + self.GetKey(files, context) + ".json"
+    try:
+      with open(cachefile, 'r') as f:
+        (builddepends, deliverables) = json.load(f)
+      self.hits += 1
+      return (builddepends, deliverables)
+    except (OSError, ValueError):
+      pass
+
+    self.misses += 1
+    (builddepends, deliverables) = parse()
+    tmpfile = cachefile + "." + str(os.getpid()) + "-" + str(get_ident()) + ".tmp"
+    with open(tmpfile, 'w') as f:
+      json.dump([builddepends, deliverables], f)
+    os.replace(tmpfile, cachefile)
+    return (builddepends, deliverables)
+
+  def GetHitRate(self):
+    if self.hits + self.misses == 0:
+      return 0
+    return self.hits / (self.hits + self.misses)
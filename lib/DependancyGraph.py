@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""DependancyGraph: cached index of the package dependancies of a project"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+from collections import deque
+from threading import Lock
+
+from django.db.models import Count, Max
+
+from projects.models import PackageDependancy
+
+class DependancyGraph:
+  'transitive closure of the PackageDependancy rows of one project, by package name'
+
+  # cached graphs by project id
+  graphs = {}
+  lock = Lock()
+
+  def __init__(self, projectid, stamp):
+    self.projectid = projectid
+    # the stamp tells us if another process has changed the dependancies of the project
+    self.stamp = stamp
+    self.requires = {}
+    self.requiredby = {}
+    self.closure = {}
+    self.reverseclosure = {}
+    rows = PackageDependancy.objects.filter(dependantpackage__project_id=projectid). \
+      values_list('dependantpackage__name', 'requiredpackage__name')
+    for dependant, required in rows:
+      self.requires.setdefault(dependant, set()).add(required)
+      self.requiredby.setdefault(required, set()).add(dependant)
+
+  @staticmethod
+  def GetStamp(projectid):
+    stats = PackageDependancy.objects.filter(dependantpackage__project_id=projectid). \
+      aggregate(maxid=Max('id'), count=Count('id'))
+    return (stats['maxid'], stats['count'])
+
+  @classmethod
+  def Get(cls, project):
+    stamp = cls.GetStamp(project.id)
+    with cls.lock:
+      graph = cls.graphs.get(project.id)
+      if graph is None or graph.stamp != stamp:
+        graph = DependancyGraph(project.id, stamp)
+        cls.graphs[project.id] = graph
+      return graph
+
+  @classmethod
+  def Invalidate(cls, project):
+    with cls.lock:
+      cls.graphs.pop(project.id, None)
+
+  def Traverse(self, edges, packagename):
+    result = set()
+    todo = deque(edges.get(packagename, ()))
+    while todo:
+      p = todo.popleft()
+      if p not in result:
+        result.add(p)
+        todo.extend(edges.get(p, ()))
+    return result
+
+  def GetRequiredPackages(self, packagename):
+    # all packages that this package depends on, recursively
+    if packagename not in self.closure:
+      self.closure[packagename] = self.Traverse(self.requires, packagename)
+    return self.closure[packagename]
+
+  def GetDependantPackages(self, packagename):
+    # all packages that depend on this package, recursively
+    if packagename not in self.reverseclosure:
+      self.reverseclosure[packagename] = self.Traverse(self.requiredby, packagename)
+    return self.reverseclosure[packagename]
+
+def SortInWaves(requires):
+  # requires: package => the packages it needs, all packages must be keys.
+  # returns the waves of packages: the packages of a wave only need packages of earlier waves,
+  # and can be built at the same time. packages in a circular dependancy are left out
+  required = {package: set(r for r in requires[package] if r != package and r in requires) for package in requires}
+  requiredby = {package: [] for package in requires}
+  for package, needed in required.items():
+    for r in needed:
+      requiredby[r].append(package)
+  missing = {package: len(needed) for package, needed in required.items()}
+  waves = []
+  wave = sorted(package for package, count in missing.items() if count == 0)
+  while wave:
+    waves.append(wave)
+    nextwave = []
+    for package in wave:
+      for dependant in requiredby[package]:
+        missing[dependant] -= 1
+        if missing[dependant] == 0:
+          nextwave.append(dependant)
+    wave = sorted(nextwave)
+  return waves
+
+def FindCycles(requires):
+  # the strongly connected components with more than one package, with Tarjan's algorithm
+  index = {}
+  lowlink = {}
+  onstack = set()
+  stack = []
+  cycles = []
+  counter = 0
+  for start in sorted(requires):
+    if start in index:
+      continue
+    # iterative depth first search, to avoid the recursion limit for long chains
+    index[start] = lowlink[start] = counter
+    counter += 1
+    stack.append(start)
+    onstack.add(start)
+    work = [(start, iter(sorted(requires[start])))]
+    while work:
+      (package, edges) = work[-1]
+      pushed = False
+      for r in edges:
+        if r not in requires or r == package:
+          continue
+        if r not in index:
+          index[r] = lowlink[r] = counter
+          counter += 1
+          stack.append(r)
+          onstack.add(r)
+          work.append((r, iter(sorted(requires[r]))))
+          pushed = True
+          break
+        if r in onstack:
+          lowlink[package] = min(lowlink[package], index[r])
+      if pushed:
+        continue
+      work.pop()
+      if work:
+        lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[package])
+      if lowlink[package] == index[package]:
+        component = []
+        while True:
+          p = stack.pop()
+          onstack.discard(p)
+          component.append(p)
+          if p == package:
+            break
+        if len(component) > 1:
+          cycles.append(sorted(component))
+  return sorted(cycles)
@@ -44,8 +44,12 @@ class DockerContainer(RemoteContainer):
     self.staticIP = staticIP
     self.mount = ""
 
+    if self.sharedHost:
+      # other builds are running on this host, only remove the stale container of this slot
+      if self.executeOnHost("if docker container inspect " + self.containername + " > /dev/null 2>&1; then docker rm -f " + self.containername + "; fi") == False:
+        return False
     # TODO: somehow docker stop does not succeed. the current solution only works with CentOS host...
-    if self.executeOnHost("if [ ! -z \\\"\`docker ps -a | grep " + self.containername + "\`\\\" ]; then service docker restart && docker stop " + self.containername + " && docker rm " + self.containername + "; fi") == False:
+    elif self.executeOnHost("if [ ! -z \\\"\`docker ps -a | grep " + self.containername + "\`\\\" ]; then service docker restart && docker stop " + self.containername + " && docker rm " + self.containername + "; fi") == False:
       return False
 
     if arch != 'amd64':
@@ -132,6 +136,9 @@ class DockerContainer(RemoteContainer):
     return self.executeOnHost("docker rm " + self.containername)
 
   def stop(self):
+    if self.sharedHost:
+      # do not restart the docker daemon, other builds are running on this host
+      return self.executeOnHost("docker rm -f " + self.containername)
     #TODO docker stop does not work, not even for test job
     #return self.executeOnHost("docker stop " + self.containername)
     return self.executeOnHost("(systemctl restart docker || service docker restart) && sleep 10")
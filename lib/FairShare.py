@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""FairShare: share the build machines between users and projects"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import datetime
+from collections import deque, defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from builder.models import Build, BuildShare
+from projects.models import Project
+
+class FairShare:
+  'weighted fair share of the build machines: first between the users, then between the projects of a user'
+
+  def __init__(self, builds, now=timezone.now):
+    # builds: the waiting builds, in the order of the scheduling policy
+    self.queues = defaultdict(lambda: defaultdict(deque))
+    self.position = {}
+    for build in builds:
+      self.queues[build.user_id][build.project].append(build)
+      self.position[build.id] = len(self.position)
+
+    self.runninguser = defaultdict(int)
+    self.runningproject = defaultdict(int)
+    for row in Build.objects.filter(status='BUILDING').values('user_id', 'project').annotate(count=Count('id')):
+      self.runninguser[row['user_id']] += row['count']
+      self.runningproject[(row['user_id'], row['project'])] += row['count']
+    # the share is measured by the builds that are running or have started recently,
+    # so that a machine that is always busy is shared by the weights as well. the limits only count the running builds
+    self.useduser = defaultdict(int)
+    self.usedproject = defaultdict(int)
+    since = now() - datetime.timedelta(seconds=settings.FAIR_SHARE_WINDOW)
+    for row in Build.objects.filter(Q(status='BUILDING') | Q(started__gte=since)).values('user_id', 'project').annotate(count=Count('id')):
+      self.useduser[row['user_id']] += row['count']
+      self.usedproject[(row['user_id'], row['project'])] += row['count']
+
+    self.userweight = {}
+    self.userlimit = {}
+    for share in BuildShare.objects.filter(user_id__in=self.queues.keys()):
+      self.userweight[share.user_id] = share.weight
+      self.userlimit[share.user_id] = share.max_concurrent_builds
+    self.projectweight = {}
+    self.projectlimit = {}
+    for project in Project.objects.filter(user_id__in=self.queues.keys()):
+      self.projectweight[(project.user_id, project.name)] = project.build_weight
+      self.projectlimit[(project.user_id, project.name)] = project.max_concurrent_builds
+
+  def __iter__(self):
+    while True:
+      build = self.Next()
+      if build is None:
+        return
+      yield build
+
+  def HasRoom(self, limits, running, key):
+    return not limits.get(key) or running[key] < limits[key]
+
+  def Next(self):
+    # take the user with the fewest recent builds compared to its weight,
+    # then the project of that user with the fewest recent builds compared to its weight.
+    # on a tie, the build that comes first in the order of the scheduling policy wins
+    best = None
+    for user_id, projects in self.queues.items():
+      if not self.HasRoom(self.userlimit, self.runninguser, user_id):
+        continue
+      userscore = self.useduser[user_id] / self.userweight.get(user_id, 1)
+      for projectname, queue in projects.items():
+        key = (user_id, projectname)
+        if not queue or not self.HasRoom(self.projectlimit, self.runningproject, key):
+          continue
+        score = (userscore, self.usedproject[key] / self.projectweight.get(key, 1), self.position[queue[0].id])
+        if best is None or score < best[0]:
+          best = (score, queue)
+    if best is None:
+      return None
+    return best[1].popleft()
+
+  def Started(self, build):
+    self.runninguser[build.user_id] += 1
+    self.runningproject[(build.user_id, build.project)] += 1
+    self.useduser[build.user_id] += 1
+    self.usedproject[(build.user_id, build.project)] += 1
+
+def GetFairnessStatistics():
+  # running and waiting builds per user and project, compared to the share they are entitled to
+  rows = defaultdict(lambda: {'running': 0, 'waiting': 0, 'oldest': None})
+  for row in Build.objects.filter(status__in=('WAITING', 'BUILDING')). \
+      values('user_id', 'user__username', 'project', 'status').annotate(count=Count('id'), oldest=Min('created')):
+    stats = rows[(row['user_id'], row['user__username'], row['project'])]
+    if row['status'] == 'BUILDING':
+      stats['running'] = row['count']
+    else:
+      stats['waiting'] = row['count']
+      stats['oldest'] = row['oldest']
+
+  userweight = dict(BuildShare.objects.values_list('user_id', 'weight'))
+  projectweight = {}
+  for (user_id, name, weight) in Project.objects.values_list('user_id', 'name', 'build_weight'):
+    projectweight[(user_id, name)] = weight
+  activeusers = set(user_id for (user_id, username, project) in rows)
+  totalweight = sum(userweight.get(user_id, 1) for user_id in activeusers)
+  totalprojectweight = defaultdict(int)
+  for (user_id, username, project) in rows:
+    totalprojectweight[user_id] += projectweight.get((user_id, project), 1)
+  totalrunning = sum(stats['running'] for stats in rows.values())
+
+  result = []
+  usershare = defaultdict(float)
+  for (user_id, username, project), stats in sorted(rows.items(), key=lambda item: (item[0][1], item[0][2])):
+    entitled = userweight.get(user_id, 1) / totalweight * \
+      projectweight.get((user_id, project), 1) / totalprojectweight[user_id]
+    share = stats['running'] / totalrunning if totalrunning else 0
+    usershare[user_id] += share
+    result.append({
+      'user': username,
+      'project': project,
+      'running': stats['running'],
+      'waiting': stats['waiting'],
+      'share': round(share * 100),
+      'entitled': round(entitled * 100),
+      'waiting_minutes': round((timezone.now() - stats['oldest']).total_seconds() / 60) if stats['oldest'] else 0,
+    })
+
+  # Jain's fairness index over the users: 1 is perfectly fair, 1/n means one user gets everything
+  fairness = None
+  if totalrunning:
+    ratios = [usershare[user_id] / (userweight.get(user_id, 1) / totalweight) for user_id in activeusers]
+    fairness = round(sum(ratios) ** 2 / (len(ratios) * sum(r * r for r in ratios)), 2)
+  return (result, fairness)
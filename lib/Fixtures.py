@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Fixtures: generated users, machines, projects and builds for the benchmarks and the tests"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from builder.models import Build
+from machines.models import Machine
+from projects.models import Project, Package, PackageDependancy, Distro, Branch
+
+def CreateUser(username):
+  user, created = User.objects.get_or_create(username=username)
+  return user
+
+def CreateMachines(count, slots=1, prefix="benchmark"):
+  # the machines are never connected to, they do not need a private key
+  for i in range(count):
+    Machine(host=f"{prefix}{i}.lbs.local", port=22, type='docker', private_key='',
+      priority=1, cid=i*slots+1, slots=slots).save()
+
+def CreateBuilds(user, count, status='WAITING'):
+  # one build for each of the projects project0, project1... with the packages package0, package1...
+  for i in range(count):
+    Build(status=status, user=user, project=f"project{i}", secret=False,
+      package=f"package{i}", branchname='main', distro='fedora', release='40', arch='x86_64').save()
+
+def CreateProject(user, name, packagenames=(), buildtargets=(), branches=()):
+  # the packages are built for all buildtargets and branches
+  project = Project.objects.create(name=name, user=user, git_url='https://example.org/' + user.username + '/' + name, git_branch='main')
+  Package.objects.bulk_create([Package(project=project, name=packagename) for packagename in packagenames])
+  packages = Package.objects.filter(project=project)
+  Distro.objects.bulk_create([Distro(package=package, name=buildtarget) for package in packages for buildtarget in buildtargets])
+  Branch.objects.bulk_create([Branch(package=package, name=branch) for package in packages for branch in branches])
+  return project
+
+def CreateCriticalPathWorkload(user, count):
+  # a chain of long builds, each depending on the previous one, and many short independent builds.
+  # the independent builds are added to the queue first, which is the worst case for fifo
+  chainlength = max(count // 4, 1)
+  packagenames = [f"independent{i}" for i in range(count - chainlength)] + [f"chain{i}" for i in range(chainlength)]
+  project = CreateProject(user, 'benchmark', packagenames)
+  packages = {package.name: package for package in Package.objects.filter(project=project)}
+  PackageDependancy.objects.bulk_create([PackageDependancy(dependantpackage=packages[f"chain{i}"],
+    requiredpackage=packages[f"chain{i-1}"]) for i in range(1, chainlength)])
+  finished = timezone.now() - datetime.timedelta(days=1)
+  for name in packagenames:
+    duration = datetime.timedelta(minutes=10 if name.startswith("chain") else 3)
+    Build.objects.create(status='FINISHED', user=user, project=project.name, secret=False, package=name,
+      branchname='main', distro='fedora', release='40', arch='x86_64', started=finished - duration, finished=finished)
+  for name in packagenames:
+    Build.objects.create(status='WAITING', user=user, project=project.name, secret=False, package=name,
+      branchname='main', distro='fedora', release='40', arch='x86_64')
+  return project
+
+def GenerateSpec(i):
+  # a spec file with the usual conditions and macros. package i needs package i-1
+  return (f"%global libname libpackage{i}\n%bcond_without docs\nName: package{i}\nVersion: 1.{i}\nRelease: 1%{{?dist}}\n" +
+    (f"BuildRequires: package{i-1}-devel >= 1.0\n" if i else "") +
+    "%if 0%{?fedora} >= 30 || 0%{?rhel} >= 8\nBuildRequires: gcc, make\n%else\nBuildRequires: gcc44\n%endif\n" +
+    "%if %{with docs}\nBuildRequires: doxygen\n%endif\n%ifarch x86_64 aarch64\nBuildRequires: nasm\n%endif\n" +
+    "%description\n" + "a package for the benchmark\n" * 20 +
+    "%package devel\nRequires: %{name} = %{version}-%{release}\nProvides: %{libname}-devel\n" +
+    "%build\nmake %{?_smp_mflags}\n%install\nmake install DESTDIR=%{buildroot}\n%files\n%{_libdir}/*.so.*\n" +
+    "%changelog\n" + "- change\n" * 100)
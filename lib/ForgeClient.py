@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""ForgeClient: download the archives of the projects from the forges"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class ForgeClient:
+  'conditional requests to gitea, github and gitlab, over connections that are kept alive'
+
+  # one session for all threads of this process, with a pool of connections for each forge
+  session = None
+  lock = Lock()
+  # seconds to connect, and to wait for the next bytes of the archive
+  timeout = (10, 120)
+
+  @classmethod
+  def GetSession(cls):
+    with cls.lock:
+      if cls.session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        cls.session = session
+      return cls.session
+
+  @staticmethod
+  def GetArchiveUrl(project, branchname):
+    # returns the url and the headers for downloading the branch of the project
+    headers = {}
+    url = None
+    if project.git_type == 'gitea':
+      url = project.git_url + "/archive/" + branchname + ".tar.gz"
+    elif project.git_type == 'github':
+      url = project.git_url + "/archive/" + branchname + ".tar.gz"
+    elif project.git_type == 'gitlab':
+      url = project.git_url + "/repository/archive.tar.gz?ref=" + branchname
+      if project.git_private_token:
+        headers['PRIVATE-TOKEN'] = project.git_private_token
+    return (url, headers)
+
+  @classmethod
+  def GetArchive(cls, url, headers, etag=None):
+    # returns the response with the status 304 if the archive still has the etag,
+    # otherwise the response with the status 200, to read the archive from
+    headers = dict(headers)
+    if etag:
+      headers['If-None-Match'] = '"' + etag + '"'
+    r = cls.GetSession().get(url, headers=headers, stream=True, timeout=cls.timeout)
+    if r.status_code == 304:
+      # reading the empty body gives the connection back to the pool, closing the response would close the connection
+      r.content
+      return r
+    if r.status_code == 401:
+      r.close()
+      raise Exception("problem downloading the repository, access denied")
+    elif not r.status_code == 200:
+      r.close()
+      raise Exception("problem downloading the repository " + url + ", HTTP error code " + str(r.status_code))
+    return r
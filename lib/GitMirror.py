@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""GitMirror: bare mirror of a git repository, from which only the needed directories are taken"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+
+import os
+import time
+import subprocess
+
+class GitArchive:
+  'the tar stream of git archive, that can be read like the body of a response'
+
+  def __init__(self, process):
+    self.process = process
+
+  def read(self, size=-1):
+    return self.process.stdout.read(size)
+
+  def close(self):
+    self.process.stdout.close()
+    error = self.process.stderr.read()
+    self.process.stderr.close()
+    if self.process.wait() != 0:
+      raise Exception("problem with git archive: " + error.decode('utf-8', 'replace'))
+
+class GitMirror:
+  'one bare repository per git url in the source cache, updated with shallow fetches'
+
+  # only the newest commit of a branch is needed
+  depth = 1
+
+  def __init__(self, sourcecache, url):
+    self.sourcecache = sourcecache
+    self.url = url
+    self.name = sourcecache.Hash(url)
+    self.path = sourcecache.path + "/mirrors/" + self.name + ".git"
+
+  def Git(self, *args):
+    result = subprocess.run(["git", "--git-dir", self.path] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+      raise Exception("problem with git " + args[0] + ": " + result.stderr.decode('utf-8', 'replace'))
+    return result.stdout.decode('utf-8')
+
+  def Update(self, branchname, refresh=False):
+    # returns the newest commit of the branch.
+    # within the maximum age, the commit of the last fetch is used without asking the forge
+    urlkey = self.sourcecache.Hash(self.url + "#" + branchname)
+    with self.sourcecache.Lock("mirror-" + self.name):
+      etag, commit, checked = self.sourcecache.GetUrlInfo(urlkey)
+      if commit and not refresh and time.time() - checked < self.sourcecache.maxAge:
+        return commit
+      if not os.path.isdir(self.path):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        subprocess.run(["git", "init", "--quiet", "--bare", self.path], check=True)
+      # the objects that we have already are not downloaded again
+      self.Git("fetch", "--quiet", "--no-tags", "--depth", str(self.depth), self.url,
+        "+refs/heads/" + branchname + ":refs/heads/" + branchname)
+      commit = self.Git("rev-parse", "--verify", "refs/heads/" + branchname + "^{commit}").strip()
+      self.sourcecache.SetUrlInfo(urlkey, None, commit)
+      return commit
+
+  def GetTopLevel(self, commit):
+    # name => (type, object id) of the files and directories at the top of the commit
+    result = {}
+    for line in self.Git("ls-tree", "-z", commit).split("\0"):
+      if line:
+        info, name = line.split("\t", 1)
+        mode, type, id = info.split(" ")
+        result[name] = (type, id)
+    return result
+
+  def Archive(self, commit, paths=None):
+    # the tar stream of the commit, with only the given paths
+    args = ["git", "--git-dir", self.path, "archive", "--format=tar", "--prefix=" + self.name + "/", commit]
+    if paths is not None:
+      args += ["--"] + paths
+    return GitArchive(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
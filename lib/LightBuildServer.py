@@ -22,86 +22,211 @@
 from time import gmtime, strftime
 import os
 import shutil
-import time
+import hashlib
 import datetime
-import requests
 import logging
-from threading import Thread, Lock
+import socket
+from threading import Thread, Lock, get_ident
 from collections import deque
 
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Avg, Sum, ExpressionWrapper, DurationField
 from django.utils import timezone
 
-from lib.RemoteContainer import RemoteContainer
-from lib.DockerContainer import DockerContainer
-from lib.IncusContainer import IncusContainer
-from lib.CoprContainer import CoprContainer
+from lib.ContainerFactory import ContainerFactory
+from lib.SourceCache import SourceCache
+from lib.ForgeClient import ForgeClient
+from lib.SourceHasher import SourceHasher
+from lib.GitMirror import GitMirror
 from lib.BuildHelper import BuildHelper
 from lib.BuildHelperFactory import BuildHelperFactory
+from lib.DependancyGraph import DependancyGraph
 from lib.Logger import Logger
 from lib.Builder import Builder
-from lib.Shell import Shell
+from lib.SchedulingPolicy import GetSchedulingPolicy
+from lib.FairShare import FairShare
 
-from projects.models import Project, Package, PackageDependancy, PackageSrcHash, PackageBuildStatus
-from machines.models import Machine
+from projects.models import Project, Package, PackageSrcHash, PackageBuildStatus
+from machines.models import Machine, Slot, MachineCache
 from builder.models import Build, Log
 
 class LightBuildServer:
   'light build server based on lxc and git'
 
+  def __init__(self, now=timezone.now):
+    # the clock of the scheduler. the simulation runs the scheduler in virtual time
+    self.now = now
+    # the threads of the builds that have been started by this process
+    self.buildthreads = []
+    # in which order the waiting builds get a machine
+    self.policy = GetSchedulingPolicy(settings.SCHEDULING_POLICY, self)
+
   def GetLbsName(self, build):
     return build.user.username+"/"+build.project+"/"+build.package+"/"+build.branchname+"/"+build.distro+"/"+build.release+"/"+build.arch
 
 
-  def GetAvailableBuildMachine(self, build):
-    m = Machine.objects.filter(status='AVAILABLE').filter(enabled=True)
-    if build.avoiddocker:
-      m = m.exclude(type='docker')
-    if build.avoidlxc:
-      m = m.exclude(type='lxc').exclude(type='incus')
+  def IsMachineSuitable(self, slot, build):
+    machine = slot.machine
+    if slot.status != 'AVAILABLE' or not machine.enabled:
+      return False
+    if build.avoiddocker and machine.type == 'docker':
+      return False
+    if build.avoidlxc and machine.type in ('lxc', 'incus'):
+      return False
+    # do not reserve more cpus or memory than the machine has
+    if machine.cpus and machine.reservedcpus + build.cpus > machine.cpus:
+      return False
+    if machine.memory and machine.reservedmemory + build.memory > machine.memory:
+      return False
     if not build.designated_build_machine:
-      m = m.filter(static=False)
-    else:
-      m = m.filter(Q(host=build.designated_build_machine) | Q(Q(type='copr') & Q(host__startswith=build.designated_build_machine) & Q(static=True)))
-
-    machineToUse=None
-    machinePriorityToUse=101
-    for row in m:
-      if row.priority < machinePriorityToUse:
-        machinePriorityToUse = row.priority
-        machineToUse = row.host
-
-    if machineToUse is not None:
-      m = Machine.objects.filter(host=machineToUse).filter(status='AVAILABLE').first()
-      if m:
-        m.status = 'BUILDING'
-        m.build = build
-        m.save()
-        print("GetAvailableBuildMachine found a free machine: " + machineToUse)
-        return machineToUse
+      return not machine.static
+    return machine.host == build.designated_build_machine or \
+      (machine.type == 'copr' and machine.host.startswith(build.designated_build_machine) and machine.static)
+
+  def IsMachineRateLimited(self, machine):
+    # some hosts should not start several builds at the same time, eg. because of the docker daemon
+    if machine.dispatch_interval and machine.last_dispatch:
+      return self.now() - machine.last_dispatch < datetime.timedelta(seconds=machine.dispatch_interval)
+    return False
+
+  def GetAvailableBuildMachines(self):
+    # all free slots of the enabled machines.
+    # the slots of one machine share the machine object, which knows the reservations of the running builds
+    machines = {}
+    for machine in Machine.objects.filter(enabled=True):
+      machine.reservedcpus = 0
+      machine.reservedmemory = 0
+      machine.warmtargets = {}
+      machines[machine.id] = machine
+    for cache in MachineCache.objects.filter(machine_id__in=machines.keys()):
+      machines[cache.machine_id].warmtargets.setdefault((cache.distro, cache.release, cache.arch), set()). \
+        add((cache.user_id, cache.project))
+    reservations = Slot.objects.filter(status__in=('BUILDING', 'STOPPING')).filter(machine_id__in=machines.keys()). \
+      values('machine_id').annotate(cpus=Sum('build__cpus'), memory=Sum('build__memory'))
+    for row in reservations:
+      machines[row['machine_id']].reservedcpus = row['cpus'] or 0
+      machines[row['machine_id']].reservedmemory = row['memory'] or 0
+    slots = []
+    for slot in Slot.objects.filter(status='AVAILABLE').filter(machine_id__in=machines.keys()):
+      slot.machine = machines[slot.machine_id]
+      slots.append(slot)
+    return slots
+
+  def GetCacheAffinity(self, machine, build):
+    # 2: the image and package caches of the target are warm, and the sources of the project as well
+    # 1: only the image and package caches of the target are warm
+    projects = machine.warmtargets.get((build.distro, build.release, build.arch))
+    if projects is None:
+      return 0
+    if (build.user_id, build.project) in projects:
+      return 2
+    return 1
+
+  def UpdateMachineCache(self, machine, build):
+    # only statistics and a hint for the next dispatch: a failure must not affect the build that has been claimed
+    try:
+      if self.GetCacheAffinity(machine, build):
+        Machine.objects.filter(id=machine.id).update(cache_hits=F('cache_hits') + 1)
+      else:
+        Machine.objects.filter(id=machine.id).update(cache_misses=F('cache_misses') + 1)
+      cache = MachineCache.objects.filter(machine=machine, distro=build.distro, release=build.release, arch=build.arch,
+        user_id=build.user_id, project=build.project)
+      if not cache.update(last_used=self.now()):
+        # another scheduler might create the same row at the same time, the savepoint keeps our transaction usable
+        with transaction.atomic():
+          MachineCache.objects.create(machine=machine, distro=build.distro, release=build.release, arch=build.arch,
+            user_id=build.user_id, project=build.project, last_used=self.now())
+    except Exception as e:
+      print("UpdateMachineCache: cannot update the cache of machine " + machine.host + ": " + str(e))
+    machine.warmtargets.setdefault((build.distro, build.release, build.arch), set()).add((build.user_id, build.project))
+
+  def GetAvailableBuildMachine(self, build, machines=None):
+    # machines: the list of available slots of the current dispatch pass
+    if machines is None:
+      machines = self.GetAvailableBuildMachines()
+
+    candidates = [row for row in machines if self.IsMachineSuitable(row, build) and row.machine.priority < 101]
+    # on the same priority, prefer a machine that has recently built the same target
+    for row in sorted(candidates, key=lambda row: (row.machine.priority, -self.GetCacheAffinity(row.machine, build))):
+      if self.IsMachineRateLimited(row.machine):
+        continue
+      # whether we get it or not, the slot is not available anymore in this pass
+      machines.remove(row)
+      # claim the slot with a single conditional update, so that only one scheduler can win
+      claimed = Slot.objects.filter(id=row.id).filter(status='AVAILABLE'). \
+        update(status='BUILDING', build=build)
+      if claimed:
+        row.machine.last_dispatch = self.now()
+        try:
+          Machine.objects.filter(id=row.machine.id).update(last_dispatch=row.machine.last_dispatch)
+        except Exception:
+          self.GiveBackSlot(row, build)
+          raise
+        row.machine.reservedcpus += build.cpus
+        row.machine.reservedmemory += build.memory
+        print("GetAvailableBuildMachine found a free machine: " + str(row))
+        return row
+      print("GetAvailableBuildMachine: machine " + str(row) + " has been claimed by another scheduler")
 
     print("GetAvailableBuildMachine cannot find a machine")
     return None
 
+  def GetSchedulerName(self):
+    return socket.gethostname() + ":" + str(os.getpid())
+
+  def IsProcessAlive(self, pid):
+    try:
+      os.kill(pid, 0)
+    except ProcessLookupError:
+      return False
+    except PermissionError:
+      return True
+    return True
+
+  def AdoptOrphanedBuilds(self):
+    # find builds that have been started by a scheduler process on this host, that is not running anymore.
+    # the build threads died with that process, so we put the builds back into the queue
+    hostname = socket.gethostname()
+    builds = Build.objects.filter(status='BUILDING').filter(scheduler__startswith=hostname + ":")
+    for build in builds:
+      pid = int(build.scheduler.split(":")[-1])
+      if pid == os.getpid() or self.IsProcessAlive(pid):
+        continue
+      print("AdoptOrphanedBuilds: build %d of %s is waiting again" % (build.id, self.GetLbsName(build)))
+      build.status = 'WAITING'
+      build.started = None
+      build.heartbeat = None
+      build.scheduler = None
+      build.save()
+      Logger(build).clean()
+      slot = Slot.objects.filter(build=build).first()
+      if slot:
+        self.ReleaseMachine(slot.host, False, slot.cid)
+
+  def WaitForRunningBuilds(self):
+    for thread in self.buildthreads:
+      thread.join()
+    self.buildthreads = []
+
   def CheckForHangingBuild(self):
 
-      # check for hanging build (BuildingTimeout in config.yml)
+      # check for hanging builds (BuildingTimeout in config.yml):
+      # the build job has not written any output for that time
       builds = Build.objects.filter(status='BUILDING'). \
         filter(hanging=False). \
-        filter(Q(started__lt=timezone.now()-datetime.timedelta(seconds=settings.BUILDING_TIMEOUT))). \
-        order_by('id').reverse()
-      for row in builds:
-        log = Log.objects.filter(build=row).filter(Q(created__gt=datetime.datetime.now()-datetime.timedelta(seconds=settings.BUILDING_TIMEOUT)))
-        if not log.exists():
-          # mark the build as hanging, so that we don't try to release the machine several times
-          row.hanging = 1
-          row.save()
-          self.ReleaseMachine(row.buildmachine, True)
-          # when the build job realizes that the buildmachine is gone:
-          #   the log will be written, email sent, and logs cleared
-          #   the build will be marked as failed as well
-          return
+        filter(heartbeat__lt=self.now()-datetime.timedelta(seconds=settings.BUILDING_TIMEOUT))
+      hanging = list(builds.values_list('id', flat=True))
+      if not hanging:
+        return
+      # mark the builds as hanging, so that we don't try to release the machines several times
+      Build.objects.filter(id__in=hanging).filter(hanging=False).update(hanging=True)
+      for slot in Slot.objects.filter(build_id__in=hanging).filter(status__in=('BUILDING', 'STOPPING')).select_related('machine'):
+        print("CheckForHangingBuild: releasing %s/%d for build %d" % (slot.host, slot.cid, slot.build_id))
+        self.ReleaseMachine(slot.host, True, slot.cid)
+      # when the build job realizes that the buildmachine is gone:
+      #   the log will be written, email sent, and logs cleared
+      #   the build will be marked as failed as well
 
   def CancelPlannedBuild(self, project, packagename, branchname, distro, release, arch):
       build = Build.objects.filter(status='WAITING'). \
@@ -124,53 +249,81 @@ class LightBuildServer:
         row.status = 'CANCELLED'
         row.save()
 
-  def ReleaseMachine(self, buildmachine, jobFailed):
-    print("ReleaseMachine %s" % (buildmachine))
-    machine = Machine.objects.filter(host=buildmachine).first()
-
-    # only release the machine when it is building
-    if machine.status == 'BUILDING' or machine.status == 'STOPPING':
+  def GetContainer(self, slot, logger, packageSrcPath):
+    return ContainerFactory.GetContainer(slot, logger, packageSrcPath)
+
+  def ReleaseMachine(self, buildmachine, jobFailed, cid=None, build=None):
+    # without a container id, all slots of the machine are released
+    print("ReleaseMachine %s %s" % (buildmachine, "" if cid is None else cid))
+    slots = Slot.objects.filter(machine__host=buildmachine)
+    if cid is not None:
+      slots = slots.filter(cid=cid)
+    if build is not None:
+      # the slot might already be running another build
+      slots = slots.filter(build=build)
+    for slot in slots:
+      self.ReleaseSlot(slot, jobFailed)
+
+  def ReleaseSlot(self, slot, jobFailed):
+    # only release the slot when it is building
+    if slot.status == 'BUILDING' or slot.status == 'STOPPING':
       if jobFailed:
-        self.CancelWaitingJobsInQueue(machine.build)
+        self.CancelWaitingJobsInQueue(slot.build)
 
-      machine.status = 'STOPPING'
-      machine.save()
+      slot.status = 'STOPPING'
+      slot.save()
 
-      if machine.type == 'incus':
-        IncusContainer(buildmachine, machine, Logger(), '').stop()
-      elif machine.type == 'docker':
-        DockerContainer(buildmachine, machine, Logger(), '').stop()
-      elif machine.type == 'copr':
-        CoprContainer(buildmachine, machine, Logger(), '').stop()
+      self.GetContainer(slot, Logger(), '').stop()
 
-      machine.status = 'AVAILABLE'
-      machine.save()
+      slot.status = 'AVAILABLE'
+      slot.save()
 
-      if machine.build and machine.build.status == 'BUILDING':
-        machine.build.status = 'CANCELLED'
-        machine.build.save()
+      if slot.build and slot.build.status == 'BUILDING':
+        slot.build.status = 'CANCELLED'
+        slot.build.save()
+
+  def GiveBackSlot(self, slot, build):
+    # undo a claim of a slot that has not started the build, with the reverse of the conditional update
+    try:
+      Slot.objects.filter(id=slot.id).filter(build=build).filter(status='BUILDING'). \
+        update(status='AVAILABLE')
+    except Exception as e:
+      print("GiveBackSlot: cannot give back the slot " + str(slot) + ": " + str(e))
 
   def CanFindDependanciesBuilding(self, build):
-    machines = Machine.objects.filter(status='BUILDING'). \
+    machines = Slot.objects.filter(status='BUILDING'). \
         filter(build__user__username=build.user.username). \
         filter(build__project=build.project). \
         filter(build__branchname=build.branchname). \
         filter(build__distro=build.distro). \
         filter(build__release=build.release). \
         filter(build__arch=build.arch)
-    for row in machines:
-      # there is a machine building a package on the same queue (same user, project, branch, distro, release, arch)
-      # does this package actually depend on that other package?
-      dependantpackage = self.GetPackage(build.user.username, build.project, build.package, build.branchname)
-      requiredpackage = self.GetPackage(build.user.username, build.project, row.packagename, build.branchname)
-      result = self.DoesPackageDependOnOtherPackage(dependantpackage, requiredpackage)
-      if result:
-        print("cannot build " + build.packagename + " because it depends on another package")
-        return True
+    # there are machines building packages on the same queue (same user, project, branch, distro, release, arch)
+    # does this package actually depend on one of those other packages?
+    buildingpackages = set(machines.values_list('build__package', flat=True))
+    if not buildingpackages:
+      return False
+    project = Project.objects.filter(user=build.user).filter(name=build.project).first()
+    if project is None:
+      return False
+    requiredpackages = DependancyGraph.Get(project).GetRequiredPackages(build.package)
+    if requiredpackages & buildingpackages:
+      print("cannot build " + build.package + " because it depends on another package")
+      return True
     return False
 
+  def CanFindSameTargetBuilding(self, build):
+    # a waiting build of a package that is still building on the same target (user, project, branch, distro, release, arch)
+    # must wait for the running build, both would publish to the same repository.
+    # if the sources have changed in the meantime, SupersedeBuilds cancels the running build
+    building = Build.objects.filter(status='BUILDING').exclude(id=build.id). \
+        filter(user=build.user).filter(project=build.project).filter(package=build.package). \
+        filter(branchname=build.branchname).filter(distro=build.distro). \
+        filter(release=build.release).filter(arch=build.arch)
+    return building.exists()
+
   def CanFindMachineBuildingProject(self, username, projectname):
-    machine = Machine.objects.filter(status='BUILDING').filter(username=username).filter(projectname=projectname)
+    machine = Slot.objects.filter(status='BUILDING').filter(build__user__username=username).filter(build__project=projectname)
 
     if machine.exists():
           # there is a machine building a package of the specified project
@@ -178,148 +331,201 @@ class LightBuildServer:
     return False
 
   # this is called from Build.py buildpackage, and from LightBuildServer.py CalculatePackageOrder
-  def getPackagingInstructions(self, build):
+  def getPackagingInstructions(self, build, refresh=False):
+    # returns the path of a snapshot of the sources, that nobody changes while the build is using it.
+    # the snapshot must be released with releasePackagingInstructions.
+    # with refresh, the forge is asked for new sources in any case
     project = Project.objects.filter(name=build.project).filter(user=build.user).first()
     lbsproject = project.git_url
     git_project_name = project.git_url.strip('/').split('/')[-1]
-    pathSrc = settings.GIT_SRC_PATH+"/"+build.user.username+"/"
+    sourcecache = SourceCache()
 
     # first try with git branch master, to see if the branch is decided in the setup.sh. then there must be a config.yml
-    self.getPackagingInstructionsInternal(project, build, project.git_branch, lbsproject, git_project_name, pathSrc)
-
-    if not os.path.isfile(pathSrc+git_project_name+"/config.yml"):
-      self.getPackagingInstructionsInternal(project, build, build.branchname, lbsproject, git_project_name, pathSrc)
+    (pathSrc, reference) = self.getPackagingInstructionsInternal(sourcecache, project, build, project.git_branch, lbsproject, git_project_name, refresh)
+
+    # the caller only releases the snapshot when we return it
+    try:
+      build.sourcebranch = project.git_branch
+      if not os.path.isfile(pathSrc+git_project_name+"/config.yml"):
+        sourcecache.Release(reference)
+        reference = None
+        (pathSrc, reference) = self.getPackagingInstructionsInternal(sourcecache, project, build, build.branchname, lbsproject, git_project_name, refresh)
+        build.sourcebranch = build.branchname
+      build.sourcereference = reference
+
+      # the newest sources are available for the web interface as well
+      if self.IsSparseCheckout(project, build):
+        return pathSrc
+      latestPath = settings.GIT_SRC_PATH+"/"+build.user.username+"/"+git_project_name
+      os.makedirs(os.path.dirname(latestPath), exist_ok=True)
+      if os.path.isdir(latestPath) and not os.path.islink(latestPath):
+        shutil.rmtree(latestPath)
+      tmpLink = latestPath + "-" + str(os.getpid()) + "-" + str(get_ident())
+      os.symlink(os.path.abspath(pathSrc+git_project_name), tmpLink)
+      os.replace(tmpLink, latestPath)
+    except Exception:
+      sourcecache.Release(reference)
+      build.sourcereference = None
+      raise
     return pathSrc
 
-  def getPackagingInstructionsInternal(self, project, build, branchname, lbsproject, git_project_name, pathSrc):
-    os.makedirs(pathSrc, exist_ok=True)
-
-    needToDownload = True
-
-    #we want a clean clone
-    #but do not delete the tree if it is being used by another build
-    t = None
-    if os.path.isfile(pathSrc+git_project_name+'-lastused'):
-      t = os.path.getmtime(pathSrc+git_project_name+'-lastused')
-      # delete the tree only if it has not been used within the last 3 minutes
-      if (time.time() - t) < 3*60:
-        needToDownload = False
-      # update the timestamp
-      os.utime(pathSrc+git_project_name+'-lastused')
-    else:
-      open(pathSrc+git_project_name+'-lastused', 'a').close()
-
-    headers = {}
-    url = None
-    if project.git_type == 'gitea':
-      url = lbsproject + "/archive/" + branchname + ".tar.gz"
-    elif project.git_type == 'github':
-      url = lbsproject + "/archive/" + branchname + ".tar.gz"
-    elif project.git_type == 'gitlab':
-      url = lbsproject + "/repository/archive.tar.gz?ref=" + branchname
-      if project.git_private_token:
-        headers['PRIVATE-TOKEN'] = project.git_private_token
-
-    # check if the version we have is still uptodate
-    etagFile = pathSrc+git_project_name+'-etag'
-    if needToDownload and os.path.isfile(etagFile):
-      with open(etagFile, 'r') as content_file:
-        Etag = content_file.read()
-        headers['If-None-Match'] = Etag
-      r = requests.get(url, headers=headers)
-      if 'Etag' in r.headers and r.headers['Etag'] == '"' + Etag + '"':
-         needToDownload = False
-
-    if not needToDownload and os.path.isdir(pathSrc+git_project_name):
-      # we can reuse the existing source, it was used just recently, or has not changed on the server
-      self.StorePackageHashes(pathSrc+git_project_name, project, branchname)
+  def releasePackagingInstructions(self, build):
+    SourceCache().Release(getattr(build, 'sourcereference', None))
+    build.sourcereference = None
+
+  def getPackagingInstructionsInternal(self, sourcecache, project, build, branchname, lbsproject, git_project_name, refresh):
+    if project.git_type == 'git':
+      return self.getPackagingInstructionsFromMirror(sourcecache, project, build, branchname, git_project_name, refresh)
+    (url, headers) = ForgeClient.GetArchiveUrl(project, branchname)
+    (pathSrc, reference) = sourcecache.Get(url, headers, git_project_name, refresh)
+    try:
+      self.StorePackageHashes(pathSrc+git_project_name, project, branchname, sourcecache.GetDigests(pathSrc))
+    except Exception:
+      sourcecache.Release(reference)
+      raise
+    return (pathSrc, reference)
+
+  def IsSparseCheckout(self, project, build):
+    # the build of a package only needs the directory of the package
+    return project.git_type == 'git' and build is not None and bool(build.package)
+
+  def getPackagingInstructionsFromMirror(self, sourcecache, project, build, branchname, git_project_name, refresh):
+    mirror = GitMirror(sourcecache, project.git_url)
+    commit = mirror.Update(branchname, refresh)
+    toplevel = mirror.GetTopLevel(commit)
+    # git has the hash of each directory already: it only changes when something in the package has changed
+    self.UpdatePackageHashes(project, branchname,
+      {name: id for (name, (type, id)) in toplevel.items() if type == 'tree'})
+
+    paths = None
+    key = sourcecache.Hash("git " + commit)
+    if self.IsSparseCheckout(project, build):
+      # only the package and the configuration of the project
+      paths = [name for name in ('config.yml', build.package) if name in toplevel]
+      key = sourcecache.Hash("git " + commit + " " + " ".join(paths))
+    return sourcecache.GetEntry(key, git_project_name, lambda: mirror.Archive(commit, paths))
+
+  def ProcessPush(self, project, branchname):
+    # a new commit has been pushed to the forge: download the sources now,
+    # so that the builds start with the sources in the cache
+    git_project_name = project.git_url.strip('/').split('/')[-1]
+    sourcecache = SourceCache()
+    # updating the hashes marks the changed packages as dirty
+    (pathSrc, reference) = self.getPackagingInstructionsInternal(sourcecache, project, None, branchname,
+      project.git_url, git_project_name, True)
+    sourcecache.Release(reference)
+    if project.build_on_push:
+      builds = self.EnqueueBuildMatrix(project, branches=[branchname], onlyDirty=True)
+      print("ProcessPush: added %d builds of %s/%s to the queue" % (len(builds), project.user.username, project.name))
+
+  def StorePackageHashes(self, projectPathSrc, project, branchname, digests=None):
+    # update hash of each package
+    git_project_name = project.git_url.strip('/').split('/')[-1]
+    # the hashes of the files come with the snapshot, the manifest of the branch is for older snapshots
+    hasher = SourceHasher(settings.GIT_SRC_PATH + "/" + project.user.username + "/" + git_project_name + "." +
+      hashlib.sha1(branchname.encode('utf-8')).hexdigest() + ".manifest", digests)
+    packages = {package.name: package for package in Package.objects.filter(project=project)}
+    packagenames = [dir for dir in os.listdir(projectPathSrc) if dir in packages and os.path.isdir(projectPathSrc + "/" + dir)]
+    self.UpdatePackageHashes(project, branchname, hasher.HashPackages(projectPathSrc, packagenames), packages)
+
+  def UpdatePackageHashes(self, project, branchname, sourcehashes, packages=None):
+    # sourcehashes: package name => hash of the sources of the package
+    if packages is None:
+      packages = {package.name: package for package in Package.objects.filter(project=project)}
+    existing = {hash.package_id: hash for hash in PackageSrcHash.objects.filter(package__in=packages.values()).filter(branchname=branchname)}
+    newhashes = []
+    changedhashes = []
+    changed = []
+    for packagename, sourcehash in sourcehashes.items():
+      package = packages.get(packagename)
+      if package is None:
+        continue
+      hash = existing.get(package.id)
+      if hash is None:
+        newhashes.append(PackageSrcHash(package=package, branchname=branchname, sourcehash=sourcehash))
+      elif not hash.sourcehash == sourcehash:
+        changed.append((package, hash.sourcehash))
+        hash.sourcehash = sourcehash
+        changedhashes.append(hash)
+    with transaction.atomic():
+      PackageSrcHash.objects.bulk_create(newhashes)
+      PackageSrcHash.objects.bulk_update(changedhashes, ['sourcehash'])
+
+    if changed:
+      self.MarkPackagesAsDirty(project, [package.name for (package, oldsourcehash) in changed], branchname)
+    for (package, oldsourcehash) in changed:
+      self.SupersedeBuilds(package, branchname, oldsourcehash)
+
+  def SetBuildSourceHash(self, build):
+    # remember which sources are being built, so that the build can be superseded by newer sources
+    package = self.GetPackage(build.user.username, build.project, build.package, build.branchname)
+    hash = PackageSrcHash.objects.filter(package=package). \
+        filter(branchname=getattr(build, 'sourcebranch', build.branchname)).first()
+    if hash:
+      build.sourcehash = hash.sourcehash
+      Build.objects.filter(id=build.id).update(sourcehash=hash.sourcehash)
+
+  def SupersedeBuilds(self, package, branchname, oldsourcehash):
+    # the running builds of the old sources are outdated: stop them, and build the new sources instead
+    if not settings.SUPERSEDE_RUNNING_BUILDS:
       return
-
-    # delete the working tree
-    if os.path.isdir(pathSrc+git_project_name):
-      shutil.rmtree(pathSrc+git_project_name)
-
-    sourceFile = f"{pathSrc}/{branchname}.tar.gz"
-    if os.path.isfile(sourceFile):
-      os.remove(sourceFile)
-    r = requests.get(url, headers=headers)
-    if r.status_code == 401:
-      raise Exception("problem downloading the repository, access denied")
-    elif not r.status_code == 200:
-      raise Exception("problem downloading the repository " + url + ", HTTP error code " + str(r.status_code))
-
-    chunk_size = 100000
-    with open(sourceFile, 'wb') as fd:
-      for chunk in r.iter_content(chunk_size):
-        fd.write(chunk)
-    if 'Etag' in r.headers:
-      Etag = r.headers['Etag']
-      with open(etagFile, 'w') as fd:
-        fd.write(Etag.strip('"'))
-
-    shell = Shell(Logger())
-    if project.git_type == 'gitea':
-      cmd="cd " + pathSrc + ";"
-      cmd+=f"tar xzf {branchname}.tar.gz"
-      shell.executeshell(cmd)
-    elif project.git_type == 'github':
-      cmd="cd " + pathSrc + ";"
-      cmd+=f"tar xzf {branchname}.tar.gz; mv {git_project_name}-{branchname} {git_project_name}"
-      shell.executeshell(cmd)
-    elif project.git_type == 'gitlab':
-      cmd="cd " + pathSrc + ";"
-      cmd+=f"tar xzf {branchname}.tar.gz; mv {git_project_name}-{branchname}-* {git_project_name}"
-      shell.executeshell(cmd)
-
-    if os.path.isfile(sourceFile):
-      os.remove(sourceFile)
-    if not os.path.isdir(pathSrc+git_project_name):
-      raise Exception("Problem with cloning the git repo")
-
-    self.StorePackageHashes(pathSrc+git_project_name, project, branchname)
-
-  def StorePackageHashes(self, projectPathSrc, project, branchname):
-    shell = Shell(Logger())
-    for dir in os.listdir(projectPathSrc):
-      if os.path.isdir(projectPathSrc + "/" + dir):
-        packagename = os.path.basename(dir)
-        # update hash of each package
-        cmd = "find " + projectPathSrc + "/" + dir + " -type f -print0 | sort -z | xargs -0 sha1sum | sha1sum | awk '{print $1}'"
-        sourcehash = shell.evaluateshell(cmd)
-        # print(packagename + " " + hash)
-        package = Package.objects.filter(project = project).filter(name=packagename).first()
-        if package:
-          hash, created = PackageSrcHash.objects.get_or_create(package=package,branchname=branchname)
-          if not hash.sourcehash == sourcehash:
-            hash.sourcehash = sourcehash
-            hash.save()
-            if not created:
-                self.MarkPackageAsDirty(package, branchname)
+    project = package.project
+    builds = Build.objects.filter(status='BUILDING').filter(superseded=False). \
+        filter(user=project.user).filter(project=project.name).filter(package=package.name). \
+        filter(sourcehash=oldsourcehash)
+    if branchname != project.git_branch:
+      builds = builds.filter(branchname=branchname)
+    superseded = False
+    for build in builds:
+      # another process might have finished or superseded the build in the meantime
+      if not Build.objects.filter(id=build.id).filter(status='BUILDING').filter(superseded=False). \
+          update(status='CANCELLED', superseded=True):
+        continue
+      print("SupersedeBuilds: build %d of %s is outdated" % (build.id, self.GetLbsName(build)))
+      superseded = True
+      # several waiting builds of the same package are coalesced into one
+      if self.GetJob(project, build.package, build.branchname, build.distro, build.release, build.arch, True) is None:
+        self.AddToBuildQueue(project, build.package, build.branchname, build.distro, build.release, build.arch)
+    if superseded:
+      # the scheduler that runs the build stops the container, see StopSupersededBuilds.
+      # update does not send the post_save signal
+      from lib.Scheduler import NotifyScheduler
+      transaction.on_commit(NotifyScheduler)
+
+  def StopSupersededBuilds(self):
+    # stop the containers of the superseded builds that are running in this process
+    slots = Slot.objects.filter(status='BUILDING').filter(build__superseded=True). \
+      filter(build__scheduler=self.GetSchedulerName())
+    for slot in slots:
+      # the build thread might release the slot at the same time
+      if not Slot.objects.filter(id=slot.id).filter(status='BUILDING').update(status='STOPPING'):
+        continue
+      slot.status = 'STOPPING'
+      # stopping the container can take a while, the scheduler must not wait for it
+      thread = Thread(target = self.ReleaseSlot, args = (slot, False))
+      thread.start()
+      self.buildthreads.append(thread)
 
   # this changes the status of the package, and requires itself and all depending packages to be rebuilt
   def MarkPackageAsDirty(self, package, branchname):
-    # invalidate the package on all distros/release/arch combinations
-    packagebuildstatus = PackageBuildStatus.objects.filter(package=package).filter(branchname=branchname)
-    for p in packagebuildstatus:
-        p.dirty = True
-        p.save()
-
-    # find all packages depending on it, and invalidate their builds as well
-    packagedependancy = PackageDependancy.objects.filter(requiredpackage=package)
-    for p in packagedependancy:
-      otherpackagebuildstatus = PackageBuildStatus.objects.filter(package = p.dependantpackage). \
-        filter(branchname=packagebuildstatus.branchname).first()
-      if otherpackagebuildstatus:
-        self.MarkPackageAsDirty(otherpackagebuildstatus, branchname)
-
-  def MarkProjectAsDirty(self, username, projectname, branchname, distro, release, arch):
-    project = Project.objects.filter(user__username=username).filter(name=projectname).first()
-    packagebuildstatus = PackageBuildStatus.objects.filter(package=project.package). \
+    return self.MarkPackagesAsDirty(package.project, [package.name], branchname)
+
+  def MarkPackagesAsDirty(self, project, packagenames, branchname):
+    # invalidate the packages and all packages depending on them, on all distros/release/arch combinations.
+    # returns the number of invalidated build states
+    graph = DependancyGraph.Get(project)
+    dirty = set(packagenames)
+    for packagename in packagenames:
+      dirty |= graph.GetDependantPackages(packagename)
+    packageids = list(Package.objects.filter(project=project).filter(name__in=dirty).values_list('id', flat=True))
+    return PackageBuildStatus.objects.filter(package_id__in=packageids).filter(branchname=branchname). \
+      update(dirty=True)
+
+  def MarkProjectAsDirty(self, project, branchname, distro, release, arch):
+    return PackageBuildStatus.objects.filter(package__project=project). \
         filter(branchname=branchname). \
-        filter(distro=distro).filter(release=release).filter(arch=arch)
-    for p in packagebuildstatus:
-      packagebuildstatus.dirty = True
-      packagebuildstatus.save()
+        filter(distro=distro).filter(release=release).filter(arch=arch). \
+        update(dirty=True)
 
   def MarkPackageAsBuilt(self, build):
     project = Project.objects.filter(user__username=build.user.username).filter(name=build.project).first()
@@ -336,92 +542,188 @@ class LightBuildServer:
         packagebuildstatus.save()
 
   def GetPackage(self, username, projectname, packagename, branchname):
-    package = Package.objects.filter(projectname=projectname).filter(packagename=packagename).filter(branchname=branchname).first()
+    package = Package.objects.filter(project__user__username=username).filter(project__name=projectname).filter(name=packagename).first()
     return package
 
   def DoesPackageDependOnOtherPackage(self, dependantpackage, requiredpackage):
     if requiredpackage is not None and dependantpackage is not None:
       # find all packages that this package depends on, recursively
-      dep = PackageDependancy.objects.filter(dependantpackage=dependantpackage)
-      if not dep is None:
-        for row in dep:
-          if row.requiredpackage == requiredpackage:
-            print(f"DoesPackageDependOnOtherPackage: {dependantpackage.id} depends on {requiredpackage.id}")
-            return True
-          if self.DoesPackageDependOnOtherPackage(row.requiredpackage, requiredpackage):
-            return True
+      graph = DependancyGraph.Get(dependantpackage.project)
+      if requiredpackage.name in graph.GetRequiredPackages(dependantpackage.name):
+        print(f"DoesPackageDependOnOtherPackage: {dependantpackage.id} depends on {requiredpackage.id}")
+        return True
     return False
 
   # Returns True or False
   def NeedToRebuildPackage(self, username, projectname, packagename, branchname, distro, release, arch):
-    result = True
-    cursor = con.execute("SELECT * FROM package WHERE username = ? AND projectname = ? AND packagename = ? AND branchname = ?", (username, projectname, packagename, branchname))
-    row = cursor.fetchone()
-    if row is not None:
-      packageid = row['id']
-      stmt = "SELECT dirty FROM packagebuildstatus WHERE packageid = ? AND distro = ? AND release = ? AND arch = ? AND dirty = 0"
-      cursor = con.execute(stmt, (packageid, distro, release, arch))
-      row = cursor.fetchone()
-      if row is not None:
-        print(" no need to rebuild " + packagename + " " + str(packageid))
-        result = False
-    return result
+    packageid = PackageBuildStatus.objects.filter(package__project__user__username=username). \
+        filter(package__project__name=projectname).filter(package__name=packagename). \
+        filter(branchname=branchname).filter(distro=distro).filter(release=release).filter(arch=arch). \
+        filter(dirty=False).values_list('package_id', flat=True).first()
+    if packageid is not None:
+      print(" no need to rebuild " + packagename + " " + str(packageid))
+      return False
+    return True
 
   def CalculatePackageOrder(self, project, branchname, distro, release, arch):
+    # returns the waves of packages that can be built at the same time,
+    # and the packages in circular dependancies
+    build = Build(user=project.user, project=project.name, package=None, branchname=branchname, distro=distro, release=release, arch=arch)
     # get the sources of the packaging instructions
-    self.getPackagingInstructions(project, branchname)
-
-    build = Build(project=project, package=None, branchname=branchname, distro=distro, release=release, arch=arch)
-    buildHelper = BuildHelperFactory.GetBuildHelper(distro, None, build)
-    return buildHelper.CalculatePackageOrder(distro, release, arch)
-
-  def AddToBuildQueue(self, project, packagename, branchname, distro, release, arch):
-    # find if this project depends on other projects
-    DependsOnOtherProjects={}
-    pkgs = Package.objects.filter(project = project).all()
-    pkg = Package.objects.filter(project = project).filter(name=packagename).first()
+    build.pathSrc = self.getPackagingInstructions(build)
+    try:
+      buildHelper = BuildHelperFactory.GetBuildHelper(distro, None, build)
+      waves = buildHelper.CalculatePackageOrder(distro, release, arch)
+      return (waves, buildHelper.cycles)
+    finally:
+      self.releasePackagingInstructions(build)
+
+  def NewBuild(self, project, pkg, branchname, distro, release, arch):
     avoiddocker = project.use_docker == False
     avoidlxc = project.use_lxc == False
     buildmachine = pkg.machine
     if buildmachine is None:
       buildmachine = project.machine
 
-    build = Build(status='WAITING', user=project.user, project=project.name, secret=not project.visible, \
-        package=packagename, branchname=branchname, distro=distro, release=release, arch=arch, \
-        avoiddocker=avoiddocker, avoidlxc=avoidlxc, designated_build_machine=buildmachine)
-    build.save()
+    return Build(status='WAITING', user=project.user, project=project.name, secret=not project.visible, \
+        package=pkg.name, branchname=branchname, distro=distro, release=release, arch=arch, \
+        avoiddocker=avoiddocker, avoidlxc=avoidlxc, \
+        designated_build_machine=buildmachine.host if buildmachine else None, \
+        cpus=pkg.cpus, memory=pkg.memory)
+
+  def AddToBuildQueue(self, project, packagename, branchname, distro, release, arch):
+    pkg = Package.objects.filter(project = project).filter(name=packagename).first()
+    self.NewBuild(project, pkg, branchname, distro, release, arch).save()
+
+  def EnqueueBuildMatrix(self, project, packagenames=None, branches=None, buildtargets=None, onlyDirty=False):
+    # add the builds for all packages x branches x buildtargets (distro/release/arch) to the queue.
+    # without packagenames, branches or buildtargets, all that are configured for the packages are used.
+    # builds that are already waiting or building are skipped.
+    # with onlyDirty, packages that have been built since their sources changed are skipped.
+    # returns the new builds, in the order of packagenames
+    packages = Package.objects.filter(project=project).select_related('machine', 'project'). \
+        prefetch_related('distro_set', 'branch_set')
+    if packagenames is not None:
+      packages = packages.filter(name__in=packagenames)
+    packages = list(packages)
+    if packagenames is not None:
+      order = {name: i for i, name in enumerate(packagenames)}
+      packages.sort(key=lambda pkg: order[pkg.name])
+
+    existing = set(Build.objects.filter(user=project.user).filter(project=project.name). \
+        filter(status__in=('WAITING', 'BUILDING')).filter(hanging=False). \
+        values_list('package', 'branchname', 'distro', 'release', 'arch'))
+    clean = set()
+    if onlyDirty:
+      clean = set(PackageBuildStatus.objects.filter(package__project=project).filter(dirty=False). \
+        values_list('package__name', 'branchname', 'distro', 'release', 'arch'))
+
+    builds = []
+    for pkg in packages:
+      for (branchname, distro, release, arch) in self.GetBuildMatrix(pkg, branches, buildtargets):
+        key = (pkg.name, branchname, distro, release, arch)
+        if key in existing or key in clean:
+          continue
+        existing.add(key)
+        builds.append(self.NewBuild(project, pkg, branchname, distro, release, arch))
+
+    if builds:
+      with transaction.atomic():
+        Build.objects.bulk_create(builds)
+        # bulk_create does not send the post_save signal
+        from lib.Scheduler import NotifyScheduler
+        transaction.on_commit(NotifyScheduler)
+    return builds
+
+  def GetBuildMatrix(self, pkg, branches=None, buildtargets=None):
+    # the (branchname, distro, release, arch) combinations that are configured for the package,
+    # limited to the given branches and buildtargets
+    pkgbranches = pkg.get_branches()
+    if branches is not None:
+      pkgbranches = [b for b in branches if b in pkgbranches]
+    pkgtargets = pkg.get_buildtargets()
+    if buildtargets is not None:
+      pkgtargets = [t for t in buildtargets if t in pkgtargets]
+    return [(branchname,) + tuple(buildtarget.split("/")) for branchname in pkgbranches for buildtarget in pkgtargets]
+
+  def GetImpact(self, project, packagename, branches=None, buildtargets=None):
+    # the packages that depend on the package, and the builds that a change of the package would need
+    graph = DependancyGraph.Get(project)
+    dependants = graph.GetDependantPackages(packagename)
+    packages = Package.objects.filter(project=project).filter(name__in=dependants | {packagename}). \
+        select_related('project').prefetch_related('distro_set', 'branch_set')
+    clean = set(PackageBuildStatus.objects.filter(package__project=project).filter(dirty=False). \
+      filter(package__name__in=dependants | {packagename}). \
+      values_list('package__name', 'branchname', 'distro', 'release', 'arch'))
+
+    durations = self.GetAverageBuildDurations([Build(user=project.user, project=project.name)])
+    # for packages that have never been built, assume an average duration
+    defaultDuration = sum(durations.values()) / len(durations) if durations else 0
+    builds = []
+    estimate = 0
+    for pkg in packages:
+      duration = durations.get((project.user_id, project.name, pkg.name))
+      for (branchname, distro, release, arch) in self.GetBuildMatrix(pkg, branches, buildtargets):
+        builds.append({'package': pkg.name, 'branch': branchname, 'distro': distro, 'release': release, 'arch': arch,
+          'clean': (pkg.name, branchname, distro, release, arch) in clean,
+          'duration': round(duration) if duration is not None else None})
+        estimate += duration if duration is not None else defaultDuration
+
+    return {
+      'package': packagename,
+      'dependants': sorted(dependants),
+      'builds': builds,
+      'estimated_seconds': round(estimate),
+    }
 
   def BuildProject(self, project, branchname, distro, release, arch, reset = False):
     if reset == True:
       self.MarkProjectAsDirty(project, branchname, distro, release, arch)
 
-    packages=self.CalculatePackageOrder(project, branchname, distro, release, arch)
+    (waves, cycles) = self.CalculatePackageOrder(project, branchname, distro, release, arch)
 
-    if packages is None:
-      message="Error: circular dependancy!"
+    if waves is None:
+      message = "Error: circular dependancy! " + "; ".join(", ".join(cycle) for cycle in cycles)
     else:
-      message=""
-      for packagename in packages:
-
-        if not self.NeedToRebuildPackage(project, packagename, branchname, distro, release, arch):
-          continue
-
-        # add package to build queue
-        message += packagename + ", "
-        job = self.GetJob(project, packagename, branchname, distro, release, arch, True)
-        if job is None:
-          self.AddToBuildQueue(project, packagename, branchname, distro, release, arch)
+      # the packages of a wave do not depend on each other, and can be built at the same time.
+      # CanFindDependanciesBuilding holds back the next wave until its required packages are built
+      builds = self.EnqueueBuildMatrix(project, [package for wave in waves for package in wave],
+        [branchname], [distro + "/" + release + "/" + arch], onlyDirty=True)
+      queued = set(build.package for build in builds)
+      message = " | ".join(", ".join(p for p in wave if p in queued) for wave in waves if queued.intersection(wave))
 
     return message
 
   def BuildProjectWithBranch(self, project, packagename, branchname, distro, release, arch):
+    # the sources are fetched by the scheduler when it starts the build, not in the web request
     job = self.GetJob(project, packagename, branchname, distro, release, arch, True)
     if job is None:
       self.AddToBuildQueue(project, packagename, branchname, distro, release, arch)
       return True
+    if job.status == 'BUILDING' and settings.SUPERSEDE_RUNNING_BUILDS:
+      # the running build might be building outdated sources.
+      # the new build waits for the running build, see CanFindSameTargetBuilding,
+      # unless updating the source hashes supersedes the running build
+      waiting = Build.objects.filter(user=project.user).filter(project=project.name). \
+        filter(package=packagename).filter(branchname=branchname).filter(distro=distro). \
+        filter(release=release).filter(arch=arch).filter(status='WAITING').exists()
+      if not waiting:
+        self.AddToBuildQueue(project, packagename, branchname, distro, release, arch)
+        return True
     return False
 
-  def attemptToFindBuildMachine(self, build):
+  def StartBuild(self, build):
+    lbs = Builder(self, Logger(build))
+    thread = Thread(target = lbs.buildpackage, args = (build,))
+    thread.start()
+    self.buildthreads = [t for t in self.buildthreads if t.is_alive()]
+    self.buildthreads.append(thread)
+
+  def attemptToFindBuildMachine(self, build, machines=None):
+
+    # 0: check if the same package is building for the same target => return False
+    if self.CanFindSameTargetBuilding(build):
+      return False
 
     # 1: check if there is a package building that this package depends on => return False
     if self.CanFindDependanciesBuilding(build):
@@ -433,17 +735,28 @@ class LightBuildServer:
         if self.CanFindMachineBuildingProject(build.username, DependantProjectName):
           return False
 
-    lbs = Builder(self, Logger(build))
-    lbsName=self.GetLbsName(build)
-    # get name of available slot
-    buildmachine=self.GetAvailableBuildMachine(build)
-    if buildmachine:
+    # get available slot
+    slot=self.GetAvailableBuildMachine(build, machines)
+    if slot:
+      started = self.now()
+      try:
+        # claim the build as well, another scheduler might have started it on another machine
+        claimed = Build.objects.filter(id=build.id).filter(status='WAITING'). \
+          update(status='BUILDING', started=started, heartbeat=started, scheduler=self.GetSchedulerName())
+      except Exception:
+        self.GiveBackSlot(slot, build)
+        raise
+      if not claimed:
+        self.GiveBackSlot(slot, build)
+        return False
       build.status = 'BUILDING'
-      build.started = timezone.now()
-      build.buildmachine = buildmachine
-      build.save()
-      thread = Thread(target = lbs.buildpackage, args = (build,))
-      thread.start()
+      build.started = started
+      build.heartbeat = started
+      build.buildmachine = slot.host
+      build.buildslot = slot
+      build.scheduler = self.GetSchedulerName()
+      self.UpdateMachineCache(slot.machine, build)
+      self.StartBuild(build)
       return True
     return False
 
@@ -451,10 +764,17 @@ class LightBuildServer:
   def ProcessBuildQueue(self):
       # loop from left to right
       # check if a project might be ready to build
-      builds = Build.objects.filter(status='WAITING')
-      for build in builds:
-        if self.attemptToFindBuildMachine(build):
-          time.sleep(10)
+      self.StopSupersededBuilds()
+      # the available machines are fetched once, and claimed in one pass
+      machines = self.GetAvailableBuildMachines()
+      builds = self.policy.Sort(list(Build.objects.filter(status='WAITING')))
+      # share the machines between the users and projects
+      fairshare = FairShare(builds, self.now)
+      for build in fairshare:
+        if not machines:
+          break
+        if self.attemptToFindBuildMachine(build, machines):
+          fairshare.Started(build)
 
       self.CheckForHangingBuild()
 
@@ -487,6 +807,18 @@ class LightBuildServer:
         build = build.filter(Q(Q(status='WAITING') | Q(status='BUILDING')))
       return build.first()
 
+  def GetAverageBuildDurations(self, builds):
+      # average duration in seconds of the finished builds, by (user id, project, package)
+      result = {}
+      for (user_id, projectname) in set((b.user_id, b.project) for b in builds):
+        rows = Build.objects.filter(status='FINISHED').filter(user_id=user_id).filter(project=projectname). \
+          filter(started__isnull=False).filter(finished__isnull=False). \
+          values('package'). \
+          annotate(duration=Avg(ExpressionWrapper(F('finished') - F('started'), output_field=DurationField())))
+        for row in rows:
+          result[(user_id, projectname, row['package'])] = row['duration'].total_seconds()
+      return result
+
   def GetBuildQueue(self, auth_user):
       builds = Build.objects.filter(status='WAITING')
       if auth_user.is_anonymous:
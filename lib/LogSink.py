@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""LogSink: writes the log lines of all builds of this process to the database in batches"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+
+import time
+import atexit
+import logging
+from collections import deque
+from threading import Thread, Condition, Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from builder.models import Build, Log
+
+logger = logging.getLogger(__name__)
+
+class LogSink:
+  'one background thread per process collects the log lines, and stores them with bulk_create'
+
+  instance = None
+  instanceLock = Lock()
+
+  # a batch that cannot be stored is tried again this often, before its lines are dropped
+  attempts = 3
+
+  def __init__(self, flushLines, flushInterval, maxLines, maxWait):
+    # write when this many lines are waiting, or when the oldest line has waited this many seconds
+    self.flushLines = flushLines
+    self.flushInterval = flushInterval
+    # the build threads wait when this many lines are waiting, until the database has caught up,
+    # but not longer than maxWait seconds
+    self.maxLines = maxLines
+    self.maxWait = maxWait
+    # number of lines that could not be written, and that have been dropped by Put since the buffer was full
+    self.dropped = 0
+    self.droppedByPut = 0
+    self.lines = deque()
+    self.condition = Condition()
+    # number of lines that have been added, and that have been written or dropped
+    self.added = 0
+    self.done = 0
+    self.flushRequested = False
+    self.firstLine = 0
+    self.thread = Thread(target=self.Run, daemon=True)
+    self.thread.start()
+
+  @classmethod
+  def Get(cls):
+    with cls.instanceLock:
+      if cls.instance is None:
+        cls.instance = LogSink(settings.LOG_FLUSH_LINES, settings.LOG_FLUSH_INTERVAL, settings.LOG_BUFFER_MAX_LINES,
+          settings.LOG_BUFFER_MAX_WAIT)
+        atexit.register(cls.instance.Flush, 10)
+      return cls.instance
+
+  def Put(self, buildid, line):
+    # this does not access the database. only if the database is far behind, we wait for the flusher.
+    # returns False if the line has been dropped, because a dead database must not stop the builds
+    with self.condition:
+      deadline = time.monotonic() + self.maxWait
+      while len(self.lines) >= self.maxLines:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          if not self.droppedByPut:
+            logger.error("LogSink: the database is too far behind, dropping the log lines of the builds")
+          self.droppedByPut += 1
+          self.dropped += 1
+          return False
+        self.condition.notify_all()
+        self.condition.wait(remaining)
+      if self.droppedByPut:
+        logger.error("LogSink: dropped %d log lines while the database was too far behind", self.droppedByPut)
+        self.droppedByPut = 0
+      if not self.lines:
+        # the flusher waits for the first line, and then at most flushInterval
+        self.firstLine = time.monotonic()
+        self.condition.notify_all()
+      self.lines.append(Log(build_id=buildid, line=line, created=timezone.now()))
+      self.added += 1
+      if len(self.lines) == self.flushLines:
+        self.condition.notify_all()
+      return True
+
+  def Flush(self, timeout=None):
+    # wait until all lines that have been added so far are in the database
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    with self.condition:
+      target = self.added
+      self.flushRequested = True
+      self.condition.notify_all()
+      while self.done < target:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+          return False
+        self.condition.wait(remaining)
+    return True
+
+  def TakeBatch(self):
+    with self.condition:
+      while not self.flushRequested and len(self.lines) < self.flushLines:
+        if not self.lines:
+          self.condition.wait()
+          continue
+        remaining = self.firstLine + self.flushInterval - time.monotonic()
+        if remaining <= 0:
+          break
+        self.condition.wait(remaining)
+      self.flushRequested = False
+      batch = [self.lines.popleft() for i in range(min(len(self.lines), self.flushLines))]
+      if self.lines:
+        # the remaining lines have waited already
+        self.firstLine = time.monotonic() - self.flushInterval
+      # there is room again for the waiting build threads
+      self.condition.notify_all()
+      return batch
+
+  def Store(self, batch):
+    for attempt in range(self.attempts):
+      try:
+        close_old_connections()
+        Log.objects.bulk_create(batch)
+        # lines from a build show that the build is still alive
+        Build.objects.filter(id__in=set(log.build_id for log in batch)).update(heartbeat=timezone.now())
+        return
+      except Exception:
+        logger.exception("LogSink: cannot store %d log lines, attempt %d of %d", len(batch), attempt + 1, self.attempts)
+        time.sleep(self.flushInterval)
+    logger.error("LogSink: dropped %d log lines of the builds %s", len(batch),
+      ", ".join(str(buildid) for buildid in sorted(set(log.build_id for log in batch))))
+    with self.condition:
+      self.dropped += len(batch)
+
+  def Run(self):
+    while True:
+      batch = self.TakeBatch()
+      if batch:
+        self.Store(batch)
+      with self.condition:
+        self.done += len(batch)
+        self.condition.notify_all()
@@ -36,12 +36,12 @@ from django.utils import timezone
 from django.utils.timezone import make_aware
 
 from builder.models import Build, Log
+from lib.LogSink import LogSink
 
 class Logger:
   'collect all the output'
 
   def __init__(self, build=None):
-    self.lastTimeUpdate = timezone.now()
     self.startTimer()
     self.logspath = settings.LOGS_PATH
     self.emailserver = settings.EMAIL_SERVER
@@ -53,7 +53,6 @@ class Logger:
 
   def startTimer(self):
     self.starttime = timezone.now()
-    self.linebuffer = []
     self.buffer = ""
     self.error = False
     self.lastLine = ""
@@ -72,18 +71,11 @@ class Logger:
       timeprefix = "[" + str(int(timeseconds/60/60)).zfill(2) + ":" + str(int(timeseconds/60)%60).zfill(2) + ":" + str(timeseconds%60).zfill(2)  + "] "
       if "LBSERROR" in newOutput:
         self.error = True
-      self.linebuffer.append(timeprefix + newOutput)
 
-      # only write new lines every other second, to avoid putting locks on the database
-      # also write often enough, do not collect too many lines
-      if self.build and ((timezone.now() - self.lastTimeUpdate).total_seconds() > 2 or len(self.linebuffer) > 20):
-
-        # write the lines to database, and then dump to file when build is finished
-        for line in self.linebuffer:
-            log = Log(build = self.build, line = line, created = timezone.now())
-            log.save()
-        self.linebuffer = []
-      self.lastTimeUpdate = timezone.now()
+      # the lines are written to the database in batches by another thread, to avoid putting locks on the database.
+      # they are dumped to file when the build is finished
+      if self.build and self.build.id:
+        LogSink.Get().Put(self.build.id, timeprefix + newOutput)
 
       # sometimes we get incomplete bytes, and would get an ordinal not in range error
       # just ignore the exception...
@@ -141,10 +133,7 @@ class Logger:
   def store(self, DeleteLogAfterDays, KeepMinimumLogs, logpath):
     if self.build and self.build.id:
       # store buffered lines to the database
-      for line in self.linebuffer:
-        log = Log(build = self.build, line = line, created=timezone.now())
-        log.save()
-      self.linebuffer = []
+      LogSink.Get().Flush()
 
     LogPath = self.logspath + "/" + logpath
     if not os.path.exists(LogPath):
@@ -179,6 +168,7 @@ class Logger:
   def clean(self):
     # clear log from database
     if self.build:
+      LogSink.Get().Flush()
       logs = Log.objects.filter(build = self.build)
       logs.delete()
 
@@ -23,6 +23,7 @@ import sys
 import os
 import time
 import socket
+import tempfile
 from pathlib import Path
 
 from django.conf import settings
@@ -35,6 +36,8 @@ class RemoteContainer:
     self.hostname = containername
     self.containertype = containertype
     self.staticMachine = configBuildMachine.static
+    # several slots of the machine can run builds at the same time
+    self.sharedHost = configBuildMachine.slots > 1
 
     self.port = str(configBuildMachine.port)
     self.cid = configBuildMachine.cid
@@ -62,12 +65,15 @@ class RemoteContainer:
     if not configBuildMachine.private_key or configBuildMachine.private_key=="TODO":
         raise Exception(f"please add a private key for machine {containername}")
 
-    self.SSHContainerPath = f"{settings.SSH_TMP_PATH}/{containername}/"
+    # each slot has its own key file, the slots of a machine are running at the same time
+    self.SSHContainerPath = f"{settings.SSH_TMP_PATH}/{containername}/{self.cid}/"
     Path(self.SSHContainerPath).mkdir(parents=True, exist_ok=True)
-    with open(self.SSHContainerPath + 'container_rsa', 'w') as f:
-        f.write(configBuildMachine.private_key)
+    # write the key to a temporary file and rename it, so that ssh never reads a partially written key.
     # only the user can read and write this file
-    os.chmod(self.SSHContainerPath + 'container_rsa', 0o600)
+    fd, tmpname = tempfile.mkstemp(dir=self.SSHContainerPath)
+    with os.fdopen(fd, 'w') as f:
+        f.write(configBuildMachine.private_key)
+    os.replace(tmpname, self.SSHContainerPath + 'container_rsa')
 
     self.logger = logger
     self.shell = Shell(logger)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""RpmSpec: the macros, conditions and dependancies of a spec file, without rpmbuild"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+
+import re
+from functools import lru_cache
+
+# %{name}, %{?name}, %{!?name:text}, %{with name}, %name and %%
+MACRO = re.compile(r'%(?:(%)|\{(!?\??!?)([\w]+)(?:([: ])([^{}]*))?\}|([A-Za-z_]\w*))')
+TOKEN = re.compile(r'\s*(?:(\d+)|"([^"]*)"|(\|\||&&|==|!=|<=|>=|<|>|!|\(|\))|([^\s()!<>=&|"]+))')
+COMPARISONS = {
+  '==': lambda a, b: a == b,
+  '!=': lambda a, b: a != b,
+  '<': lambda a, b: a < b,
+  '>': lambda a, b: a > b,
+  '<=': lambda a, b: a <= b,
+  '>=': lambda a, b: a >= b,
+}
+
+class RpmMacros:
+  'the macros of a spec file. the values are expanded when they are defined'
+
+  def __init__(self, macros):
+    self.macros = {}
+    for name, value in macros.items():
+      self.Define(name, value)
+
+  def Define(self, name, value):
+    self.macros[name] = self.Expand(str(value))
+
+  def Expand(self, text, condition=False):
+    # in a condition, an undefined macro is 0, like the old ReplaceGlobals did
+    if '%' not in text:
+      return text
+    def replace(match):
+      (percent, flags, name, separator, argument, bare) = match.groups()
+      if percent:
+        return match.group(0)
+      if bare:
+        if bare in self.macros:
+          return self.macros[bare]
+        return "0" if condition else match.group(0)
+      if separator == ' ' and name in ('with', 'without'):
+        enabled = ("with_" + argument.strip()) in self.macros
+        return "1" if enabled == (name == 'with') else "0"
+      defined = name in self.macros
+      if '?' in flags:
+        if '!' in flags:
+          defined = not defined
+        if separator == ':':
+          return argument if defined else ""
+        return self.macros.get(name, "") if defined else ""
+      if defined:
+        return self.macros[name]
+      return "0" if condition else match.group(0)
+    # the inner macros are expanded first, eg. %{?fedora:%{fedora}}
+    for depth in range(10):
+      expanded = MACRO.sub(replace, text)
+      if expanded == text:
+        break
+      text = expanded
+    return text
+
+@lru_cache(maxsize=4096)
+def EvaluateCondition(expression):
+  # the expression of %if, after the macros have been expanded. the same conditions appear in many spec files
+  tokens = []
+  position = 0
+  expression = expression.strip()
+  while position < len(expression):
+    match = TOKEN.match(expression, position)
+    if not match or match.end() == position:
+      raise Exception("invalid condition: " + expression)
+    position = match.end()
+    (number, string, operator, word) = match.groups()
+    if number is not None:
+      tokens.append(('value', int(number)))
+    elif string is not None:
+      tokens.append(('value', string))
+    elif operator is not None:
+      tokens.append(('op', operator))
+    elif word is not None:
+      tokens.append(('value', word))
+  parser = ConditionParser(tokens)
+  result = parser.Or()
+  if parser.position != len(tokens):
+    raise Exception("invalid condition: " + expression)
+  return bool(result)
+
+class ConditionParser:
+  'recursive descent over the tokens of a condition: || && ! comparisons and parentheses'
+
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.position = 0
+
+  def Peek(self):
+    if self.position < len(self.tokens):
+      return self.tokens[self.position]
+    return (None, None)
+
+  def Take(self, operator):
+    if self.Peek() == ('op', operator):
+      self.position += 1
+      return True
+    return False
+
+  def Or(self):
+    result = self.And()
+    while self.Take('||'):
+      right = self.And()
+      result = 1 if (result or right) else 0
+    return result
+
+  def And(self):
+    result = self.Not()
+    while self.Take('&&'):
+      right = self.Not()
+      result = 1 if (result and right) else 0
+    return result
+
+  def Not(self):
+    if self.Take('!'):
+      return 0 if self.Not() else 1
+    return self.Comparison()
+
+  def Comparison(self):
+    left = self.Value()
+    (kind, operator) = self.Peek()
+    if kind == 'op' and operator in COMPARISONS:
+      self.position += 1
+      right = self.Value()
+      if type(left) != type(right):
+        left, right = str(left), str(right)
+      return 1 if COMPARISONS[operator](left, right) else 0
+    return left
+
+  def Value(self):
+    if self.Take('('):
+      result = self.Or()
+      if not self.Take(')'):
+        raise Exception("missing ) in condition")
+      return result
+    (kind, value) = self.Peek()
+    if kind != 'value':
+      raise Exception("invalid condition")
+    self.position += 1
+    return value
+
+class RpmSpec:
+  'the build dependancies and the packages with their provides and requires, of a spec file'
+
+  # increase when the same spec file gives another result, so that the DependancyCache parses it again
+  version = 1
+
+  def __init__(self, macros, arch):
+    self.macros = RpmMacros(macros)
+    self.arch = arch
+
+  def IsActive(self, line):
+    # the condition of a %if, %ifarch or %ifnarch line
+    keyword = line.split(None, 1)[0].lower()
+    argument = line[len(keyword):].strip()
+    if keyword in ('%if', '%elif'):
+      return EvaluateCondition(self.macros.Expand(argument, condition=True))
+    if keyword in ('%ifarch', '%elifarch'):
+      return self.arch in self.macros.Expand(argument).split()
+    if keyword in ('%ifnarch', '%elifnarch'):
+      return self.arch not in self.macros.Expand(argument).split()
+    raise Exception("unknown %if: " + line)
+
+  def Parse(self, lines, packagename):
+    builddepends = []
+    deliverables = {}
+    recentpackagename = None
+    active = True
+    # for each open %if: is the surrounding block active, and has a branch of this %if been taken
+    blocks = []
+
+    for line in lines:
+      lower = line.lower()
+      if lower.startswith("%changelog"):
+        break
+
+      if lower.startswith("%if"):
+        taken = active and self.IsActive(line)
+        blocks.append((active, taken))
+        active = taken
+        continue
+      if lower.startswith("%elif") and blocks:
+        (parent, taken) = blocks[-1]
+        active = parent and not taken and self.IsActive(line)
+        blocks[-1] = (parent, taken or active)
+        continue
+      if lower.startswith("%else") and blocks:
+        (parent, taken) = blocks[-1]
+        active = parent and not taken
+        blocks[-1] = (parent, True)
+        continue
+      if lower.startswith("%endif") and blocks:
+        (active, taken) = blocks.pop()
+        continue
+      if not active:
+        continue
+
+      if lower.startswith("%global") or lower.startswith("%define"):
+        parts = line.split(None, 2)
+        # macros with parameters are not needed for the dependancies
+        if len(parts) == 3 and '(' not in parts[1]:
+          self.macros.Define(parts[1], parts[2].strip())
+        continue
+      if lower.startswith("%bcond_without"):
+        self.macros.Define("with_" + line.split()[1], "1")
+        continue
+      if lower.startswith("%bcond_with"):
+        continue
+
+      line = self.macros.Expand(line)
+      lower = line.lower()
+
+      if lower.startswith("version:"):
+        self.macros.Define("version", line[len("version:"):].strip())
+      elif lower.startswith("release:"):
+        self.macros.Define("release", line[len("release:"):].strip())
+      elif lower.startswith("name:"):
+        recentpackagename = line[len("name:"):].strip()
+        self.macros.Define("name", recentpackagename)
+      elif lower.startswith("%package -n"):
+        recentpackagename = line[len("%package -n"):].strip()
+      elif lower.startswith("%package"):
+        recentpackagename = packagename + "-" + line[len("%package"):].strip()
+
+      if recentpackagename is not None and recentpackagename not in deliverables:
+        deliverables[recentpackagename] = {'provides': [recentpackagename], 'requires': []}
+
+      if lower.startswith("buildrequires:"):
+        if line.count(",") > 0:
+          packagesWithVersions = line[len("buildrequires:"):].split(",")
+        else:
+          packagesWithVersions = line[len("buildrequires:"):].split()
+        ignoreNext = False
+        for word in packagesWithVersions:
+          word = word.strip()
+          if not word:
+            continue
+          if ignoreNext:
+            ignoreNext = False
+          elif word[0] in '<>=':
+            # filter >= 3.0, only use package names
+            ignoreNext = True
+          else:
+            builddepends.append(word.split()[0])
+      elif recentpackagename is None:
+        continue
+      elif lower.startswith("requires:"):
+        words = line[len("requires:"):].split()
+        if words:
+          deliverables[recentpackagename]['requires'].append(words[0])
+      elif lower.startswith("provides:"):
+        words = line[len("provides:"):].split()
+        if words:
+          deliverables[recentpackagename]['provides'].append(words[0])
+
+    return (builddepends, deliverables)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Scheduler: long running process that dispatches the build queue"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import select
+import signal
+import traceback
+from threading import Thread, Event
+
+from django.db import connection, close_old_connections
+
+from lib.LightBuildServer import LightBuildServer
+
+# name of the PostgreSQL channel used to wake up schedulers in other processes
+NOTIFY_CHANNEL = "lbs_scheduler"
+
+# set whenever something happened that might allow another build to start
+wakeupEvent = Event()
+
+def NotifyScheduler():
+  # wake up the scheduler running in this process
+  wakeupEvent.set()
+  # wake up schedulers in other processes, eg. when the web frontend adds a build
+  if connection.vendor == 'postgresql':
+    try:
+      with connection.cursor() as cursor:
+        cursor.execute("NOTIFY " + NOTIFY_CHANNEL)
+    except Exception:
+      traceback.print_exc()
+
+class Scheduler:
+  'wait for events, and dispatch the waiting builds to the build machines'
+
+  def __init__(self, pollInterval):
+    self.LBS = LightBuildServer()
+    # without notifications from other processes, we still look at the queue regularly
+    self.pollInterval = pollInterval
+    self.stopping = False
+
+  def Stop(self, signum=None, frame=None):
+    print("Scheduler: stopping, waiting for the running builds to finish")
+    self.stopping = True
+    wakeupEvent.set()
+
+  def ListenForNotifications(self):
+    # this thread uses its own database connection
+    with connection.cursor() as cursor:
+      cursor.execute("LISTEN " + NOTIFY_CHANNEL)
+    pgconn = connection.connection
+    while not self.stopping:
+      if select.select([pgconn], [], [], self.pollInterval) == ([], [], []):
+        continue
+      pgconn.poll()
+      if pgconn.notifies:
+        pgconn.notifies.clear()
+        wakeupEvent.set()
+
+  def Run(self):
+    signal.signal(signal.SIGTERM, self.Stop)
+    signal.signal(signal.SIGINT, self.Stop)
+
+    # builds of a previous scheduler process on this host cannot be continued, start them again
+    self.LBS.AdoptOrphanedBuilds()
+
+    if connection.vendor == 'postgresql':
+      Thread(target=self.ListenForNotifications, daemon=True).start()
+
+    while not self.stopping:
+      # clear the event before looking at the queue, so that we do not miss any change
+      wakeupEvent.clear()
+      try:
+        close_old_connections()
+        self.LBS.ProcessBuildQueue()
+      except Exception:
+        traceback.print_exc()
+      wakeupEvent.wait(self.pollInterval)
+
+    # graceful drain: do not start new builds, but let the running builds finish
+    self.LBS.WaitForRunningBuilds()
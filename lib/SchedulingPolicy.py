@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""SchedulingPolicy: decides which waiting build gets the next free machine"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+from lib.DependancyGraph import DependancyGraph, SortInWaves, FindCycles
+from projects.models import Project
+
+class SchedulingPolicy:
+  'abstract base class for the order of the waiting builds'
+
+  def __init__(self, LBS):
+    self.LBS = LBS
+
+  def Sort(self, builds):
+    return builds
+
+class FifoPolicy(SchedulingPolicy):
+  'the oldest build first'
+
+  def Sort(self, builds):
+    return sorted(builds, key=lambda build: build.id)
+
+class CriticalPathPolicy(SchedulingPolicy):
+  'the build with the longest chain of dependant builds first'
+
+  def Sort(self, builds):
+    durations = self.LBS.GetAverageBuildDurations(builds)
+    # for packages that have never been built, assume an average duration
+    defaultDuration = sum(durations.values()) / len(durations) if durations else 1
+    scores = {}
+    paths = {}
+    for build in builds:
+      key = (build.user_id, build.project)
+      if key not in paths:
+        project = Project.objects.filter(user_id=build.user_id).filter(name=build.project).first()
+        graph = DependancyGraph.Get(project) if project else None
+        paths[key] = self.GetCriticalPaths(graph, build.user_id, build.project, durations, defaultDuration)
+      scores[build.id] = paths[key].get(build.package,
+        durations.get((build.user_id, build.project, build.package), defaultDuration))
+    return sorted(builds, key=lambda build: (-scores[build.id], build.id))
+
+  def GetCriticalPaths(self, graph, user_id, projectname, durations, defaultDuration):
+    # for each package of the project: its duration plus the longest path through the packages depending on it.
+    # the packages of a circular dependancy are one node with the duration of all its packages,
+    # so that the graph has no cycles, and the packages are visited in reverse topological order
+    paths = {}
+    if graph is None:
+      return paths
+    packages = set(graph.requires) | set(graph.requiredby)
+    requires = {package: graph.requires.get(package, set()) & packages for package in packages}
+    # each package of a cycle is represented by the first package of the cycle
+    node = {package: package for package in packages}
+    for cycle in FindCycles(requires):
+      for package in cycle:
+        node[package] = cycle[0]
+    noderequires = {}
+    nodeduration = {}
+    for package in packages:
+      noderequires.setdefault(node[package], set()).update(node[r] for r in requires[package] if node[r] != node[package])
+      nodeduration[node[package]] = nodeduration.get(node[package], 0) + durations.get((user_id, projectname, package), defaultDuration)
+    noderequiredby = {}
+    for (n, required) in noderequires.items():
+      for r in required:
+        noderequiredby.setdefault(r, set()).add(n)
+    nodepaths = {}
+    for wave in reversed(SortInWaves(noderequires)):
+      for n in wave:
+        nodepaths[n] = nodeduration[n] + max((nodepaths[dependant] for dependant in noderequiredby.get(n, ())), default=0)
+    for package in packages:
+      paths[package] = nodepaths[node[package]]
+    return paths
+
+def GetSchedulingPolicy(name, LBS):
+  if name == "fifo":
+    return FifoPolicy(LBS)
+  if name == "criticalpath":
+    return CriticalPathPolicy(LBS)
+  raise Exception("unknown scheduling policy " + name)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""SimulatedContainer: a container that does not connect to any machine"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+from lib.RemoteContainer import RemoteContainer
+
+class SimulatedContainer(RemoteContainer):
+  'stands in for the containers of the build machines when simulating the scheduler'
+
+  def __init__(self, containername, configBuildMachine, logger, packageSrcPath):
+    # do not resolve the host name, and do not store the private key
+    self.hostname = containername
+    self.containertype = configBuildMachine.type
+    self.cid = configBuildMachine.cid
+    self.containername = str(self.cid).zfill(3) + "-" + containername
+    self.logger = logger
+    self.packageSrcPath = packageSrcPath
+    self.distro = ""
+    self.release = ""
+    self.arch = ""
+
+  def createmachine(self, distro, release, arch, staticIP):
+    self.distro = distro
+    self.release = release
+    self.arch = arch
+    return True
+
+  def startmachine(self):
+    return True
+
+  def executeInContainer(self, command):
+    return True
+
+  def destroy(self):
+    return True
+
+  def stop(self):
+    return True
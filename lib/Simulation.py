@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Simulation: replay a workload on simulated build machines in virtual time"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.utils import timezone
+
+from lib.LightBuildServer import LightBuildServer
+from lib.SimulatedContainer import SimulatedContainer
+from lib.SchedulingPolicy import GetSchedulingPolicy
+from lib.Logger import Logger
+from builder.models import Build
+from machines.models import Machine, Slot
+
+class SimulatedLightBuildServer(LightBuildServer):
+  'the build server, with simulated containers, and without build threads'
+
+  def __init__(self, simulation):
+    super().__init__(now=simulation.Now)
+    self.simulation = simulation
+
+  def GetContainer(self, slot, logger, packageSrcPath):
+    return SimulatedContainer(slot.host, slot, logger, packageSrcPath)
+
+  def StartBuild(self, build):
+    self.simulation.StartBuild(build)
+
+class Simulation:
+  'drive ProcessBuildQueue in virtual time, the builds take as long as they took in the past'
+
+  def __init__(self, policy=None):
+    self.LBS = SimulatedLightBuildServer(self)
+    if policy is not None:
+      self.LBS.policy = GetSchedulingPolicy(policy, self.LBS)
+    self.now = timezone.now()
+    self.durations = {}
+    # (end, build id, build) of the running builds
+    self.running = []
+    # seconds that each machine has been building
+    self.busy = defaultdict(float)
+
+  @staticmethod
+  def RecordedWorkload(count):
+    # the last finished builds, arriving with the same distance in time as they arrived in the past
+    builds = list(Build.objects.filter(status='FINISHED'). \
+      filter(started__isnull=False).filter(finished__isnull=False).order_by('-finished')[:count])
+    if not builds:
+      return []
+    arrivals = [min(build.created, build.started) for build in builds]
+    first = min(arrivals)
+    workload = []
+    for build, arrival in zip(builds, arrivals):
+      duration = (build.finished - build.started).total_seconds()
+      build.pk = None
+      workload.append(((arrival - first).total_seconds(), build, duration))
+    return workload
+
+  @staticmethod
+  def PrepareDatabase():
+    # the simulated builds should not compete with the real queue.
+    # this must only be called inside of a transaction that is rolled back
+    Build.objects.filter(status__in=('WAITING', 'BUILDING')).update(status='CANCELLED')
+    Slot.objects.update(status='AVAILABLE', build=None)
+
+  def Now(self):
+    return self.now
+
+  def StartBuild(self, build):
+    container = self.LBS.GetContainer(build.buildslot, Logger(), '')
+    container.createmachine(build.distro, build.release, build.arch, None)
+    container.startmachine()
+    heapq.heappush(self.running, (self.now + datetime.timedelta(seconds=self.durations[build.id]), build.id, build))
+
+  def FinishBuild(self, build):
+    slot = build.buildslot
+    self.LBS.ReleaseMachine(slot.host, False, slot.cid, build)
+    build.status = 'FINISHED'
+    build.finished = self.now
+    build.buildsuccess = 'success'
+    build.save()
+    self.busy[slot.host] += (build.finished - build.started).total_seconds()
+
+  def Run(self, workload):
+    # workload: list of (arrival in seconds after the start, unsaved build, duration in seconds)
+    pending = sorted(workload, key=lambda item: item[0])
+    start = self.now
+    builds = []
+
+    waiting = 0
+    while pending or self.running or waiting:
+      events = []
+      if pending:
+        events.append(start + datetime.timedelta(seconds=pending[0][0]))
+      if self.running:
+        events.append(self.running[0][0])
+      if waiting:
+        # the scheduler is woken up by the events, but it must also look at the queue
+        # when a machine is not rate limited anymore
+        events.extend(self.GetRateLimitEnds())
+      if not events:
+        # no machine is suitable for the remaining builds
+        break
+      self.now = max(self.now, min(events))
+
+      while pending and start + datetime.timedelta(seconds=pending[0][0]) <= self.now:
+        (arrival, build, duration) = pending.pop(0)
+        build.status = 'WAITING'
+        build.created = self.now
+        build.started = None
+        build.finished = None
+        build.save()
+        self.durations[build.id] = duration
+        builds.append(build)
+      while self.running and self.running[0][0] <= self.now:
+        (end, id, build) = heapq.heappop(self.running)
+        self.FinishBuild(build)
+
+      # the simulated builds are writing output all the time
+      Build.objects.filter(id__in=[id for (end, id, build) in self.running]).update(heartbeat=self.now)
+      self.LBS.ProcessBuildQueue()
+
+      waiting = Build.objects.filter(id__in=self.durations.keys()).filter(status='WAITING').count()
+
+    return self.GetStatistics(start, builds, waiting)
+
+  def GetRateLimitEnds(self):
+    result = []
+    for machine in Machine.objects.filter(enabled=True).filter(dispatch_interval__gt=0).filter(last_dispatch__isnull=False):
+      end = machine.last_dispatch + datetime.timedelta(seconds=machine.dispatch_interval)
+      if end > self.now:
+        result.append(end)
+    return result
+
+  def Percentile(self, values, percent):
+    if not values:
+      return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+  def GetStatistics(self, start, builds, unstarted):
+    builds = Build.objects.filter(id__in=[build.id for build in builds]).filter(status='FINISHED')
+    waits = [(build.started - build.created).total_seconds() for build in builds]
+    end = max([build.finished for build in builds], default=start)
+    makespan = (end - start).total_seconds()
+    utilization = {}
+    totalslots = 0
+    for machine in Machine.objects.filter(enabled=True):
+      totalslots += machine.slots
+      utilization[machine.host] = self.busy[machine.host] / (machine.slots * makespan) if makespan else 0
+    return {
+      'builds': len(waits),
+      'unstarted': unstarted,
+      'makespan': makespan,
+      'wait_p50': self.Percentile(waits, 50),
+      'wait_p90': self.Percentile(waits, 90),
+      'wait_p99': self.Percentile(waits, 99),
+      'utilization': sum(self.busy.values()) / (totalslots * makespan) if makespan and totalslots else 0,
+      'machines': utilization,
+    }
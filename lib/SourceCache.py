@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""SourceCache: immutable snapshots of the packaging instructions"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import tarfile
+import hashlib
+import itertools
+import tempfile
+from threading import Event, Lock, get_ident
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from lib.ForgeClient import ForgeClient
+
+class HashingReader:
+  'reads the body of a response, and calculates the hash of what has been read'
+
+  def __init__(self, response):
+    self.raw = response.raw
+    self.raw.decode_content = True
+    self.sha1 = hashlib.sha1()
+
+  def hexdigest(self):
+    return self.sha1.hexdigest()
+
+  def read(self, size=-1):
+    data = self.raw.read(size)
+    self.sha1.update(data)
+    return data
+
+class SourceCache:
+  'downloaded source trees by the hash of the archive. a tree is never changed, only deleted when it is not used anymore'
+
+  # unique names for the references of this process
+  counter = itertools.count()
+  # the urls that are being fetched by a thread of this process
+  flights = {}
+  flightsLock = Lock()
+
+  def __init__(self):
+    self.path = settings.GIT_SRC_PATH + "/cache"
+    # disk budget for the trees that are not the newest tree of a url, in MB
+    self.budget = settings.SOURCE_CACHE_SIZE * 1024 * 1024
+    # within this time, the newest tree of a url is used without asking the forge
+    self.maxAge = settings.SOURCE_CACHE_MAX_AGE
+    for dir in ("entries", "refs", "urls", "tmp"):
+      os.makedirs(self.path + "/" + dir, exist_ok=True)
+
+  @contextmanager
+  def Lock(self, name):
+    # file locks work between the threads and processes on this host
+    with open(self.path + "/" + name + ".lock", 'a') as f:
+      fcntl.flock(f, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+  def Hash(self, text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+  def GetUrlInfo(self, urlkey):
+    # the etag and the key of the newest tree of the url, and when the forge has been asked last
+    urlfile = self.path + "/urls/" + urlkey
+    if not os.path.isfile(urlfile):
+      return (None, None, 0)
+    with open(urlfile, 'r') as f:
+      etag, key = f.read().split("\n")[:2]
+    return (etag or None, key, os.path.getmtime(urlfile))
+
+  def SetUrlInfo(self, urlkey, etag, key):
+    urlfile = self.path + "/urls/" + urlkey
+    with open(urlfile + ".tmp", 'w') as f:
+      f.write((etag or "") + "\n" + key + "\n")
+    os.replace(urlfile + ".tmp", urlfile)
+
+  def Get(self, url, headers, git_project_name, refresh=False):
+    # returns the path of the tree, and the reference that must be released after use.
+    # the tree is in path + git_project_name
+    urlkey = self.Hash(url)
+    # when another thread of this process is fetching the same url, we use its result
+    with self.flightsLock:
+      flight = self.flights.get(urlkey)
+      waiting = flight is not None
+      if not waiting:
+        flight = self.flights[urlkey] = {'done': Event(), 'key': None}
+    if waiting:
+      flight['done'].wait()
+      if flight['key']:
+        reference = self.Acquire(flight['key'])
+        if reference:
+          return (self.path + "/entries/" + flight['key'] + "/", reference)
+      return self.Fetch(urlkey, url, headers, git_project_name, refresh)
+
+    try:
+      (path, reference) = self.Fetch(urlkey, url, headers, git_project_name, refresh)
+      flight['key'] = os.path.basename(path.rstrip('/'))
+      return (path, reference)
+    finally:
+      with self.flightsLock:
+        del self.flights[urlkey]
+      flight['done'].set()
+
+  def Fetch(self, urlkey, url, headers, git_project_name, refresh):
+    # the file lock avoids that other processes download the same url at the same time
+    with self.Lock("url-" + urlkey):
+      etag, key, checked = self.GetUrlInfo(urlkey)
+      if key and not os.path.isdir(self.path + "/entries/" + key):
+        key = None
+      if key and not refresh and time.time() - checked < self.maxAge:
+        reference = self.Acquire(key)
+        if reference:
+          return (self.path + "/entries/" + key + "/", reference)
+
+      r = ForgeClient.GetArchive(url, headers, etag if key else None)
+      if r.status_code == 304:
+        self.SetUrlInfo(urlkey, etag, key)
+        # the newest tree of a url is never evicted
+        reference = self.Acquire(key)
+        if not reference:
+          raise Exception("Problem with finding the git repo in the cache")
+        return (self.path + "/entries/" + key + "/", reference)
+
+      # the archive is unpacked while it is downloaded, and identified by its content
+      stream = HashingReader(r)
+      key = self.Extract(stream, git_project_name, stream.hexdigest)
+      # the body has been read completely, the connection can be used again
+      r.close()
+
+      etag = r.headers.get('Etag')
+      self.SetUrlInfo(urlkey, etag.strip('"') if etag else None, key)
+      reference = self.Acquire(key)
+      if not reference:
+        raise Exception("Problem with storing the git repo in the cache")
+
+    self.Evict()
+    return (self.path + "/entries/" + key + "/", reference)
+
+  def GetEntry(self, key, git_project_name, openArchive):
+    # for trees that are known by their key before they are downloaded, eg. by the git commit.
+    # openArchive is only called if the tree is not in the cache yet
+    reference = self.Acquire(key)
+    if not reference:
+      stream = openArchive()
+      try:
+        self.Extract(stream, git_project_name, lambda: key)
+      finally:
+        stream.close()
+      reference = self.Acquire(key)
+      if not reference:
+        raise Exception("Problem with storing the git repo in the cache")
+      self.Evict()
+    return (self.path + "/entries/" + key + "/", reference)
+
+  def Extract(self, stream, git_project_name, getKey):
+    # unpacks the tar stream, and returns the key of the tree.
+    # getKey is called after the whole stream has been read
+    tmpdir = tempfile.mkdtemp(dir=self.path + "/tmp")
+    try:
+      size = 0
+      # relative path in the project => sha1 of the file, so that the files do not need to be read again for the hash of a package
+      digests = {}
+      with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+          # the archive contains one directory, eg. project-branch or project-branch-commit.
+          # we store it as git_project_name
+          parts = member.name.split('/', 1)
+          if len(parts) < 2 or not parts[1]:
+            continue
+          member.name = git_project_name + '/' + parts[1]
+          if member.islnk():
+            member.linkname = git_project_name + '/' + member.linkname.split('/', 1)[-1]
+          if member.isfile():
+            size += member.size
+            digests[parts[1]] = self.ExtractFile(tar, tarfile.data_filter(member, tmpdir), tmpdir)
+          else:
+            tar.extract(member, tmpdir, filter='data')
+      # read the rest of the stream, eg. the padding at the end of the archive
+      while stream.read(100000):
+        pass
+      if not os.path.isdir(tmpdir + "/" + git_project_name):
+        raise Exception("Problem with cloning the git repo")
+      with open(tmpdir + "/.size", 'w') as f:
+        f.write(str(size))
+      with open(tmpdir + "/.digests", 'w') as f:
+        json.dump(digests, f)
+
+      key = getKey()
+      entry = self.path + "/entries/" + key
+      with self.Lock("key-" + key):
+        if os.path.isdir(entry):
+          # another branch or url had the same content
+          shutil.rmtree(tmpdir)
+        else:
+          os.rename(tmpdir, entry)
+      return key
+    except:
+      shutil.rmtree(tmpdir, ignore_errors=True)
+      raise
+
+  def ExtractFile(self, tar, member, tmpdir):
+    # writes the file, and returns its sha1 while the content is read from the archive anyway
+    filename = tmpdir + "/" + member.name
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    sha1 = hashlib.sha1()
+    with tar.extractfile(member) as source, open(filename, 'wb') as target:
+      for chunk in iter(lambda: source.read(1024*1024), b''):
+        sha1.update(chunk)
+        target.write(chunk)
+    os.utime(filename, (member.mtime, member.mtime))
+    # nobody should change the snapshot
+    os.chmod(filename, member.mode & 0o555)
+    return sha1.hexdigest()
+
+  def GetDigests(self, path):
+    # the hashes of the files of a tree, see Extract. older trees do not have them
+    try:
+      with open(path + "/.digests", 'r') as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def Acquire(self, key):
+    entry = self.path + "/entries/" + key
+    with self.Lock("cache"):
+      if not os.path.isdir(entry):
+        return None
+      # the modification time tells which trees have been used least recently
+      os.utime(entry)
+      os.makedirs(self.path + "/refs/" + key, exist_ok=True)
+      reference = self.path + "/refs/" + key + "/" + \
+        str(os.getpid()) + "-" + str(get_ident()) + "-" + str(next(self.counter))
+      open(reference, 'w').close()
+      return reference
+
+  def Release(self, reference):
+    if reference and os.path.isfile(reference):
+      os.remove(reference)
+
+  def IsProcessAlive(self, pid):
+    try:
+      os.kill(pid, 0)
+    except ProcessLookupError:
+      return False
+    except PermissionError:
+      return True
+    return True
+
+  def IsReferenced(self, key):
+    refs = self.path + "/refs/" + key
+    if not os.path.isdir(refs):
+      return False
+    for reference in os.listdir(refs):
+      # the references of a process that has died are not valid anymore
+      if self.IsProcessAlive(int(reference.split("-")[0])):
+        return True
+      os.remove(refs + "/" + reference)
+    return False
+
+  def Evict(self):
+    # delete the least recently used trees until the others fit into the disk budget.
+    # trees that are used by a build, and the newest tree of each url are kept
+    with self.Lock("cache"):
+      newest = set()
+      for urlkey in os.listdir(self.path + "/urls"):
+        if not urlkey.endswith(".tmp"):
+          newest.add(self.GetUrlInfo(urlkey)[1])
+      candidates = []
+      total = 0
+      for key in os.listdir(self.path + "/entries"):
+        entry = self.path + "/entries/" + key
+        if key in newest:
+          continue
+        size = 0
+        if os.path.isfile(entry + "/.size"):
+          with open(entry + "/.size", 'r') as f:
+            size = int(f.read())
+        total += size
+        candidates.append((os.path.getmtime(entry), key, size))
+      for (lastused, key, size) in sorted(candidates):
+        if total <= self.budget:
+          break
+        if self.IsReferenced(key):
+          continue
+        print("SourceCache: deleting " + key)
+        # rename first, so that nobody finds a half deleted tree
+        trash = tempfile.mkdtemp(dir=self.path + "/tmp")
+        os.rename(self.path + "/entries/" + key, trash + "/" + key)
+        shutil.rmtree(trash)
+        shutil.rmtree(self.path + "/refs/" + key, ignore_errors=True)
+        total -= size
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""SourceHasher: hash of the sources of each package, without hashing unchanged files again"""
+
+# Copyright (c) 2014-2024 Timotheus Pokorra
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+# USA
+#
+
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+class SourceHasher:
+  'calculates the hash of package directories, with the hashes of the files from the snapshot or from the manifest'
+
+  def __init__(self, manifestfile, digests=None):
+    self.manifestfile = manifestfile
+    # relative path => sha1, recorded when the snapshot was extracted. see SourceCache.Extract
+    self.digests = digests or {}
+    # relative path => (size, mtime in ns, inode, ctime in ns, sha1), for the files that are not in digests.
+    # the mtime of an extracted archive comes from the archive, so only the same extracted file may reuse its hash
+    self.manifest = {}
+    if os.path.isfile(manifestfile):
+      try:
+        with open(manifestfile, 'r') as f:
+          self.manifest = json.load(f)
+      except ValueError:
+        # a broken manifest just means that we hash all files again
+        self.manifest = {}
+    self.newmanifest = {}
+    self.hashedpackages = set()
+
+  def HashFile(self, filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+      for chunk in iter(lambda: f.read(1024*1024), b''):
+        sha1.update(chunk)
+    return sha1.hexdigest()
+
+  def HashPackage(self, projectPathSrc, packagename):
+    # the hash does not depend on where the sources are stored, only on the paths inside of the project
+    lines = []
+    self.hashedpackages.add(packagename)
+    for root, dirs, files in os.walk(projectPathSrc + "/" + packagename):
+      for file in files:
+        filename = os.path.join(root, file)
+        if os.path.islink(filename) or not os.path.isfile(filename):
+          continue
+        relpath = os.path.relpath(filename, projectPathSrc)
+        digest = self.digests.get(relpath)
+        if digest is None:
+          stat = os.stat(filename)
+          signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns]
+          known = self.manifest.get(relpath)
+          if known and known[:-1] == signature:
+            digest = known[-1]
+          else:
+            digest = self.HashFile(filename)
+          self.newmanifest[relpath] = signature + [digest]
+        lines.append(digest + "  " + relpath + "\n")
+    return hashlib.sha1("".join(sorted(lines, key=lambda line: line[42:])).encode('utf-8')).hexdigest()
+
+  def HashPackages(self, projectPathSrc, packagenames):
+    # returns packagename => hash. the packages are hashed in parallel
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+      hashes = dict(zip(packagenames, executor.map(lambda name: self.HashPackage(projectPathSrc, name), packagenames)))
+    self.Save()
+    return hashes
+
+  def Save(self):
+    os.makedirs(os.path.dirname(self.manifestfile), exist_ok=True)
+    # several threads of a process can save the manifest of the same branch at the same time
+    (fd, tmpfile) = tempfile.mkstemp(dir=os.path.dirname(self.manifestfile))
+    # the files of the packages that have not been hashed now are kept
+    manifest = {relpath: known for (relpath, known) in self.manifest.items()
+      if relpath.split('/', 1)[0] not in self.hashedpackages}
+    manifest.update(self.newmanifest)
+    try:
+      with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f)
+      os.replace(tmpfile, self.manifestfile)
+    except:
+      if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+      raise
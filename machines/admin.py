@@ -1,10 +1,22 @@
 from django.contrib import admin
-from .models import Machine
+from .models import Machine, Slot
+
+
+class SlotAdminInline(admin.TabularInline):
+    model = Slot
+    fields = ('cid', 'status', 'build')
+    readonly_fields = ('cid', 'status', 'build')
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 class MachineAdmin(admin.ModelAdmin):
-    list_display = ['host', 'type', 'enabled']
-    fields = ['host', 'type', 'port', 'cid', 'enabled', 'priority', 'static', 'local', 'private_key']
+    list_display = ['host', 'type', 'slots', 'enabled', 'cache_hits', 'cache_misses']
+    fields = ['host', 'type', 'port', 'cid', 'slots', 'cpus', 'memory', 'enabled', 'priority', 'dispatch_interval', 'static', 'local', 'private_key']
+    inlines = (SlotAdminInline, )
 
     class Meta:
         None
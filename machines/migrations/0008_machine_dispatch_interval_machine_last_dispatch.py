@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0007_alter_machine_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='dispatch_interval',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='last_dispatch',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:14
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_slots(apps, schema_editor):
+    # each existing machine gets one slot, with the current status and build
+    Machine = apps.get_model('machines', 'Machine')
+    Slot = apps.get_model('machines', 'Slot')
+    for machine in Machine.objects.all():
+        Slot.objects.create(machine=machine, cid=machine.cid, status=machine.status, build=machine.build)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0010_build_created_buildshare'),
+        ('machines', '0008_machine_dispatch_interval_machine_last_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='cpus',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='memory',
+            field=models.PositiveIntegerField(default=0, help_text='in GB'),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='slots',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.CreateModel(
+            name='Slot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cid', models.IntegerField()),
+                ('status', models.CharField(choices=[('AVAILABLE', 'AVAILABLE'), ('BUILDING', 'BUILDING'), ('STOPPING', 'STOPPING')], default='AVAILABLE', max_length=20)),
+                ('build', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, to='builder.build')),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='machines.machine')),
+            ],
+            options={
+                'db_table': 'lbs_machine_slot',
+                'ordering': ('machine', 'cid'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='slot',
+            constraint=models.UniqueConstraint(fields=('machine', 'cid'), name='unique_machine_cid'),
+        ),
+        migrations.RunPython(create_slots, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='machine',
+            name='build',
+        ),
+        migrations.RemoveField(
+            model_name='machine',
+            name='status',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('machines', '0009_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='cache_misses',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='MachineCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distro', models.CharField(max_length=20)),
+                ('release', models.CharField(max_length=20)),
+                ('arch', models.CharField(max_length=10)),
+                ('project', models.CharField(max_length=250)),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='machines.machine')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'lbs_machine_cache',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='machinecache',
+            constraint=models.UniqueConstraint(fields=('machine', 'distro', 'release', 'arch', 'user', 'project'), name='unique_machine_cache'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from builder.models import Build
@@ -19,8 +20,50 @@ class Machine(models.Model):
     static = models.BooleanField(default = False)
     local = models.BooleanField(default = False)
     priority = models.IntegerField(default = 1)
+    # the container id of the first slot. the other slots use the following ids
     cid = models.IntegerField()
+    # the number of builds that can run at the same time on this machine
+    slots = models.PositiveIntegerField(default = 1, validators=[MinValueValidator(1)])
+    # the capacity for the reservations of the builds, 0 means not limited
+    cpus = models.PositiveIntegerField(default = 0)
+    memory = models.PositiveIntegerField(default = 0, help_text="in GB")
     enabled = models.BooleanField(default = True)
+    # how often a build has been started on this machine with a warm cache for its target
+    cache_hits = models.PositiveIntegerField(default = 0)
+    cache_misses = models.PositiveIntegerField(default = 0)
+    # minimum number of seconds between starting two builds on this host, 0 for no limit
+    dispatch_interval = models.PositiveIntegerField(default = 0)
+    last_dispatch = models.DateTimeField(default=None, null=True, blank=True)
+
+    def __str__(self):
+        return self.host
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.update_slots()
+
+    def update_slots(self):
+        cids = range(self.cid, self.cid + self.slots)
+        # slots that are building are removed after the build has finished
+        self.slot_set.exclude(cid__in=cids).filter(status='AVAILABLE').delete()
+        existing = set(self.slot_set.values_list('cid', flat=True))
+        for cid in cids:
+            if cid not in existing:
+                Slot(machine=self, cid=cid).save()
+
+    class Meta:
+        db_table = "lbs_machine"
+        ordering = ("host",)
+
+        constraints = [
+            models.UniqueConstraint(fields=["host"],name="unique_host")
+        ]
+
+
+class Slot(models.Model):
+    # a container on a build machine, that can run one build at a time
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
+    cid = models.IntegerField()
 
     status = models.CharField(max_length=20, default="AVAILABLE", choices=[
         ("AVAILABLE", "AVAILABLE"),
@@ -28,16 +71,64 @@ class Machine(models.Model):
         ("STOPPING", "STOPPING"),
     ])
 
-    # link to the current build running on this machine
+    # link to the current build running on this slot
     build = models.ForeignKey(Build, on_delete=models.PROTECT, default=None, null=True, blank=True)
 
+    # the containers are configured with the settings of the machine
+    @property
+    def host(self):
+        return self.machine.host
+
+    @property
+    def port(self):
+        return self.machine.port
+
+    @property
+    def type(self):
+        return self.machine.type
+
+    @property
+    def private_key(self):
+        return self.machine.private_key
+
+    @property
+    def static(self):
+        return self.machine.static
+
+    @property
+    def local(self):
+        return self.machine.local
+
+    @property
+    def slots(self):
+        return self.machine.slots
+
     def __str__(self):
-        return self.host
+        return f"{self.machine.host}/{self.cid}"
 
     class Meta:
-        db_table = "lbs_machine"
-        ordering = ("host",)
+        db_table = "lbs_machine_slot"
+        ordering = ("machine", "cid")
 
         constraints = [
-            models.UniqueConstraint(fields=["host"],name="unique_host")
+            models.UniqueConstraint(fields=["machine", "cid"],name="unique_machine_cid")
+        ]
+
+
+class MachineCache(models.Model):
+    # a build target that has recently been built on this machine.
+    # the container image and the package caches of the target are still warm
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
+    distro = models.CharField(max_length=20)
+    release = models.CharField(max_length=20)
+    arch = models.CharField(max_length=10)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    project = models.CharField(max_length=250)
+    last_used = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "lbs_machine_cache"
+
+        constraints = [
+            models.UniqueConstraint(fields=["machine", "distro", "release", "arch", "user", "project"],name="unique_machine_cache")
         ]
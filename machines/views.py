@@ -5,11 +5,13 @@ from django.contrib.auth.decorators import login_required
 from .models import Machine
 from builder.models import Build
 from lib.LightBuildServer import LightBuildServer
+from lib.FairShare import GetFairnessStatistics
 
 def monitor(request, successmessage = None, errormessage = None):
     template_name = "machines/index.html"
     machines_list = Machine.objects.all()
     lbs = LightBuildServer()
+    (queue_fairness, fairness_index) = GetFairnessStatistics() if request.user.is_staff else (None, None)
     return render(request, template_name,
             {
              'successmessage': successmessage,
@@ -17,6 +19,8 @@ def monitor(request, successmessage = None, errormessage = None):
              'machines_list': machines_list,
              'waiting_builds': lbs.GetBuildQueue(request.user),
              'finished_builds': lbs.GetFinishedQueue(request.user),
+             'queue_fairness': queue_fairness,
+             'fairness_index': fairness_index,
             })
 
 @login_required
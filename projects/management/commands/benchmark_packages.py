@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lib.Benchmark import BENCHMARK_USER, BenchmarkLightBuildServer, RunRolledBack
+from lib.DependancyGraph import SortInWaves, FindCycles
+from lib.SourceHasher import SourceHasher
+from lib.Shell import Shell
+from lib.Logger import Logger
+from lib.DependancyCache import DependancyCache
+from lib.BuildHelperFactory import BuildHelperFactory
+from lib.RpmSpec import RpmSpec
+from lib.Fixtures import CreateUser, CreateProject, GenerateSpec
+from builder.models import Build
+from projects.models import Package, PackageDependancy, PackageBuildStatus
+
+
+class Command(BaseCommand):
+    help = 'Measure the performance of hashing, parsing and ordering the packages. All changes to the database are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=['hash', 'dirty', 'dependancies', 'order', 'spec'])
+        parser.add_argument('--packages', type=int, default=100, help='number of packages of the project')
+        parser.add_argument('--targets', type=int, default=5, help='number of build targets of each package')
+        parser.add_argument('--files', type=int, default=20, help='number of files in each package')
+        parser.add_argument('--branches', type=int, default=2, help='number of branches of each package')
+        parser.add_argument('--corpus', help='directory with spec files, instead of generated spec files')
+
+    def handle(self, *args, **options):
+        RunRolledBack(getattr(self, 'benchmark_' + options['benchmark']), options)
+
+    def benchmark_hash(self, options):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            packagenames = [f"package{i}" for i in range(options['packages'])]
+            for name in packagenames:
+                os.makedirs(f"{tmpdir}/src/{name}")
+                for i in range(options['files']):
+                    with open(f"{tmpdir}/src/{name}/file{i}", 'w') as f:
+                        f.write(f"{name} {i}\n" * 1000)
+
+            start = time.time()
+            shell = Shell(Logger())
+            for name in packagenames:
+                shell.evaluateshell(f"find {tmpdir}/src/{name} -type f -print0 | sort -z | xargs -0 sha1sum | sha1sum | awk '{{print $1}}'")
+            print(f"shell: hashed {options['packages']} packages with {options['files']} files each in {time.time() - start:.3f} seconds")
+
+            for run in ['first run', 'unchanged files']:
+                start = time.time()
+                SourceHasher(f"{tmpdir}/manifest").HashPackages(f"{tmpdir}/src", packagenames)
+                print(f"in process, {run}: hashed {options['packages']} packages in {time.time() - start:.3f} seconds")
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def benchmark_dirty(self, options):
+        # a tree of packages: each package depends on its parent, so all packages depend on package0
+        project = CreateProject(CreateUser(BENCHMARK_USER), 'benchmark',
+            packagenames=[f"package{i}" for i in range(options['packages'])])
+        packages = {package.name: package for package in Package.objects.filter(project=project)}
+        PackageDependancy.objects.bulk_create([PackageDependancy(dependantpackage=packages[f"package{i}"],
+            requiredpackage=packages[f"package{(i-1)//2}"]) for i in range(1, options['packages'])])
+        PackageBuildStatus.objects.bulk_create([PackageBuildStatus(package=package, branchname=f"branch{b}",
+            distro='fedora', release=str(30+t), arch='x86_64', dirty=False)
+            for package in packages.values() for b in range(options['branches']) for t in range(options['targets'])])
+
+        LBS = BenchmarkLightBuildServer()
+        for run in ['first run', 'cached graph']:
+            PackageBuildStatus.objects.filter(package__project=project).update(dirty=False)
+            start = time.time()
+            count = LBS.MarkPackageAsDirty(packages['package0'], 'branch0')
+            duration = time.time() - start
+            print(f"{run}: marked {count} build states of {options['packages']} packages as dirty in {duration:.3f} seconds")
+
+
+    def benchmark_dependancies(self, options):
+        tmpdir = tempfile.mkdtemp()
+        oldpath = settings.GIT_SRC_PATH
+        try:
+            settings.GIT_SRC_PATH = tmpdir
+            user = CreateUser(BENCHMARK_USER)
+            project = CreateProject(user, 'benchmark')
+            packagenames = [f"package{i}" for i in range(options['packages'])]
+            for i, name in enumerate(packagenames):
+                os.makedirs(f"{tmpdir}/benchmark/{name}")
+                with open(f"{tmpdir}/benchmark/{name}/{name}.spec", 'w') as f:
+                    f.write(GenerateSpec(i))
+
+            build = Build(user=user, project=project.name, package=None, branchname='main')
+            build.pathSrc = tmpdir
+            for target in range(options['targets']):
+                buildHelper = BuildHelperFactory.GetBuildHelper('fedora', None, build)
+                buildHelper.release = str(38 + target)
+                buildHelper.arch = 'x86_64'
+                for run in ['first run', 'unchanged files']:
+                    cache = DependancyCache()
+                    start = time.time()
+                    for name in packagenames:
+                        buildHelper.packagename = name
+                        buildHelper.GetCachedDependanciesAndProvides(cache)
+                    print(f"fedora/{buildHelper.release}, {run}: dependancies of {options['packages']} packages " +
+                        f"in {time.time() - start:.3f} seconds, cache hit rate {cache.GetHitRate()*100:.0f}%")
+        finally:
+            settings.GIT_SRC_PATH = oldpath
+            shutil.rmtree(tmpdir)
+
+
+    def benchmark_order(self, options):
+        # each package needs two packages with a lower number
+        requires = {f"package{i}": set([f"package{(i-1)//2}", f"package{(i-1)//3}"]) if i else set()
+            for i in range(options['packages'])}
+        start = time.time()
+        waves = SortInWaves(requires)
+        duration = time.time() - start
+        print(f"sorted {options['packages']} packages into {len(waves)} waves in {duration:.3f} seconds, " +
+            f"the largest wave has {max(len(wave) for wave in waves)} packages")
+
+        # a circular dependancy: the first package needs the last package
+        requires["package0"] = set([f"package{options['packages'] - 1}"])
+        start = time.time()
+        cycles = FindCycles(requires)
+        duration = time.time() - start
+        print(f"found {len(cycles)} circular dependancies with {sum(len(c) for c in cycles)} packages in {duration:.3f} seconds")
+
+
+    def benchmark_spec(self, options):
+        if options['corpus']:
+            specs = []
+            for root, dirs, files in os.walk(options['corpus']):
+                for filename in files:
+                    if filename.endswith('.spec'):
+                        with open(os.path.join(root, filename), encoding='utf-8', errors='replace') as f:
+                            specs.append((filename[:-len('.spec')], f.read().splitlines(True)))
+        else:
+            specs = [(f"package{i}", GenerateSpec(i).splitlines(True)) for i in range(options['packages'])]
+
+        failed = 0
+        start = time.time()
+        for (name, lines) in specs:
+            try:
+                RpmSpec({'fedora': '40', '_isa': ''}, 'x86_64').Parse(lines, name)
+            except Exception as e:
+                failed += 1
+                print(f"{name}: {e}")
+        duration = time.time() - start
+        print(f"parsed {len(specs)} spec files in {duration:.3f} seconds, {len(specs) / duration:.0f} spec files per second, " +
+            f"{failed} could not be parsed")
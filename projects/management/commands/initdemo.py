@@ -20,7 +20,6 @@ class Command(BaseCommand):
                 priority = 1,
                 cid = cid,
                 enabled = True,
-                status = "AVAILABLE",
             )
             machine.save()
             print(f"created machine {hostname}")
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_alter_project_git_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='build_weight',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='max_concurrent_builds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0014_project_build_weight_project_max_concurrent_builds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='cpus',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='memory',
+            field=models.PositiveIntegerField(default=0, help_text='in GB'),
+        ),
+    ]
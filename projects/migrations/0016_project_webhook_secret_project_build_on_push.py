@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0015_package_cpus_package_memory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='build_on_push',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='webhook_secret',
+            field=models.CharField(blank=True, default=None, max_length=250, null=True),
+        ),
+    ]
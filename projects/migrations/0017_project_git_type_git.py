@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0016_project_webhook_secret_project_build_on_push'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='git_type',
+            field=models.CharField(choices=[('gitea', 'Gitea'), ('github', 'Github'), ('gitlab', 'Gitlab'), ('git', 'Git')], default='github', max_length=20),
+        ),
+    ]
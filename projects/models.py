@@ -1,6 +1,7 @@
 from django.db import models
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.validators import MinValueValidator
 from django.utils.safestring import mark_safe
 from machines.models import Machine
 
@@ -15,8 +16,14 @@ class Project(models.Model):
         ("gitea", "Gitea"),
         ("github", "Github"),
         ("gitlab", "Gitlab"),
+        # any git repository: a shallow mirror is kept, and a build only gets the directory of its package
+        ("git", "Git"),
     ])
     git_private_token = models.CharField(max_length=250, default=None, null=True, blank=True)
+    # the secret of the push webhook of the forge. without a secret, the webhook is ignored
+    webhook_secret = models.CharField(max_length=250, default=None, null=True, blank=True)
+    # add the builds of the changed packages to the queue, when the webhook reports a push
+    build_on_push = models.BooleanField(default = False)
 
     public_key_id = models.CharField(max_length=250, null=True, blank=True)
     machine = models.ForeignKey(Machine, on_delete=models.PROTECT, null=True, blank=True)
@@ -30,6 +37,11 @@ class Project(models.Model):
     visible = models.BooleanField(default = True)
     secret = models.CharField(max_length=250, default=None, null=True, blank=True)
 
+    # the share of the build machines, compared to the other projects of the same user
+    build_weight = models.PositiveIntegerField(default = 1, validators=[MinValueValidator(1)])
+    # 0 means no limit
+    max_concurrent_builds = models.PositiveIntegerField(default = 0)
+
     def __str__(self):
         return f"{self.user}::{self.name}"
 
@@ -50,6 +62,9 @@ class Package(models.Model):
     name = models.CharField(max_length=250)
     machine = models.ForeignKey(Machine, on_delete=models.PROTECT, null=True, blank=True)
     windows_installer = models.BooleanField(default = False)
+    # the resources to reserve on the build machine, 0 means no reservation
+    cpus = models.PositiveIntegerField(default = 0)
+    memory = models.PositiveIntegerField(default = 0, help_text="in GB")
 
     def __str__(self):
         return self.name
@@ -1,3 +1,355 @@
-from django.test import TestCase
+import io
+import os
+import json
+import tarfile
+import tempfile
+from threading import Thread
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from lib.RpmSpec import RpmSpec, RpmMacros, EvaluateCondition
+from lib.DependancyGraph import SortInWaves, FindCycles
+from lib.BuildHelper import BuildHelper
+from lib.BuildHelperDebian import BuildHelperDebian
+from lib.SourceHasher import SourceHasher
+from lib.SourceCache import SourceCache
+from lib.Fixtures import CreateUser, CreateProject
+from projects.models import PackageDependancy
+
+
+def parse(spec, macros=None, arch='x86_64', packagename='example'):
+    if macros is None:
+        macros = {'fedora': '40', '_isa': ''}
+    return RpmSpec(macros, arch).Parse(spec.splitlines(True), packagename)
+
+
+# spec files like in the packaging repositories of the projects.
+# the expected results are the results of the parser before RpmSpec, which evaluated the conditions with eval
+LIBRARY_SPEC = """%global libname libexample
+%define soversion 2
+Name: example
+Version: 1.4
+Release: 1%{?dist}
+Summary: an example library
+License: LGPL
+BuildRequires: gcc
+BuildRequires: cmake >= 3.10
+%if 0%{?fedora} >= 30 || 0%{?rhel} >= 8
+BuildRequires: python3-devel
+%else
+BuildRequires: python2-devel
+%endif
+%ifarch x86_64
+BuildRequires: nasm
+%endif
+Requires: %{libname} = %{version}-%{release}
+
+%description
+an example library
+
+%package devel
+Summary: the headers of the example library
+Requires: %{name} = %{version}-%{release}
+Provides: %{libname}-devel
+
+%package -n python3-example
+Summary: the python bindings
+Requires: example-devel
+Provides: python-example
+
+%prep
+%setup -q
+
+%build
+%cmake
+%cmake_build
+
+%files
+%{_libdir}/*.so.*
+
+%changelog
+* Mon Jan 01 2024 Example <example@example.org> - 1.4-1
+- Requires: nothing
+"""
+
+LIBRARY_DELIVERABLES = {
+    'example': {'provides': ['example'], 'requires': ['libexample']},
+    'example-devel': {'provides': ['example-devel', 'libexample-devel'], 'requires': ['example']},
+    'python3-example': {'provides': ['python3-example', 'python-example'], 'requires': ['example-devel']},
+}
+
+SERVICE_SPEC = """Name: example-service
+Version: 2.0
+Release: 3
+Summary: an example service
+License: GPL
+BuildArch: noarch
+BuildRequires: systemd, python3-setuptools
+%if 0%{?rhel}
+BuildRequires: epel-rpm-macros
+%endif
+Requires: python3
+Requires: example >= 1.4
+Provides: example-daemon = %{version}
+
+%description
+an example service
+
+%files
+%{_unitdir}/example.service
+"""
+
+
+class RpmSpecTest(SimpleTestCase):
+
+    def test_library_like_the_old_parser(self):
+        self.assertEqual(parse(LIBRARY_SPEC),
+            (['gcc', 'cmake', 'python3-devel', 'nasm'], LIBRARY_DELIVERABLES))
+        self.assertEqual(parse(LIBRARY_SPEC, {'centos': '7', 'rhel': '7', '_isa': ''}),
+            (['gcc', 'cmake', 'python2-devel', 'nasm'], LIBRARY_DELIVERABLES))
+        self.assertEqual(parse(LIBRARY_SPEC, {'centos': '9', 'rhel': '9', '_isa': ''}, arch='aarch64'),
+            (['gcc', 'cmake', 'python3-devel'], LIBRARY_DELIVERABLES))
+
+    def test_service_like_the_old_parser(self):
+        deliverables = {'example-service': {'provides': ['example-service', 'example-daemon'], 'requires': ['python3', 'example']}}
+        self.assertEqual(parse(SERVICE_SPEC, packagename='example-service'),
+            (['systemd', 'python3-setuptools'], deliverables))
+        self.assertEqual(parse(SERVICE_SPEC, {'centos': '9', 'rhel': '9', '_isa': ''}, packagename='example-service'),
+            (['systemd', 'python3-setuptools', 'epel-rpm-macros'], deliverables))
+
+    def test_nested_inactive_blocks(self):
+        spec = ("Name: example\n%if 0\n%if 1\nBuildRequires: inner\n%else\nBuildRequires: innerelse\n%endif\n" +
+            "BuildRequires: outer\n%endif\nBuildRequires: after\n")
+        self.assertEqual(parse(spec)[0], ['after'])
+
+    def test_elif_after_taken_branch(self):
+        spec = ("Name: example\n%if 0%{?fedora}\nBuildRequires: first\n%elif 1\nBuildRequires: second\n" +
+            "%else\nBuildRequires: third\n%endif\n")
+        self.assertEqual(parse(spec)[0], ['first'])
+        self.assertEqual(parse(spec, {'rhel': '9'})[0], ['second'])
+        spec = "Name: example\n%if 0\nBuildRequires: first\n%elif 0\nBuildRequires: second\n%else\nBuildRequires: third\n%endif\n"
+        self.assertEqual(parse(spec)[0], ['third'])
+
+    def test_conditional_macros(self):
+        macros = RpmMacros({'fedora': '40'})
+        self.assertEqual(macros.Expand("%{!?rhel:no rhel}"), "no rhel")
+        self.assertEqual(macros.Expand("%{!?fedora:no fedora}"), "")
+        self.assertEqual(macros.Expand("%{?fedora:fedora %{fedora}}"), "fedora 40")
+        self.assertEqual(macros.Expand("%{?rhel}"), "")
+        self.assertEqual(macros.Expand("%{undefined}"), "%{undefined}")
+        self.assertEqual(macros.Expand("%{undefined}", condition=True), "0")
+        self.assertEqual(macros.Expand("100%%"), "100%%")
+
+    def test_with(self):
+        spec = ("Name: example\n%bcond_without docs\n%bcond_with tests\n%if %{with docs}\nBuildRequires: doxygen\n%endif\n" +
+            "%if %{with tests}\nBuildRequires: pytest\n%endif\n%if %{without tests}\nBuildRequires: notests\n%endif\n")
+        self.assertEqual(parse(spec)[0], ['doxygen', 'notests'])
+
+    def test_isa(self):
+        spec = "Name: example\nRequires: libexample%{?_isa} = 1.0\n"
+        self.assertEqual(parse(spec)[1]['example']['requires'], ['libexample'])
+
+    def test_mixed_comparisons(self):
+        self.assertTrue(EvaluateCondition('40 == 40'))
+        self.assertTrue(EvaluateCondition('10 > 9'))
+        # a number and a string are compared as strings
+        self.assertTrue(EvaluateCondition('40 == "40"'))
+        self.assertFalse(EvaluateCondition('10 > "9"'))
+        self.assertTrue(EvaluateCondition('"abc" > 3'))
+        self.assertTrue(EvaluateCondition('!(1 && 0) || 0'))
+
+    def test_invalid_condition(self):
+        for condition in ('1 ==', '(1', '1 )', '&& 1', ''):
+            with self.assertRaises(Exception):
+                EvaluateCondition(condition)
+        with self.assertRaises(Exception):
+            parse("Name: example\n%if 0%{?fedora} >=\nBuildRequires: gcc\n%endif\n")
+
+
+class SortInWavesTest(SimpleTestCase):
+
+    def test_waves(self):
+        requires = {'app': {'lib', 'tools'}, 'lib': {'base'}, 'tools': {'base'}, 'base': set(), 'docs': set()}
+        self.assertEqual(SortInWaves(requires), [['base', 'docs'], ['lib', 'tools'], ['app']])
+        self.assertEqual(FindCycles(requires), [])
+
+    def test_self_loop(self):
+        # a package that needs itself, eg. a compiler that is built with the previous version
+        requires = {'compiler': {'compiler'}, 'app': {'compiler'}}
+        self.assertEqual(SortInWaves(requires), [['compiler'], ['app']])
+        self.assertEqual(FindCycles(requires), [])
+
+    def test_dependancies_outside_of_the_set(self):
+        requires = {'app': {'lib', 'glibc'}, 'lib': {'gcc'}}
+        self.assertEqual(SortInWaves(requires), [['lib'], ['app']])
+        self.assertEqual(FindCycles(requires), [])
+
+    def test_cycles(self):
+        requires = {'a': {'b'}, 'b': {'a'}, 'c': {'d'}, 'd': {'e'}, 'e': {'c'},
+            'f': {'a'}, 'g': set(), 'h': {'g'}}
+        # the packages of the cycles, and the packages that need them, are left out
+        self.assertEqual(SortInWaves(requires), [['g'], ['h']])
+        self.assertEqual(FindCycles(requires), [['a', 'b'], ['c', 'd', 'e']])
+
+    def test_long_chain(self):
+        requires = {f"p{i}": {f"p{i-1}"} if i else set() for i in range(5000)}
+        self.assertEqual(len(SortInWaves(requires)), 5000)
+        requires['p0'] = {'p4999'}
+        self.assertEqual(len(FindCycles(requires)[0]), 5000)
+
+
+class FixedBuildHelper(BuildHelper):
+    # the dependancies and provides of each package, instead of parsing spec files
+    def __init__(self, build, packages):
+        BuildHelper.__init__(self, None, build)
+        self.packages = packages
+
+    def GetCachedDependanciesAndProvides(self, cache):
+        return self.packages[self.packagename]
+
+
+class CalculatePackageOrderTest(TestCase):
+
+    def setUp(self):
+        user = CreateUser('test')
+        self.project = CreateProject(user, 'example', ['base', 'lib', 'app', 'docs'], ['fedora/40/x86_64'])
+        self.build = SimpleNamespace(user=user, project='example', package=None, branchname='main')
+
+    def deliverables(self, name, requires=(), provides=()):
+        return {name: {'provides': [name] + list(provides), 'requires': list(requires)}}
+
+    def test_order(self):
+        helper = FixedBuildHelper(self.build, {
+            'base': ([], self.deliverables('base', provides=['base-devel'])),
+            # gcc is not a package of the project
+            'lib': (['base-devel', 'gcc'], self.deliverables('lib')),
+            'app': ([], self.deliverables('app', requires=['lib'])),
+            'docs': (['docs'], self.deliverables('docs')),
+        })
+        self.assertEqual(helper.CalculatePackageOrder('fedora', '40', 'x86_64'), [['base', 'docs'], ['lib'], ['app']])
+        self.assertEqual(helper.cycles, [])
+        edges = set(PackageDependancy.objects.values_list('dependantpackage__name', 'requiredpackage__name'))
+        self.assertEqual(edges, {('lib', 'base'), ('app', 'lib')})
+
+    def test_cycle(self):
+        helper = FixedBuildHelper(self.build, {
+            'base': (['app'], self.deliverables('base')),
+            'lib': (['base'], self.deliverables('lib')),
+            'app': (['lib'], self.deliverables('app')),
+            'docs': ([], self.deliverables('docs')),
+        })
+        self.assertIsNone(helper.CalculatePackageOrder('fedora', '40', 'x86_64'))
+        self.assertEqual(helper.cycles, [['app', 'base', 'lib']])
+        self.assertFalse(PackageDependancy.objects.exists())
+
+
+class DscFilenameTest(TestCase):
+
+    def test_snapshot_is_not_changed(self):
+        # the snapshot is shared by the builds, the dsc file only gets a lowercase name in the container
+        user = CreateUser('test')
+        CreateProject(user, 'example', ['Example-Package'])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(tmpdir + "/example/Example-Package")
+            dscfile = tmpdir + "/example/Example-Package/Example-Package.dsc"
+            open(dscfile, 'w').close()
+            build = SimpleNamespace(user=user, project='example', package='Example-Package', branchname='main', pathSrc=tmpdir)
+            helper = BuildHelperDebian(None, build)
+            self.assertEqual(helper.GetDscFilename(), 'example-package.dsc')
+            self.assertEqual(helper.GetDependancyFiles()[0], dscfile)
+            self.assertEqual(os.listdir(tmpdir + "/example/Example-Package"), ['Example-Package.dsc'])
+
+
+class SourceHasherTest(SimpleTestCase):
+
+    def write(self, path, content, mtime):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, ns=(mtime, mtime))
+
+    def test_snapshots_with_the_same_mtime(self):
+        # the files of an archive get their mtime from the archive, a changed file can have the same size and mtime
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = tmpdir + "/example.manifest"
+            self.write(tmpdir + "/snapshot1/example/package/file.txt", "old", 1000000000)
+            self.write(tmpdir + "/snapshot2/example/package/file.txt", "new", 1000000000)
+            old = SourceHasher(manifest).HashPackages(tmpdir + "/snapshot1/example", ['package'])
+            new = SourceHasher(manifest).HashPackages(tmpdir + "/snapshot2/example", ['package'])
+            self.assertNotEqual(old, new)
+            self.assertEqual(SourceHasher(manifest).HashPackages(tmpdir + "/snapshot2/example", ['package']), new)
+
+    def test_unchanged_files_are_not_read(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = tmpdir + "/example.manifest"
+            self.write(tmpdir + "/snapshot/example/package/file.txt", "content", 1000000000)
+            hashes = SourceHasher(manifest).HashPackages(tmpdir + "/snapshot/example", ['package'])
+            hasher = SourceHasher(manifest)
+            hasher.HashFile = None
+            self.assertEqual(hasher.HashPackages(tmpdir + "/snapshot/example", ['package']), hashes)
+
+    def archive(self, files):
+        # like the archive of a forge: one directory with the files of the branch
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w:gz') as tar:
+            for name, content in files.items():
+                info = tarfile.TarInfo("example-main/" + name)
+                info.size = len(content)
+                info.mtime = 1000000000
+                tar.addfile(info, io.BytesIO(content.encode('utf-8')))
+        stream.seek(0)
+        return stream
+
+    def test_digests_of_the_snapshot(self):
+        # the files of a new snapshot are not read again, their hashes are recorded when the archive is extracted
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(GIT_SRC_PATH=tmpdir):
+            sourcecache = SourceCache()
+            files = {'package/file.txt': "content", 'package/sub/other.txt': "other", 'config.yml': "config"}
+            sourcecache.Extract(self.archive(files), 'example', lambda: 'key1')
+            path = tmpdir + "/cache/entries/key1/"
+            digests = sourcecache.GetDigests(path)
+            self.assertEqual(set(digests), set(files))
+            expected = SourceHasher(tmpdir + "/expected.manifest").HashPackages(path + "example", ['package'])
+
+            hasher = SourceHasher(tmpdir + "/example.manifest", digests)
+            hasher.HashFile = None
+            self.assertEqual(hasher.HashPackages(path + "example", ['package']), expected)
+
+            files['package/file.txt'] = "changed"
+            sourcecache.Extract(self.archive(files), 'example', lambda: 'key2')
+            path = tmpdir + "/cache/entries/key2/"
+            hasher = SourceHasher(tmpdir + "/example.manifest", sourcecache.GetDigests(path))
+            hasher.HashFile = None
+            self.assertNotEqual(hasher.HashPackages(path + "example", ['package']), expected)
+
+    def test_manifest_keeps_the_other_packages(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = tmpdir + "/example.manifest"
+            self.write(tmpdir + "/snapshot/example/package1/file.txt", "one", 1000000000)
+            self.write(tmpdir + "/snapshot/example/package2/file.txt", "two", 1000000000)
+            SourceHasher(manifest).HashPackages(tmpdir + "/snapshot/example", ['package1'])
+            SourceHasher(manifest).HashPackages(tmpdir + "/snapshot/example", ['package2'])
+            with open(manifest, 'r') as f:
+                self.assertEqual(set(json.load(f)), {'package1/file.txt', 'package2/file.txt'})
+
+    def test_concurrent_save(self):
+        # the threads of the scheduler hash the branches of a project at the same time
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = tmpdir + "/example.manifest"
+            self.write(tmpdir + "/snapshot/example/package/file.txt", "content", 1000000000)
+            errors = []
+            def hasher():
+                try:
+                    for i in range(50):
+                        SourceHasher(manifest).HashPackages(tmpdir + "/snapshot/example", ['package'])
+                except Exception as e:
+                    errors.append(e)
+            threads = [Thread(target=hasher) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            # no temporary files are left behind
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['example.manifest', 'snapshot'])
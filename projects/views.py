@@ -67,6 +67,8 @@ def view_package(request, user, project, package):
         project_browse_url = f"{package.project.git_url}/src/branch/{package.project.git_branch}"
     elif package.project.git_type == 'gitlab':
         project_browse_url = f"{package.project.git_url}/-/tree/{package.project.git_branch}"
+    else:
+        project_browse_url = package.project.git_url
 
     template_name = "projects/package.html"
     return render(request, template_name,